@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# Compiler throughput, phase by phase, over the synthetic corpora in
+# corpora.py; and a check that no phase's cost per unit of work grows
+# as the corpora do (which would mean that something in it is
+# super-linear, as annotation once was when every node got its own copy
+# of the environment).
+
+import io
+import os
+import sys
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                    "..", "preprototype"))
+
+from driver import compile_to_rust
+from instrumentation import Instruments
+
+from corpora import FAMILIES, QUICK_SIZES
+
+REPETITIONS = 3  # (we keep the fastest of these, as the least noisy)
+TOLERATED_GROWTH = 2.0
+
+# the unit of work that each phase's throughput is measured in
+PHASE_UNITS = {
+    'lex': 'tokens',
+    'parse': 'nodes',
+    'annotate': 'nodes',
+    'generate': 'generated_bytes',
+    'emit': 'generated_bytes',
+}
+
+
+def measure(source):
+    fastest = {}
+    for _ in range(REPETITIONS):
+        code = io.StringIO()
+        with Instruments() as instruments:
+            compile_to_rust(io.StringIO(source), code, instruments)
+        report = instruments.report()
+        for phase in PHASE_UNITS:
+            fastest[phase] = min(fastest.get(phase, float('inf')),
+                                 report['phases'][phase]['wall_seconds'])
+    amounts = dict(report['counts'],
+                   generated_bytes=len(code.getvalue().encode('utf8')))
+    return {
+        'counts': amounts,
+        'phases': {
+            phase: {'wall_seconds': fastest[phase],
+                    '{}_per_second'.format(unit):
+                        amounts[unit] / fastest[phase]}
+            for phase, unit in PHASE_UNITS.items()
+        },
+    }
+
+def run(quick=False):
+    results = {'throughput': {}, 'scaling': {}, 'super_linear': []}
+    for family, (generator, sizes, description) in FAMILIES.items():
+        if quick:
+            sizes = QUICK_SIZES[family]
+        measurements = []
+        for size in sizes:
+            measurement = measure(generator(size))
+            measurement['size'] = size
+            measurements.append(measurement)
+            print("{} ({} = {}):".format(family, description, size))
+            for phase, record in measurement['phases'].items():
+                unit = PHASE_UNITS[phase]
+                print("    {:<10} {:>10.4f} s {:>14,.0f} {}/s".format(
+                    phase, record['wall_seconds'],
+                    record['{}_per_second'.format(unit)], unit))
+        results['throughput'][family] = measurements
+
+        # seconds per unit of work at the largest size, relative to at
+        # the smallest
+        results['scaling'][family] = {}
+        smallest, largest = measurements[0], measurements[-1]
+        for phase, unit in PHASE_UNITS.items():
+            growth = ((largest['phases'][phase]['wall_seconds'] /
+                       largest['counts'][unit]) /
+                      (smallest['phases'][phase]['wall_seconds'] /
+                       smallest['counts'][unit]))
+            results['scaling'][family][phase] = growth
+            if growth >= TOLERATED_GROWTH:
+                results['super_linear'].append(
+                    "{} in {}".format(phase, family))
+        print("    time per unit grew from {} to {} by {}".format(
+            smallest['size'], largest['size'], ', '.join(
+                "{:.2f}× ({})".format(growth, phase)
+                for phase, growth in results['scaling'][family].items())))
+    return results
+
+def main():
+    results = run(quick='--quick' in sys.argv)
+    if results['super_linear']:
+        print("super-linear: {}".format(', '.join(results['super_linear'])))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# Milliseconds per edit (and for the diagnostics after it) of the
+# language server's incremental frontend, on a 10000-line program, for
+# edits of the sorts that people make while typing.
+
+import os
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                    "..", "preprototype"))
+
+from incremental import Document
+
+from corpora import repeated_forms_source, FORMS
+
+SIZE = 2000  # (repetitions of `FORMS`, which is five lines)
+QUICK_SIZE = 200
+
+# (what to replace—from and to (line, column), with lines counted from
+# the middle of the program—and with what)
+EDITS = [
+    ("type a character", (1, 13), (1, 13), "1"),
+    ("delete a character", (1, 13), (1, 14), ""),
+    ("insert a line", (3, 0), (3, 0), "(println 5)\n"),
+    ("delete a line", (3, 0), (4, 0), ""),
+    ("rename a definition", (0, 3), (0, 8), "totals"),
+    ("rename it back", (0, 3), (0, 9), "total"),
+]
+
+
+def measure(size):
+    source = repeated_forms_source(size)
+    start = time.perf_counter()
+    document = Document(source)
+    results = {'size': size, 'lines': len(document.lines),
+               'initial_seconds': time.perf_counter() - start, 'edits': {}}
+    middle = (len(document.lines) // 2 // FORMS.count('\n') *
+              FORMS.count('\n'))
+    for label, (start_line, start_column), (end_line, end_column), text in \
+            EDITS:
+        start = (middle + start_line, start_column)
+        end = (middle + end_line, end_column)
+        start_time = time.perf_counter()
+        document.edit(start, end, text)
+        edited = time.perf_counter()
+        document.diagnostics()
+        done = time.perf_counter()
+        results['edits'][label] = {
+            'edit_milliseconds': (edited - start_time) * 1000,
+            'diagnostics_milliseconds': (done - edited) * 1000,
+        }
+    return results
+
+def run(quick=False):
+    result = measure(QUICK_SIZE if quick else SIZE)
+    print("{} lines: {:.2f} s to open".format(result['lines'],
+                                             result['initial_seconds']))
+    for label, timing in result['edits'].items():
+        print("{}: {:.2f} ms (+ {:.2f} ms of diagnostics)".format(
+            label, timing['edit_milliseconds'],
+            timing['diagnostics_milliseconds']))
+    return result
+
+def main():
+    run(quick='--quick' in sys.argv)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# Bytes of memory per token and per AST node, for a program that's
+# mostly one big block list literal (which is where per-node overhead
+# hurts the most, since there's nothing in such a program but nodes).
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                    "..", "preprototype"))
+
+from lexer import lex
+from parser import parse
+from annotator import annotate
+
+from instrumentation import count_nodes
+
+SIZE = 50000
+QUICK_SIZE = 5000
+
+
+def literal_list_source(size):
+    return ":= numbers […]—\n" + ''.join("   {}\n".format(i)
+                                         for i in range(size))
+
+def measure(size):
+    source = literal_list_source(size)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tokens = list(lex(source))
+    token_bytes = tracemalloc.get_traced_memory()[0] - before
+    del tokens
+
+    before = tracemalloc.get_traced_memory()[0]
+    expressions = list(parse(lex(source)))
+    parsed_bytes = tracemalloc.get_traced_memory()[0] - before
+    expressions = list(annotate(expressions))
+    annotated_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    token_count = sum(1 for _ in lex(source))
+    node_count = sum(count_nodes(expression)['nodes']
+                     for expression in expressions)
+    return {
+        'size': size,
+        'tokens': token_count,
+        'bytes_per_token': token_bytes / token_count,
+        'nodes': node_count,
+        # (between parsing and annotation, and after annotation)
+        'bytes_per_parsed_node': parsed_bytes / node_count,
+        'bytes_per_annotated_node': annotated_bytes / node_count,
+    }
+
+def run(quick=False):
+    result = measure(QUICK_SIZE if quick else SIZE)
+    print("{} tokens: {:.1f} bytes/token".format(result['tokens'],
+                                                 result['bytes_per_token']))
+    print("{} nodes: {:.1f} bytes/node parsed, {:.1f} annotated".format(
+        result['nodes'], result['bytes_per_parsed_node'],
+        result['bytes_per_annotated_node']))
+    return result
+
+def main():
+    run(quick='--quick' in sys.argv)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# How long the programs in eg/ take to run once compiled, at input sizes
+# scaled up from the toy ones they ship with. (fallsim and
+# meet_and_greet aren't here: they wait on standard input—and fallsim
+# on the wall clock, too—so timing them would only time the waiting.)
+# Also, how long a program that does nothing but print takes to print
+# lots of lines, buffered and --unbuffered.
+
+import io
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+REPOSITORY_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "..")
+
+sys.path.insert(0, os.path.join(REPOSITORY_ROOT, "preprototype"))
+
+from driver import compile_program
+
+REPETITIONS = 3
+
+
+def scaled_bubblesort(source, size):
+    # (a list that starts out backwards is the worst case; and printing
+    # the list after every swap would make this a benchmark of printing)
+    elements = ''.join("   {}\n".format(size - i) for i in range(size))
+    source = re.sub(r"(:= my_list \[…\]—\n)(   \d+\n)+",
+                    lambda match: match.group(1) + elements, source)
+    source = source.replace("               (println_container this_list)\n",
+                            '')
+    return (source.replace("(range 0 10)", "(range 0 {})".format(size))
+                  .replace("(range 0 9)", "(range 0 {})".format(size - 1)))
+
+def scaled_collatz(source, size):
+    return source.replace("(range 1 21)", "(range 1 {})".format(size + 1))
+
+def scaled_fizzbuzz(source, size):
+    return source.replace("(fizzbuzz 30)", "(fizzbuzz {})".format(size))
+
+def printing(source, size):
+    # (not an example, so there's no `source` to scale)
+    return "for |i (range 0 {})|—\n   (println i)\n".format(size)
+
+# example → (scaler, sizes, quick sizes, compile options)
+PROGRAMS = {
+    'bubblesort': (scaled_bubblesort, (250, 500, 1000), (250,), {}),
+    'collatz': (scaled_collatz, (10000, 30000, 100000), (10000,), {}),
+    'fizzbuzz': (scaled_fizzbuzz, (100000, 300000, 1000000), (100000,), {}),
+    'printing': (printing, (10**6, 10**7), (10**6,), {}),
+    'printing_unbuffered': (printing, (10**6, 10**7), (10**6,),
+                            {'unbuffered': True}),
+}
+
+
+def time_run(executable_path):
+    fastest = float('inf')
+    with open(os.devnull, 'w') as nowhere:
+        for _ in range(REPETITIONS):
+            start = time.perf_counter()
+            subprocess.run([executable_path], stdout=nowhere, check=True)
+            fastest = min(fastest, time.perf_counter() - start)
+    return fastest
+
+def run(quick=False):
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        for example, (scaler, sizes, quick_sizes,
+                      options) in PROGRAMS.items():
+            example_path = os.path.join(REPOSITORY_ROOT, "eg",
+                                        example + ".gltrl")
+            source = None
+            if os.path.exists(example_path):
+                with open(example_path) as source_file:
+                    source = source_file.read()
+            results[example] = []
+            for size in (quick_sizes if quick else sizes):
+                source_path = os.path.join(
+                    scratch, "{}_{}.gltrl".format(example, size))
+                with open(source_path, 'w') as scaled_source_file:
+                    scaled_source_file.write(scaler(source, size))
+                diagnostics = io.StringIO()
+                if compile_program(source_path, use_cache=False,
+                                   err=diagnostics,
+                                   capture_rustc_output=True,
+                                   **options) != 0:
+                    raise RuntimeError("couldn't compile {} at size {}:\n"
+                                       "{}".format(example, size,
+                                                   diagnostics.getvalue()))
+                elapsed = time_run(source_path[:-6])
+                results[example].append({'size': size,
+                                         'wall_seconds': elapsed})
+                print("{} (size {}): {:.4f} s".format(example, size,
+                                                      elapsed))
+    return results
+
+def main():
+    run(quick='--quick' in sys.argv)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+# Synthetic Glitteral programs for the compiler benchmarks, in families
+# that grow along one dimension at a time.
+
+# a top-level form or four, to be repeated until we have a big program
+FORMS = """:= total (+ 1 2)
+when (greater? total 2)—
+   (println total)
+for |i (range 0 3)|—
+   (print i)
+"""
+
+def repeated_forms_source(size):
+    return FORMS * size
+
+def definitions_source(size):
+    # Lots of top-level definitions, each of which extends the global
+    # environment: with environments that get copied at every node,
+    # annotating these takes quadratic time.
+    return ''.join(":= definition_{0}_{1} (+ {1} 1)\n".format(size, i)
+                   for i in range(size))
+
+def nested_source(depth, total_nodes=20000):
+    # Applications nested `depth` deep, repeated so that the total
+    # number of nodes stays about the same at every depth (so that
+    # anything that grows along with depth shows up as a growing
+    # per-node cost).
+    form = "(+ 1 " * depth + "1" + ")" * depth
+    return "(println {})\n".format(form) * max(1, total_nodes // (3 * depth))
+
+
+# family name → (source generator, sizes, what the sizes measure)
+FAMILIES = {
+    'repeated_forms': (repeated_forms_source, (500, 1000, 2000, 4000),
+                       "repetitions of a handful of top-level forms"),
+    'definitions': (definitions_source, (10000, 25000, 50000, 100000),
+                    "top-level definitions"),
+    'nesting': (nested_source, (25, 50, 100, 200),
+                "depth of nested applications"),
+}
+
+# (a spread of sizes just as wide, with fewer and smaller steps)
+QUICK_SIZES = {
+    'repeated_forms': (250, 2000),
+    'definitions': (1250, 10000),
+    'nesting': (25, 200),
+}
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# Run all of the benchmarks, writing the results as JSON (by default, to
+# results/<commit>.json) so that they can be compared across commits,
+# and exiting unsuccessfully if any compiler phase scaled super-linearly.
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+import bench_compiler
+import bench_incremental
+import bench_memory
+import bench_programs
+from cache import rustc_version  # (bench_compiler put it on the path)
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_DIRECTORY,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return "unknown"
+
+def compare(baseline, results):
+    """Print how much slower (>1) or faster (<1) each measurement is than
+    it was in `baseline`."""
+    for family, measurements in results['compiler']['throughput'].items():
+        baseline_measurements = {
+            measurement['size']: measurement for measurement in
+            baseline['compiler']['throughput'].get(family, [])}
+        for measurement in measurements:
+            was = baseline_measurements.get(measurement['size'])
+            if was is None:
+                continue
+            print("{} (size {}): {}".format(
+                family, measurement['size'], ', '.join(
+                    "{} {:.2f}×".format(
+                        phase, record['wall_seconds'] /
+                        was['phases'][phase]['wall_seconds'])
+                    for phase, record in measurement['phases'].items())))
+    if 'memory' in baseline:
+        print("memory: {}".format(', '.join(
+            "{} {:.2f}×".format(measurement, results['memory'][measurement] /
+                                baseline['memory'][measurement])
+            for measurement in results['memory']
+            if measurement.startswith('bytes_per'))))
+    for example, runs in results['programs'].items():
+        baseline_runs = {run['size']: run for run in
+                         baseline['programs'].get(example, [])}
+        for run in runs:
+            was = baseline_runs.get(run['size'])
+            if was is not None:
+                print("{} (size {}): {:.2f}×".format(
+                    example, run['size'],
+                    run['wall_seconds'] / was['wall_seconds']))
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--quick', action='store_true',
+                            help="fewer, smaller sizes")
+    arg_parser.add_argument('--output', help="where to write the results "
+                            "(default: results/<commit>.json)")
+    arg_parser.add_argument('--compare', metavar='BASELINE',
+                            help="results of an earlier run to compare to")
+    args = arg_parser.parse_args()
+
+    commit = current_commit()
+    results = {
+        'commit': commit,
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'quick': args.quick,
+        'python': platform.python_version(),
+        'rustc': rustc_version(),
+        'compiler': bench_compiler.run(quick=args.quick),
+        'memory': bench_memory.run(quick=args.quick),
+        'incremental': bench_incremental.run(quick=args.quick),
+        'programs': bench_programs.run(quick=args.quick),
+    }
+
+    output_path = args.output or os.path.join(
+        BENCHMARKS_DIRECTORY, "results", "{}.json".format(commit))
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print("results written to {}".format(output_path))
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            compare(json.load(baseline_file), results)
+
+    super_linear = results['compiler']['super_linear']
+    if super_linear:
+        print("super-linear: {}".format(', '.join(super_linear)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
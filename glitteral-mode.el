@@ -36,6 +36,28 @@
   (interactive)
   (insert "…"))  ; \u2026
 
+(defvar glitteral-compiler "glitteralc"
+  "Command to compile Glitteral source (it uses a running compile
+server if there is one)")
+
+(defun glitteral-compile ()
+  (interactive)
+  (compile (concat glitteral-compiler " "
+                   (shell-quote-argument (buffer-file-name)))))
+
+(defun glitteral-start-compile-server ()
+  "Keep a Glitteral compiler warm in the background, so that
+compiling doesn't have to start one from scratch every time."
+  (interactive)
+  (start-process "glitteral-compile-server" "*glitteral-compile-server*"
+                 glitteral-compiler "--server"))
+
+;; for diagnostics and go-to-definition as you type, `M-x eglot' (which
+;; runs `glitteralc --language-server')
+(with-eval-after-load 'eglot
+  (add-to-list 'eglot-server-programs
+               `(glitteral-mode . (,glitteral-compiler "--language-server"))))
+
 
 (defvar glitteral-mode-map
   (let ((map (make-keymap)))
@@ -46,6 +68,7 @@
     (define-key map (kbd "M-*") 'glitteral-insert-multiplication)
     (define-key map [M-kp-divide] 'glitteral-insert-division)
     (define-key map (kbd "M-.") 'glitteral-insert-ellipsis)
+    (define-key map (kbd "C-c C-c") 'glitteral-compile)
     map)
   "Keymap for Glitteral major mode")
 
@@ -90,6 +113,7 @@
     ("\\^float" 0 font-lock-type-face)
     ("\\^str" 0 font-lock-type-face)
     ("\\^bool" 0 font-lock-type-face)
+    ("\\^file" 0 font-lock-type-face)
     ("\\^\\[int\\]" 0 font-lock-type-face)
     ("\\^\\[str\\]" 0 font-lock-type-face)
     ("\\^\\[bool\\]" 0 font-lock-type-face)))
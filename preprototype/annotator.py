@@ -1,8 +1,12 @@
+import itertools
 import logging
 import os
 
+from collections import namedtuple
+
+from environments import PersistentEnvironment
 from parser import *  # between you and me
-from utils import get_logger
+from utils import get_logger, oxford_series
 
 logger = get_logger(__name__)
 
@@ -11,7 +15,7 @@ class ContextHandlingException(Exception):
     ...
 
 
-global_environment = {
+BUILTINS = {
     '+': BuiltinAtom("add"), '−': BuiltinAtom("subtract"),
     '⋅': BuiltinAtom("multiply"), '÷': BuiltinAtom("divide"),
     '=': BuiltinAtom("integers_equal"), '≠': BuiltinAtom("integers_not_equal"),
@@ -21,9 +25,15 @@ global_environment = {
     'not_greater?': BuiltinAtom("not_greater"),
     'not_less?': BuiltinAtom("not_less"),
     'range': BuiltinAtom("range"),
+    'reverse_range': BuiltinAtom("reverse_range"),
+    'step_range': BuiltinAtom("step_range"),
     'sleep': BuiltinAtom("sleep"),
     'current_time': BuiltinAtom("current_time"),
+    'instant': BuiltinAtom("instant"), 'elapsed': BuiltinAtom("elapsed"),
+    'parse_int': BuiltinAtom("parse_int"),
     'parse_float': BuiltinAtom("parse_float"),
+    'parse_int_or': BuiltinAtom("parse_int_or"),
+    'parse_float_or': BuiltinAtom("parse_float_or"),
 
     # TODO: variadics?
     # TODO: unify prints (glitteralc should be smart enough to
@@ -33,6 +43,15 @@ global_environment = {
     'println': BuiltinAtom("println"),
     'println_container': BuiltinAtom("println_container"),
     'input': BuiltinAtom("input"),
+    'read_all': BuiltinAtom("read_all"), 'lines': BuiltinAtom("lines"),
+    'read_file': BuiltinAtom("read_file"),
+    'write_file': BuiltinAtom("write_file"),
+    'map_file': BuiltinAtom("map_file"),
+    'file_lines': BuiltinAtom("file_lines"),
+    'mapped_lines': BuiltinAtom("mapped_lines"),
+    'mapped_bytes': BuiltinAtom("mapped_bytes"),
+    'mapped_size': BuiltinAtom("mapped_size"),
+    'flush': BuiltinAtom("flush"),
     '&': BuiltinAtom("and"),
     '∨': BuiltinAtom("or"),
 
@@ -45,57 +64,233 @@ global_environment = {
     'comprehend': BuiltinAtom("comprehend", special=True)
 }
 
+
+class Compilation:
+    """Everything that changes over the course of compiling one program.
+
+    Nothing mutable lives at module level in the compiler: whoever
+    wants to compile a program makes a `Compilation` and hands it to
+    the annotator and backend, so that several programs can be compiled
+    at once (in different threads, or one after another in a
+    long-lived process) without stepping on each other.
+
+    (It's also where the backend finds out how hard to try to make the
+    program fast—see optimizer.py for what each `optimization_level`
+    does—and whether the program should flush its output after every
+    print, being `unbuffered`.)
+    """
+
+    def __init__(self, optimization_level=0, unbuffered=False):
+        self.optimization_level = optimization_level
+        self.unbuffered = unbuffered
+        self.global_environment = PersistentEnvironment(BUILTINS)
+        self.autoidentifier_sequence = (
+            "_gltrl_autoidentifier_{}".format(i) for i in itertools.count(1))
+
 class IterInto:
     def __init__(self, iterable):
         self.iterable = iterable
 
 
-def propogate_environments(expression, statementlike=True):
-    if isinstance(expression, AbstractDent):
-        raise ContextHandlingException(
-            "Unexpectedly recieved {} for annotation".format(expression))
-
-    logger.debug("propogating environments for %sstatementlike expression %s",
-                 'non-' if not statementlike else '', expression)
+def comprehension_parts(expression):
+    """The container, bindings, and item of `expression`, if it's a
+    comprehension—`(comprehend [] [i (range 0 n)] (⋅ i i))`—or else
+    `None`."""
+    if not (isinstance(expression, Application) and
+            isinstance(expression.function, IdentifierAtom) and
+            expression.function.value == "comprehend" and
+            len(expression.arguments) == 3):
+        return None
+    container, bindings, item = expression.arguments
+    if not (isinstance(bindings, List) and len(bindings.elements) == 2 and
+            isinstance(bindings.elements[0], IdentifierAtom)):
+        return None
+    return container, bindings, item
 
-    if expression.statementlike is None:
-        expression.statementlike = statementlike
 
+def snapshot_global_environment(expression, compilation):
     # Snapshot our running record of the global environment for this node,
-    expression.global_environment = global_environment.copy()
+    expression.global_environment = compilation.global_environment
     # then modify it if directed.
     if isinstance(expression, Definition):
-        global_environment[expression.identifier.value] = expression.identified
+        compilation.global_environment = compilation.global_environment.bind(
+            expression.identifier.value, expression.identified)
     if isinstance(expression, NamedFunctionDefinition):
-        global_environment[expression.name.value] = expression
+        compilation.global_environment = compilation.global_environment.bind(
+            expression.name.value, expression)
+
+# (The walks below keep the nodes still to be visited on a list of their
+# own, rather than recursing, so that they can go as deep as the parser
+# can: see `parser.parse_expression`. They visit nodes in the same order
+# as recursing would have—a node before its children, and each child
+# and all of its descendants before the next child—by pushing each
+# node's children in reverse.)
+
+def restore_global_environments(expression, compilation):
+    """Redo just the global-environment part of annotation, for an
+    expression that was annotated once before and then stored without
+    its global environments (see astcache.py)."""
+    # (in the same order as `propogate_environments` visits nodes, so
+    # that every node gets the same version it did the first time)
+    unvisited = [expression]
+    while unvisited:
+        expression = unvisited.pop()
+        snapshot_global_environment(expression, compilation)
+        unvisited.extend(reversed(expression.children))
+
+STATEMENT_BODIED = (DeterminateIteration, IndeterminateIteration,
+                    SingletrackedConditional)
+
+def propogate_environments(expression, compilation, statementlike=True):
+    unvisited = [(expression, statementlike)]
+    while unvisited:
+        expression, statementlike = unvisited.pop()
+        if isinstance(expression, AbstractDent):
+            raise ContextHandlingException(
+                "Unexpectedly recieved {} for annotation".format(expression))
+
+        logger.debug("propogating environments for %sstatementlike "
+                     "expression %s", 'non-' if not statementlike else '',
+                     expression)
+
+        if expression.statementlike is None:
+            expression.statementlike = statementlike
+
+        snapshot_global_environment(expression, compilation)
 
-    for i, child in enumerate(expression.children):
-        # set locals for :=λ, let, for, &c.
-        child.local_environment = expression.local_environment.copy()
+        # set locals for :=λ, let, for, &c. (children that don't get any
+        # new bindings just share their parent's local environment)
+        children_local_environment = expression.local_environment
         if isinstance(expression, NamedFunctionDefinition):
-            for argument in expression.arguments:
-                child.local_environment[argument.value.value] = argument
+            children_local_environment = children_local_environment.extended(
+                {argument.value.value: argument
+                 for argument in expression.arguments})
         elif isinstance(expression, DeterminateIteration):
-            child.local_environment[
-                expression.index_identifier.value] = (
-                    IterInto(expression.iterable))
-
-        # "Some" Glitteral backends will require associative nodes to
-        # know what identifier they've been assigned to (if any).
-        if (isinstance(expression, Definition) and
-            isinstance(child, Associative)):
-            child.identifier = expression.identifier
-
-        child_is_statementlike = (
-            (i+1 != len(expression.children)) and
-            (not (isinstance(expression, Conditional) or
-                  isinstance(expression, Application) or
-                  isinstance(expression, Sequential) or
-                  isinstance(expression, Associative))))
-
-        propogate_environments(child, statementlike=child_is_statementlike)
-
-def annotate(expressionstream):
+            children_local_environment = children_local_environment.extended(
+                {expression.index_identifier.value:
+                 IterInto(expression.iterable)})
+        # (a comprehension's index is bound—like a `for` loop's—in its
+        # bindings and its item, but not in the container it starts from)
+        comprehension = comprehension_parts(expression)
+        if comprehension is not None:
+            _container, bindings, item = comprehension
+            index_identifier, iterable = bindings.elements
+            comprehension_environment = children_local_environment.extended(
+                {index_identifier.value: IterInto(iterable)})
+
+        children = expression.children
+        for i, child in reversed(list(enumerate(children))):
+            if comprehension is not None and (child is bindings or
+                                              child is item):
+                child.local_environment = comprehension_environment
+            else:
+                child.local_environment = children_local_environment
+
+            # "Some" Glitteral backends will require associative nodes to
+            # know what identifier they've been assigned to (if any).
+            if (isinstance(expression, Definition) and
+                isinstance(child, Associative)):
+                child.identifier = expression.identifier
+
+            # (loops and one-armed conditionals evaluate to nothing, so
+            # even their last expressions are statements)
+            child_is_statementlike = (
+                ((i+1 != len(children) or
+                  isinstance(expression, STATEMENT_BODIED)) and
+                 (not (isinstance(expression, Conditional) or
+                       isinstance(expression, Application) or
+                       isinstance(expression, Sequential) or
+                       isinstance(expression, Associative)))) or
+                (isinstance(expression, Conditional) and
+                 expression.alternative is None and
+                 child is expression.consequent))
+
+            unvisited.append((child, child_is_statementlike))
+
+def annotate(expressionstream, compilation=None):
+    if compilation is None:
+        compilation = Compilation()
     for expression in expressionstream:
-        propogate_environments(expression, statementlike=True)
+        propogate_environments(expression, compilation, statementlike=True)
         yield expression
+
+
+class UndefinedIdentifierException(ContextHandlingException):
+    def __init__(self, names):
+        super().__init__("{} {} not defined".format(
+            oxford_series(names), "is" if len(names) == 1 else "are"))
+        self.names = names
+
+
+# What an identifier refers to, as worked out once and for all (see
+# `resolve`) so that the backend doesn't have to go asking environments:
+# `kind` is one of "builtin", "global", "argument", or "loop index";
+# `node` is what the name is bound to (the `BuiltinAtom`, the defined
+# value or `NamedFunctionDefinition`, the `Argument`, or the `IterInto`);
+# and `mutable` is whether that's a mutable container literal. (Whether
+# the backend has to lend it out by reference is a question of its type:
+# see `backend.lent_mutably`.)
+Binding = namedtuple('Binding', ('kind', 'node', 'mutable'))
+
+def binding_for(name, expression):
+    """The `Binding` of `name` in the environments of `expression`, or
+    `None` if it isn't bound there."""
+    try:
+        bound = expression.local_environment[name]
+    except KeyError:
+        try:
+            bound = expression.global_environment[name]
+        except KeyError:
+            return None
+        kind = "builtin" if isinstance(bound, BuiltinAtom) else "global"
+    else:
+        kind = "loop index" if isinstance(bound, IterInto) else "argument"
+    return Binding(kind, bound, bool(getattr(bound, 'mutable', False)))
+
+def resolve(expressionstream):
+    """Pass annotated top-level forms through, having given each
+    identifier in them its `Binding` (and each definition the binding it
+    supersedes, if any).
+
+    If any identifiers are undefined, the forms stop being passed through
+    at the first one that has any, but they all still get resolved, so
+    that the `UndefinedIdentifierException` at the end can name all of
+    the undefined identifiers in the program at once.
+    """
+    undefined = []
+    for expression in expressionstream:
+        # (the definitions whose values are being resolved, by the id of
+        # the value, with the bindings they supersede: in `:= total (+
+        # total x)`, the `total` being added to is the one from before,
+        # the definition not having happened yet)
+        defining = {}
+        unresolved = [expression]
+        while unresolved:
+            node = unresolved.pop()
+            if isinstance(node, tuple):
+                # (a definition's value that's all resolved now)
+                del defining[node[0]]
+                continue
+            if isinstance(node, IdentifierAtom):
+                node.binding = binding_for(node.value, node)
+                if (node.binding is not None and
+                        node.binding.kind == "global" and
+                        id(node.binding.node) in defining):
+                    node.binding = defining[id(node.binding.node)]
+                if node.binding is None and node.value not in undefined:
+                    undefined.append(node.value)
+            elif isinstance(node, Definition):
+                # (in the environment from before the definition, unlike
+                # that of its identifier)
+                node.superseded = binding_for(node.identifier.value, node)
+                defining[id(node.identified)] = node.superseded
+                # (the identifier itself being left until after, as it
+                # does name the definition)
+                unresolved.extend((node.identifier, (id(node.identified),),
+                                   node.identified))
+                continue
+            unresolved.extend(node.children)
+        if not undefined:
+            yield expression
+    if undefined:
+        raise UndefinedIdentifierException(undefined)
@@ -0,0 +1,338 @@
+import copyreg
+import functools
+import hashlib
+import io
+import os
+import pickle
+import sys
+import tempfile
+
+import parser
+
+from annotator import Compilation, IterInto, restore_global_environments
+from environments import (Environment, PersistentEnvironment,
+                          _empty_environment)
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+
+# An AST cache file (__X.gltrlc, alongside X) holds the annotated AST of
+# X, so that the next compilation of X can skip straight to code
+# generation if X hasn't changed. It's a header—
+#
+#     magic, format version, frontend version, source digest,
+#     payload digest
+#
+# —followed by the payload: for each top-level form, in order, the
+# number of pickles it takes, and then those pickles (see
+# `pickle_form`), with a pickled `None` in place of a number to mark the
+# end.
+#
+# Every field of the header can be worked out by anyone who has the
+# source, so a cache file proves nothing about who wrote it—and one
+# could come with a checkout or a download, planted alongside the
+# source. Since unpickling runs whatever code the pickle says to, cache
+# files are only ever unpickled by an `AstUnpickler`, which refuses to
+# make anything but AST nodes and the few other things that go into
+# them.
+#
+# The payload digest is what makes a half-written or otherwise mangled
+# cache file get ignored rather than trusted; the frontend version is
+# what makes a cache file written by a compiler with a different
+# grammar or annotator get ignored.
+
+MAGIC = b"GLTRLC"
+FORMAT_VERSION = 2
+PROTOCOL = pickle.HIGHEST_PROTOCOL
+DIGEST_SIZE = hashlib.sha256().digest_size
+HEADER_SIZE = len(MAGIC) + 1 + 3 * DIGEST_SIZE
+
+# everything whose changing could change what the frontend makes of a
+# given source file
+FRONTEND_MODULES = ["lexer.py", "parser.py", "annotator.py",
+                    "environments.py", "utils.py", "astcache.py"]
+
+
+class AstCacheException(Exception):
+    ...
+
+
+@functools.lru_cache(maxsize=None)
+def frontend_version():
+    hasher = hashlib.sha256()
+    hasher.update("{} {} {}.{}\n".format(
+        FORMAT_VERSION, PROTOCOL, *sys.version_info[:2]).encode('ascii'))
+    compiler_directory = os.path.dirname(os.path.abspath(__file__))
+    for module in FRONTEND_MODULES:
+        with open(os.path.join(compiler_directory, module),
+                  'rb') as module_file:
+            hasher.update(hashlib.sha256(module_file.read()).digest())
+    return hasher.digest()
+
+def cache_path(source_path):
+    source_directory, source_filename = os.path.split(source_path)
+    return os.path.join(source_directory, "__{}c".format(source_filename))
+
+def _hashing(lines, hasher):
+    for line in lines:
+        hasher.update(line.encode('utf8'))
+        yield line
+
+def source_digest(source_path):
+    """A digest of the source file at `source_path` (as read in text
+    mode, as the lexer reads it)."""
+    hasher = hashlib.sha256()
+    with open(source_path) as source_file:
+        for _ in _hashing(source_file, hasher):
+            pass
+    return hasher.digest()
+
+
+# Global environments aren't stored at all: each node's version of the
+# global environment is rebuilt on loading by replaying the bindings
+# that the program's definitions make (see
+# `restore_global_environments`), which is much smaller than the HAMT
+# versions themselves would be, and keeps the builtins out of the cache.
+# (This is done with a reducer for just that type rather than with
+# `persistent_id`, which would be consulted—slowly, in Python—about
+# every object in the AST.)
+
+def _unrestored_global_environment():
+    return None  # (until `restore_global_environments` gets to it)
+
+def _reduce_persistent_environment(_environment):
+    return _unrestored_global_environment, ()
+
+_DISPATCH_TABLE = dict(copyreg.dispatch_table)
+_DISPATCH_TABLE[PersistentEnvironment] = _reduce_persistent_environment
+
+
+# everything that a cache file we wrote could need unpickling (by module
+# and name, as the pickle refers to it)
+UNPICKLABLE = {
+    (unpicklable.__module__, unpicklable.__qualname__)
+    for unpicklable in [
+        *(node_class for node_class in vars(parser).values()
+          if isinstance(node_class, type) and
+          issubclass(node_class, (parser.Expression, parser.Association))),
+        IterInto, Environment, _empty_environment,
+        _unrestored_global_environment,
+    ]
+}
+
+class AstUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if (module, name) not in UNPICKLABLE:
+            raise AstCacheException(
+                "refusing to unpickle {}.{} from an AST cache file".format(
+                    module, name))
+        return super().find_class(module, name)
+
+
+# The pickler recurses (in C, but within `sys.getrecursionlimit()` all
+# the same) once per level of nesting of what it's pickling, so a form
+# nested deeper than the parser and annotator would have been able to
+# handle before they stopped recursing would fail to pickle in one go.
+# Instead, every `PICKLING_STRIDE`th level of a form's nodes gets
+# pickled first, deepest first, on the same pickler, whose memo then
+# has each of them pickled as just a reference when it turns up again
+# in the next pickle up—so no one pickle ever goes more than
+# `PICKLING_STRIDE` levels deep. (Most forms don't go that deep at
+# all, and take just the one pickle.)
+
+PICKLING_STRIDE = 64
+
+def _strided_nodes(form):
+    """The nodes of `form` at depths that are multiples of
+    `PICKLING_STRIDE`, each after all of its descendants, and ending with
+    `form` itself."""
+    strided = []
+    unvisited = [(form, 0, False)]
+    while unvisited:
+        node, depth, descended = unvisited.pop()
+        if descended:
+            strided.append(node)
+            continue
+        if depth % PICKLING_STRIDE == 0:
+            unvisited.append((node, depth, True))
+        unvisited.extend((child, depth + 1, False)
+                         for child in node.children)
+    return strided
+
+def pickle_form(form):
+    pickled = io.BytesIO()
+    # Each form gets a pickler of its own, so that the pickler's memo
+    # doesn't keep every form we've seen alive.
+    pickler = pickle.Pickler(pickled, PROTOCOL)
+    pickler.dispatch_table = _DISPATCH_TABLE
+    strided = _strided_nodes(form)
+    pickler.dump(len(strided))
+    for node in strided:
+        pickler.dump(node)
+    return pickled.getbuffer()
+
+def unpickle_form(binary_file):
+    """The next form pickled by `pickle_form` in `binary_file`, or `None`
+    at the end of the payload."""
+    unpickler = AstUnpickler(binary_file)
+    count = unpickler.load()
+    if count is None:
+        return None
+    for _ in range(count):
+        form = unpickler.load()
+    return form
+
+def dump_forms(forms, binary_file, source_hasher):
+    """Pass the annotated top-level `forms` through, writing them to the
+    seekable `binary_file` as they go by. By the time the forms run out,
+    `source_hasher` should have seen the whole of the source they came
+    from."""
+    # (with placeholders for the digests, until we know them)
+    binary_file.write(MAGIC + bytes([FORMAT_VERSION]) + frontend_version() +
+                      bytes(2 * DIGEST_SIZE))
+    payload_hasher = hashlib.sha256()
+    for form in forms:
+        pickled = pickle_form(form)
+        payload_hasher.update(pickled)
+        binary_file.write(pickled)
+        yield form
+    end = pickle.dumps(None, PROTOCOL)
+    payload_hasher.update(end)
+    binary_file.write(end)
+    binary_file.seek(HEADER_SIZE - 2 * DIGEST_SIZE)
+    binary_file.write(source_hasher.digest() + payload_hasher.digest())
+    binary_file.seek(0, os.SEEK_END)
+
+def dump_ast(source_path, frontend, binary_file):
+    """Pass through the annotated top-level forms that `frontend` makes of
+    (the lines of) the program at `source_path`, writing them to the
+    seekable `binary_file` as they go by."""
+    # (The source digest is of what the frontend actually read, not of
+    # what we might read from the file beforehand or afterwards, lest
+    # the source change in between and its new digest get attached to
+    # its old AST.)
+    source_hasher = hashlib.sha256()
+    with open(source_path) as source_file:
+        yield from dump_forms(frontend(_hashing(source_file, source_hasher)),
+                              binary_file, source_hasher)
+
+def _read_header(binary_file):
+    """Check that `binary_file` is an intact AST cache file written by
+    this version of the frontend, returning the digest of the source it
+    was made from (and leaving the file positioned at the payload)."""
+    header = binary_file.read(HEADER_SIZE)
+    if len(header) != HEADER_SIZE or not header.startswith(MAGIC):
+        raise AstCacheException("not an AST cache file")
+    offset = len(MAGIC)
+    if header[offset] != FORMAT_VERSION:
+        raise AstCacheException(
+            "AST cache format {} (expected {})".format(header[offset],
+                                                       FORMAT_VERSION))
+    offset += 1
+    written_by, source_digest, payload_digest = (
+        header[offset + i*DIGEST_SIZE:offset + (i+1)*DIGEST_SIZE]
+        for i in range(3))
+    if written_by != frontend_version():
+        raise AstCacheException("written by a different compiler frontend")
+    payload_hasher = hashlib.sha256()
+    for chunk in iter(functools.partial(binary_file.read, 1 << 16), b''):
+        payload_hasher.update(chunk)
+    if payload_hasher.digest() != payload_digest:
+        raise AstCacheException("truncated or corrupted")
+    binary_file.seek(HEADER_SIZE)
+    return source_digest
+
+def open_cache(source_path, source_digest):
+    """The AST cache file for the program at `source_path`, open and
+    positioned at the payload, if there is one that's good for source
+    with the given digest; otherwise, `None`."""
+    try:
+        binary_file = open(cache_path(source_path), 'rb')
+    except OSError:
+        return None
+    try:
+        if _read_header(binary_file) == source_digest:
+            return binary_file
+        logger.debug("AST cache for %s is out of date", source_path)
+    except (AstCacheException, OSError) as rejection:
+        logger.debug("rejecting AST cache for %s: %s", source_path, rejection)
+    binary_file.close()
+    return None
+
+def load_forms(binary_file, compilation):
+    """The annotated top-level forms stored in `binary_file` (positioned
+    at the payload), with their global environments put back as though
+    `compilation` had just annotated them."""
+    while True:
+        form = unpickle_form(binary_file)
+        if form is None:
+            return
+        restore_global_environments(form, compilation)
+        yield form
+
+def read_ast(binary_file, compilation=None):
+    """The annotated top-level forms in an AST cache file (such as
+    `glitteralc --emit=ast` writes), for tools that want them."""
+    if compilation is None:
+        compilation = Compilation()
+    if not binary_file.seekable():
+        # (a pipe, say; checking the payload digest means reading the
+        # payload twice)
+        binary_file = io.BytesIO(binary_file.read())
+    _read_header(binary_file)
+    yield from load_forms(binary_file, compilation)
+
+
+def _loading(binary_file, compilation):
+    with binary_file:
+        try:
+            yield from load_forms(binary_file, compilation)
+        except AstCacheException as rejection:
+            # (which, the file's digests having checked out, someone went
+            # out of their way to do)
+            raise AstCacheException(
+                "{}: {} (it wasn't written by glitteralc; remove it, or "
+                "compile with --no-cache)".format(binary_file.name,
+                                                  rejection)) from None
+
+def _storing(source_path, frontend):
+    try:
+        descriptor, temporary_path = tempfile.mkstemp(
+            prefix=".", suffix=".gltrlc.tmp",
+            dir=os.path.dirname(source_path) or os.curdir)
+    except OSError as error:
+        # (we can compile things we can't write next to; we just can't
+        # cache them)
+        logger.debug("not caching AST for %s: %s", source_path, error)
+        with open(source_path) as source_file:
+            yield from frontend(source_file)
+        return
+    try:
+        with os.fdopen(descriptor, 'wb') as temporary_file:
+            yield from dump_ast(source_path, frontend, temporary_file)
+        # (atomically, so that no one ever sees a partial cache file)
+        os.replace(temporary_path, cache_path(source_path))
+    except BaseException:
+        # including `GeneratorExit`, if whoever was consuming the forms
+        # gave up on them partway through
+        try:
+            os.unlink(temporary_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def cached_forms(source_path, compilation, frontend, reuse=True):
+    """The annotated top-level forms of the program at `source_path`, and
+    whether they came from the AST cache.
+
+    If there's a cache file good for the program as it is now (and
+    `reuse` doesn't say otherwise), the forms come from there; if not,
+    they come from calling `frontend` with (an iterable of the lines of)
+    the program, and get written to a new cache file as they go by.
+    """
+    if reuse:
+        binary_file = open_cache(source_path, source_digest(source_path))
+        if binary_file is not None:
+            return _loading(binary_file, compilation), True
+    return _storing(source_path, frontend), False
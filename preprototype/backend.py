@@ -3,8 +3,16 @@ import itertools
 import functools
 import os
 
+from collections import namedtuple
+from types import GeneratorType
+
 from parser import *  # tell it to somepony who cares
-from utils import get_logger
+from annotator import Binding, IterInto, resolve
+from inference import (INTEGER, FLOAT, STRING, BOOLEAN, FILE, VOID,
+                       element_type, infer_types, is_container,
+                       specified_type)
+from optimizer import fold_constants, known_length, plan_reservations
+from utils import DispatchTable, get_logger
 
 logger = get_logger(__name__)
 
@@ -17,14 +25,16 @@ class CodeGenerationNotImplementedException(
     ...
 
 
-autoidentifier_sequence = (
-    "_gltrl_autoidentifier_{}".format(i) for i in itertools.count(1))
+RUST_TYPES = {INTEGER: "isize", FLOAT: "f64", STRING: "&str",
+              BOOLEAN: "bool", FILE: "&MappedFile", VOID: "()"}
 
+def rust_type(glitteral_type):
+    if glitteral_type.constructor == "list":
+        return "&mut Vec<{}>".format(rust_type(element_type(glitteral_type)))
+    return RUST_TYPES[glitteral_type]
 
 def rustify_type_specifier(type_specifier_atom):
-    return {'^int': "isize", '^float': "f64",
-            '^str': "&str", '^bool': "bool",
-            '^[int]': "&mut Vec<isize>", None: "()"}[type_specifier_atom.value]
+    return rust_type(specified_type(type_specifier_atom))
 
 def rustify_argument(argument):
     return "{}: {}".format(
@@ -41,27 +51,105 @@ def condescend_to_ascii(identifier):
 def semicolon_if_statementlike(expression):
     return ';' if getattr(expression, 'statementlike') else ''
 
-def generate_named_function_definition(definition):
+# Like the parser (see `parser.parse_expression`), the code generator
+# doesn't recurse: each of the `generate_*` functions for a compound
+# expression is a generator that yields the subexpressions it needs the
+# code for and gets sent back that code, and `generate_expression` runs
+# them off of a stack of its own.
+#
+# (What actually gets sent back is a placeholder, with the
+# subexpression's real code set aside to be put in the placeholder's
+# place once the parent's code is done—so the subexpressions have to be
+# yielded in the order that their code appears in the parent's. Small
+# subexpressions' code goes in straight away; big subexpressions' code
+# is left for `stitch` to put in at the very end, because putting in
+# each one's code as we went would copy the code for the innermost
+# expression of something nested a hundred thousand deep a hundred
+# thousand times over.)
+
+PLACEHOLDER = "\0"
+# (characters of code, beyond which it's left to `stitch`)
+SPLICING_LIMIT = 1 << 12
+
+Templated = namedtuple('Templated', ("template", "subexpression_codes"))
+
+def spliced(template, subexpression_codes):
+    if not subexpression_codes:
+        return template
+    size = len(template)
+    for code in subexpression_codes:
+        if type(code) is not str:
+            return Templated(template, subexpression_codes)
+        size += len(code)
+    if size >= SPLICING_LIMIT:
+        return Templated(template, subexpression_codes)
+    template_pieces = template.split(PLACEHOLDER)
+    if len(template_pieces) != len(subexpression_codes) + 1:
+        raise CodeGenerationException(
+            "generated code {!r} doesn't have a place for each of its {} "
+            "subexpressions".format(template, len(subexpression_codes)))
+    return ''.join(itertools.chain.from_iterable(
+        zip(template_pieces, subexpression_codes))) + template_pieces[-1]
+
+def stitch(code):
+    pieces = []
+    unstitched = [code]
+    while unstitched:
+        code = unstitched.pop()
+        if isinstance(code, str):
+            pieces.append(code)
+            continue
+        template_pieces = code.template.split(PLACEHOLDER)
+        if len(template_pieces) != len(code.subexpression_codes) + 1:
+            raise CodeGenerationException(
+                "generated code {!r} doesn't have a place for each of its "
+                "{} subexpressions".format(code.template,
+                                           len(code.subexpression_codes)))
+        unstitched.append(template_pieces[-1])
+        for subexpression_code, template_piece in zip(
+                reversed(code.subexpression_codes),
+                reversed(template_pieces[:-1])):
+            unstitched.append(subexpression_code)
+            unstitched.append(template_piece)
+    return ''.join(pieces)
+
+# Which `generate_*` function generates the code for an expression
+# depends only on its type, which we look up in a table (to which
+# alternative or additional node types' code generators can be added
+# with `@CODE_GENERATORS.register`) rather than asking the expression
+# whether it's an instance of each node type in turn.
+
+CODE_GENERATORS = DispatchTable("code generator")
+
+def generate_each(expressions):
+    """The code for each of `expressions` (to be `yield from`ed)."""
+    generated = []
+    for expression in expressions:
+        generated.append((yield expression))
+    return generated
+
+@CODE_GENERATORS.register(NamedFunctionDefinition)
+def generate_named_function_definition(definition, compilation):
+    body = yield from generate_each(definition.expressions)
     return """fn %s(%s) -> %s {
 %s
 }
 """ % (condescend_to_ascii(definition.name.value),
        ', '.join(rustify_argument(arg) for arg in definition.arguments),
        rustify_type_specifier(definition.return_type),
-       '\n'.join(
-           generate_expression(expression)
-           for expression in definition.expressions))
+       '\n'.join(body))
 
-def generate_do_block(block):
-    return "{ %s }" % "\n".join(
-        generate_expression(expression) for expression in block.expressions)
+@CODE_GENERATORS.register(DoBlock)
+def generate_do_block(block, compilation):
+    body = yield from generate_each(block.expressions)
+    return "{ %s }" % "\n".join(body)
 
-def generate_definition(definition):
+@CODE_GENERATORS.register(Definition)
+def generate_definition(definition, compilation):
     return "{}{} = {}{}".format(
-        ("let mut " if not definition.environment.get(
-            definition.identifier.value) else ''),
+        "let mut " if definition.superseded is None else '',
         condescend_to_ascii(definition.identifier.value),
-        generate_expression(definition.identified),
+        (yield definition.identified),
         # XXX this is really genuinely awful (but the idea is that at the
         # moment, associatives are the only kind of AST node whose
         # instantitation needs to be spread over multiple Rust statements, so
@@ -71,234 +159,466 @@ def generate_definition(definition):
         ';' if not isinstance(definition.identified, Associative) else ''
     )
 
-def generate_subscript_assignment(assignment):
-    return "{}[{} as usize] = {};".format(
-        assignment.collection_identifier.value,
-        assignment.key.value,  # XXX: I'm overusing the word "value"
-        generate_expression(assignment.value)
+def place_of(container):
+    """The code for `container` (which might be an owned collection,
+    which we don't want to mutably borrow), as something to subscript or
+    call methods on (to be `yield from`ed)."""
+    if (isinstance(container, IdentifierAtom) and
+            container.binding.kind != "builtin"):
+        return condescend_to_ascii(container.value)
+    if isinstance(container, Application):
+        return (yield container)
+    return "({})".format((yield container))
+
+@CODE_GENERATORS.register(SubscriptAssignment)
+def generate_subscript_assignment(assignment, compilation):
+    collection = assignment.collection_identifier
+    if collection.inferred_type.constructor == "dictionary":
+        template = "{}.insert({}, {});"
+    else:
+        template = "{}[{} as usize] = {};"
+    return template.format(
+        (yield from place_of(collection)),
+        (yield assignment.key),  # XXX: I'm overusing the word "value"
+        (yield assignment.value)
     )
 
-def generate_conditional(conditional):
+@CODE_GENERATORS.register(Conditional)
+def generate_conditional(conditional, compilation):
     branches = "if %s { %s }" % (
-        generate_expression(conditional.condition),
-        generate_expression(conditional.consequent)
+        (yield conditional.condition),
+        (yield conditional.consequent)
     )
     if conditional.alternative is not None:
-        branches += " else { %s }" % generate_expression(conditional.alternative)
+        branches += " else { %s }" % (yield conditional.alternative)
     return branches
 
-def generate_singletracked_conditional(one_conditional):
+@CODE_GENERATORS.register(SingletrackedConditional)
+def generate_singletracked_conditional(one_conditional, compilation):
     return "if %s { %s }" % (
-        generate_expression(one_conditional.condition),
-        '\n'.join(
-            generate_expression(expression)
-            for expression in one_conditional.expressions
-        )
+        (yield one_conditional.condition),
+        '\n'.join((yield from generate_each(one_conditional.expressions)))
     )
 
-def generate_indeterminate_iteration(iteration):
+@CODE_GENERATORS.register(IndeterminateIteration)
+def generate_indeterminate_iteration(iteration, compilation):
     return ("""while %s {
 %s
-}""" % (generate_expression(iteration.condition),
-        '\n'.join(generate_expression(expression)
-                  for expression in iteration.body)))
+}""" % ((yield iteration.condition),
+        '\n'.join((yield from generate_each(iteration.body)))))
 
-def generate_determinate_iteration(iteration):
-    return "for &%s in %s.iter() { %s }" % (
-        tuple(map(generate_expression,
-                  (iteration.index_identifier, iteration.iterable))) +
-                   # XXX hideous
-                   ('\n'.join(
-                       generate_expression(expression)
-                       for expression in iteration.body
-                   ),)
-    )
+# builtins that make lists to be iterated over, which a `for` loop over
+# one of can iterate over the Rust range or iterator of (by the name of
+# the builtin) instead, without having to make the list (and, for the
+# lines of a file, without copying them out of the mapping: see
+# `MappedFile` in builtins.rs)
+NATIVE_ITERABLES = {"range": "{}..{}", "reverse_range": "({}..{}).rev()",
+                    "step_range": "({}..{}).step_by({} as usize)",
+                    "file_lines": "map_file({}).lines()",
+                    "mapped_lines": "{}.lines()",
+                    "mapped_bytes": "{}.bytes()"}
+
+def holds_strings(container):
+    """Whether `container` is a list (or vector) of strings, which
+    might be `String`s, that can't be copied out of it (see `strs` in
+    builtins.rs)."""
+    container_type = container.inferred_type
+    return (container_type is not None and
+            container_type.constructor in ("list", "vector") and
+            element_type(container_type) == STRING)
 
-def generate_special_builtin_dispatched_application(application):
-    # XXX this function and everything around it is dreadful in more ways than
-    # one
-    if (application.environment.get(application.function.value).value ==
-        "get_subscript"):
-        container_identifier, key_identifier = application.arguments
-        container = application.environment.get(container_identifier.value)
-        if isinstance(container, List) or (
-                # XXX MORE GRATUITOUS COMPLEXITY: we've been treating function
-                # parameters differently (wrapped up in an Argument)
-                isinstance(container, Argument) and
-                container.type_specifier.value[:2] == "^["):
-            underfunction = "list_get_subscript"
-        elif isinstance(container, Vector):
-            underfunction = "vector_get_subscript"
-            raise CodeGenerationException("TODO make vectors work")
-        elif isinstance(container, Dictionary) or (
-                isinstance(container, Argument) and
-                container.type_specifier.value[:2] == "^{"):
-            underfunction = "str_int_dictionary_get_subscript"
+@CODE_GENERATORS.register(DeterminateIteration)
+def generate_determinate_iteration(iteration, compilation):
+    iterable = iteration.iterable
+    native_iterable = builtin = None
+    if (isinstance(iterable, Application) and
+            iterable.function.binding.kind == "builtin"):
+        builtin = iterable.function.binding.node.value
+        native_iterable = NATIVE_ITERABLES.get(builtin)
+    if builtin == "lines" and not iterable.arguments:
+        # (a line at a time, rather than all of them in a list first:
+        # see `StdinLines` in builtins.rs)
+        stdin_lines = next(compilation.autoidentifier_sequence)
+        return ("{ let mut %s = StdinLines::new(); "
+                "while let Some(%s) = %s.next_line() { %s } }" % (
+                    stdin_lines, (yield iteration.index_identifier),
+                    stdin_lines,
+                    '\n'.join((yield from generate_each(iteration.body)))))
+    native = (native_iterable is not None and
+              native_iterable.count("{}") == len(iterable.arguments))
+    if iteration.reservations:
+        # (the iterator made first, so that the lists can have room made
+        # in them for as many items as it has)
+        if native:
+            iterator = native_iterable.format(
+                *(yield from generate_each(iterable.arguments)))
+        elif holds_strings(iterable):
+            iterator = "strs(&{})".format((yield from place_of(iterable)))
         else:
-            raise CodeGenerationException("_ called with first argument {}, "
-                                          "expected Container "
-                                          "type".format(container))
-        return "{}({}){}".format(
-            underfunction,
-            ', '.join(generate_expression(arg)
-                      for arg in application.arguments),
-            semicolon_if_statementlike(application)
+            iterator = "{}.iter()".format((yield from place_of(iterable)))
+        iterator_identifier = next(compilation.autoidentifier_sequence)
+        reservations = ' '.join(
+            "{}.reserve({}{}.len());".format(
+                condescend_to_ascii(name),
+                "{} * ".format(count) if count > 1 else '',
+                iterator_identifier)
+            for name, count in iteration.reservations)
+        return "{ let %s = %s; %s for %s%s in %s { %s } }" % (
+            iterator_identifier, iterator, reservations,
+            '' if native or holds_strings(iterable) else '&',
+            (yield iteration.index_identifier),
+            iterator_identifier,
+            '\n'.join((yield from generate_each(iteration.body))))
+    if native:
+        return "for %s in %s { %s }" % (
+            (yield iteration.index_identifier),
+            native_iterable.format(
+                *(yield from generate_each(iterable.arguments))),
+            '\n'.join((yield from generate_each(iteration.body)))
         )
-
-    elif (application.environment.get(application.function.value).value ==
-          "comprehend"):
-        # SCRAP: I'm losing hope that this is going to work at all, even in the
-        # manner of desperate hacks that I have been known to make work with a
-        # sufficient amount of applied desperate effort
-        container, bindings, item = application.arguments
-        if not isinstance(container, List):
-            raise CodeGenerationNotImplementedException("TODO")
-        index_identifier, iterable = bindings.elements
-        index_identifier.local_environment[
-            index_identifier.value] = "✓"  # lies, depravity, and deception
-        item.local_environment[index_identifier.value] = "✓"
-        container_identifier = IdentifierAtom(next(autoidentifier_sequence))
-        container_identifier.local_environment[
-            container_identifier.value] = "✓"
-
-        # XXX I feel like if the Doctrine of Separatation of Concerns were here,
-        # she would say that we really shouldn't be generating new AST nodes in
-        # this module, which is supposed to just be about "generating code"
-        # (whatever that means)!  But if I don't know enough to rearchitect the
-        # world yet, I feel better about at least not duplicating for-loop
-        # generation
-        container_autodefinition = Definition(
-            container_identifier,
-            container)
-        append_bang = IdentifierAtom("append!")
-        append_bang.global_environment['append!'] = BuiltinAtom("append")
-        comprehending_iteration = DeterminateIteration(
-            index_identifier, iterable,
-            [Application(append_bang,
-                         [container_identifier, item])]
+    if holds_strings(iterable):
+        return "for %s in strs(&%s) { %s }" % (
+            (yield iteration.index_identifier),
+            (yield from place_of(iterable)),
+            '\n'.join((yield from generate_each(iteration.body)))
         )
-        # XXX this is, uh, cute, I guess, but how to we actually refer to the
-        # value that we just autogenerated a name for, huh??
-        return '\n'.join([generate_expression(container_autodefinition),
-                          generate_expression(comprehending_iteration)])
-
-def generate_application(application):
-    if getattr(application.environment.get(application.function.value),
-               'special', None):
-        return generate_special_builtin_dispatched_application(application)
-    return "{}({}){}".format(
-        generate_expression(application.function),  # XX
-        ', '.join(generate_expression(arg) for arg in application.arguments),
+    return "for &%s in %s.iter() { %s }" % (
+        (yield iteration.index_identifier),
+        (yield from place_of(iteration.iterable)),
+        '\n'.join((yield from generate_each(iteration.body)))
+    )
+
+# XXX these functions and everything around them are dreadful in more ways
+# than one
+
+def generate_get_subscript(application, compilation):
+    container, key = application.arguments
+    if not is_container(container.inferred_type):
+        raise CodeGenerationException(
+            "_ called with first argument {} (of type {}), expected "
+            "Container type".format(container, container.inferred_type))
+    if container.inferred_type.constructor == "dictionary":
+        template = "{}[{}]{}"
+    elif holds_strings(container):
+        template = "str_of(&{}[{} as usize]){}"
+    else:
+        template = "{}[{} as usize]{}"
+    return template.format(
+        (yield from place_of(container)),
+        (yield key),
         semicolon_if_statementlike(application)
     )
 
-def generate_sequential(sequential):
+def generate_comprehension(application, compilation):
+    container, bindings, item = application.arguments
+    if not isinstance(container, List):
+        raise CodeGenerationNotImplementedException("TODO")
+    # (whose index the annotator bound in the item: see
+    # `annotator.comprehension_parts`)
+    index_identifier, iterable = bindings.elements
+    comprehension_identifier = IdentifierAtom(
+        next(compilation.autoidentifier_sequence))
+    comprehension_identifier.binding = Binding("global", container, True)
+
+    # XXX I feel like if the Doctrine of Separatation of Concerns were here,
+    # she would say that we really shouldn't be generating new AST nodes in
+    # this module, which is supposed to just be about "generating code"
+    # (whatever that means)!  But if I don't know enough to rearchitect the
+    # world yet, I feel better about at least not duplicating for-loop
+    # generation
+    append_bang = IdentifierAtom("append!")
+    append_bang.binding = Binding("builtin", BuiltinAtom("append"), False)
+    appending = Application(append_bang, [comprehension_identifier, item])
+    appending.statementlike = True
+    comprehending_iteration = DeterminateIteration(
+        index_identifier, iterable, [appending])
+    if known_length(iterable):
+        # (the room for every item made at once, at any optimization
+        # level, there being no other way to write a comprehension)
+        comprehending_iteration.reservations = (
+            (comprehension_identifier.value, 1),)
+    # (a block that evaluates to the list, so that a comprehension can
+    # go anywhere a list can)
+    return "{ let mut %s = %s; %s %s }%s" % (
+        comprehension_identifier.value, (yield container),
+        (yield comprehending_iteration), comprehension_identifier.value,
+        semicolon_if_statementlike(application))
+
+# (keyed by the name of the builtin)
+SPECIAL_BUILTIN_GENERATORS = {
+    "get_subscript": generate_get_subscript,
+    "comprehend": generate_comprehension,
+}
+
+# builtins that are (implemented by different Rust functions) for
+# containers
+CONTAINER_BUILTINS = {"print": "print_container",
+                      "println": "println_container"}
+# builtins that only look at the containers they're passed (which
+# therefore needn't be borrowed mutably)
+CONTAINER_READING_BUILTINS = {"length", "print_container",
+                              "println_container"}
+
+def generate_arguments(arguments):
+    """The code for each of `arguments` to a call (to be `yield
+    from`ed), files borrowed: a `^file` is a mapping that's only ever
+    owned by whatever `map_file`ed it."""
+    codes = []
+    for argument in arguments:
+        code = yield argument
+        codes.append("&{}".format(code) if argument.inferred_type == FILE
+                     else code)
+    return codes
+
+# builtins that are Rust operators, given operands that are all of one
+# of the types that the operator is for (rather than calls of the
+# functions in builtins.rs that implement them generically—which,
+# besides being calls, evaluate all of the arguments to `and` and `or`,
+# where `&&` and `||` short-circuit)
+NUMBERS = (INTEGER, FLOAT)
+NATIVE_OPERATORS = {
+    "add": ("+", NUMBERS), "subtract": ("-", NUMBERS),
+    "multiply": ("*", NUMBERS), "divide": ("/", NUMBERS),
+    "integers_equal": ("==", (INTEGER,)),
+    "integers_not_equal": ("!=", (INTEGER,)),
+    "greater": (">", NUMBERS), "less": ("<", NUMBERS),
+    "not_greater": ("<=", NUMBERS), "not_less": (">=", NUMBERS),
+    "and": ("&&", (BOOLEAN,)), "or": ("||", (BOOLEAN,)),
+}
+# builtins that can be applied to any number of (at least two)
+# arguments, associating to the left—`(− a b c)` is `a - b - c`
+VARIADIC_BUILTINS = {"add", "subtract", "multiply", "divide", "and", "or"}
+
+def native_operator(builtin, arguments):
+    """The Rust operator that applying `builtin` to `arguments` can be
+    written with, if any."""
+    if builtin not in NATIVE_OPERATORS or len(arguments) < 2:
+        return None
+    if len(arguments) > 2 and builtin not in VARIADIC_BUILTINS:
+        return None
+    operator, operand_types = NATIVE_OPERATORS[builtin]
+    operand_type = arguments[0].inferred_type
+    if (operand_type not in operand_types or
+            any(argument.inferred_type != operand_type
+                for argument in arguments)):
+        return None
+    return operator
+
+@CODE_GENERATORS.register(Application)
+def generate_application(application, compilation):
+    if application.constant is not None:
+        return represent_constant(application)
+    function = application.function.binding
+    if function.kind != "builtin":
+        return "{}({}){}".format(
+            (yield application.function),  # XX
+            ', '.join((yield from generate_arguments(application.arguments))),
+            semicolon_if_statementlike(application)
+        )
+    if function.node.special:
+        return (yield from SPECIAL_BUILTIN_GENERATORS[function.node.value](
+            application, compilation))
+    builtin = function.node.value
+    operator = native_operator(builtin, application.arguments)
+    if operator is not None:
+        # (always parenthesized, so that it can go anywhere an atom can)
+        return "({}){}".format(
+            " {} ".format(operator).join(
+                (yield from generate_each(application.arguments))),
+            semicolon_if_statementlike(application))
+    if builtin in VARIADIC_BUILTINS and len(application.arguments) > 2:
+        # (without the types to use an operator, the binary function
+        # applied over and over)
+        first, *rest = yield from generate_each(application.arguments)
+        return functools.reduce(
+            lambda code, argument: "{}({}, {})".format(builtin, code,
+                                                       argument),
+            rest, first) + semicolon_if_statementlike(application)
+    if (builtin in CONTAINER_BUILTINS and application.arguments and
+            is_container(application.arguments[0].inferred_type)):
+        builtin = CONTAINER_BUILTINS[builtin]
+    arguments = []
+    for argument in application.arguments:
+        if argument.inferred_type == FILE:
+            arguments.extend((yield from generate_arguments([argument])))
+        elif (builtin not in CONTAINER_READING_BUILTINS or
+                not is_container(argument.inferred_type)):
+            arguments.append((yield argument))
+        elif isinstance(argument, IdentifierAtom):
+            if argument.binding.kind == "argument":
+                # (already a reference)
+                arguments.append((yield argument))
+            else:
+                arguments.append(
+                    "&{}".format(condescend_to_ascii(argument.value)))
+        else:
+            # (a container that's been made just to be looked at)
+            arguments.append("&{}".format((yield argument)))
+    return "{}({}){}".format(builtin, ', '.join(arguments),
+                             semicolon_if_statementlike(application))
+
+@CODE_GENERATORS.register(Sequential)
+def generate_sequential(sequential, compilation):
     type_to_delimiter = {List: ('vec![', ']'), Vector: ('[', ']')}
     open_delimiter, close_delimiter = type_to_delimiter[type(sequential)]
     return ''.join(
         [open_delimiter,
-         ', '.join(generate_expression(element)
-                   for element in sequential.elements),
+         ', '.join((yield from generate_each(sequential.elements))),
          close_delimiter]
     ) + semicolon_if_statementlike(sequential)
 
-def generate_associative(associative):
+@CODE_GENERATORS.register(Associative)
+def generate_associative(associative, compilation):
     # TODO: what is our strategy going to be for Glitteral
     # (immuatable) Hashtables?
-    return "HashMap::new();\n{}\n".format(
-        '\n'.join(
-            "{}.insert({}, {});".format(
-                generate_expression(associative.identifier),
-                generate_expression(association.key),
-                generate_expression(association.value))
-            for association in associative.associations
-        )
-    )
+    insertions = []
+    for association in associative.associations:
+        insertions.append("{}.insert({}, {});".format(
+            (yield from place_of(associative.identifier)),
+            (yield association.key),
+            (yield association.value)))
+    return "HashMap::new();\n{}\n".format('\n'.join(insertions))
+
+def represent_constant(expression):
+    # (for an expression worked out at compile time: see optimizer.py)
+    value = expression.constant
+    if type(value) is bool:
+        code = "true" if value else "false"
+    elif type(value) is int:
+        code = "{}isize".format(value)
+    elif type(value) is float:
+        code = "{!r}f64".format(value)
+    else:
+        code = '"{}"'.format(value)
+    return code + semicolon_if_statementlike(expression)
+
+def lent_mutably(identifier):
+    """Whether `identifier` names a container that's owned where it was
+    defined (a list or dictionary literal, or any list that's been given
+    a name, such as a builtin returns), which the places it's passed
+    to borrow mutably."""
+    binding = identifier.binding
+    return binding.mutable or (
+        binding.kind == "global" and
+        identifier.inferred_type is not None and
+        identifier.inferred_type.constructor == "list")
 
 def represent_identifiable(identifier):
-    try:
-        identified = identifier.environment[identifier.value]
-    except KeyError as e:
+    if identifier.constant is not None:
+        return represent_constant(identifier)
+    binding = identifier.binding
+    if binding is None:
         raise CodeGenerationException(
-            "{} not found in environment".format(identifier.value)) from e
-    if isinstance(identified, BuiltinAtom):
-        return "{}{}".format(identified.value,
+            "{} hasn't been resolved (see `annotator.resolve`)".format(
+                identifier.value))
+    if binding.kind == "builtin":
+        return "{}{}".format(binding.node.value,
                              semicolon_if_statementlike(identifier))
     else:
         underidentifier = condescend_to_ascii(identifier.value)
-        if getattr(identified, "mutable", None):
+        if lent_mutably(identifier):
             return "&mut {}{}".format(underidentifier,
                                       semicolon_if_statementlike(identifier))
         else:
             return "{}{}".format(underidentifier,
                                  semicolon_if_statementlike(identifier))
 
-def generate_expression(expression):
-    if isinstance(expression, Codeform):
-        if isinstance(expression, NamedFunctionDefinition):
-            return generate_named_function_definition(expression)
-        elif isinstance(expression, DoBlock):
-            return generate_do_block(expression)
-        elif isinstance(expression, Definition):
-            return generate_definition(expression)
-        elif isinstance(expression, SubscriptAssignment):
-            return generate_subscript_assignment(expression)
-        elif isinstance(expression, Conditional):
-            return generate_conditional(expression)
-        elif isinstance(expression, SingletrackedConditional):
-            return generate_singletracked_conditional(expression)
-        elif isinstance(expression, IndeterminateIteration):
-            return generate_indeterminate_iteration(expression)
-        elif isinstance(expression, DeterminateIteration):
-            return generate_determinate_iteration(expression)
+def generate_expression(expression, compilation):
+    # (as `utils.trampoline` does, but keeping each waiting generator's
+    # subexpressions' code alongside it)
+    waiting = []
+    code = generation_for(expression, compilation)
+    while True:
+        if type(code) is GeneratorType:
+            waiting.append((code, []))
+            sent = None
+        elif not waiting:
+            return stitch(code)
         else:
-            raise CodeGenerationException(
-                "Couldn't generate code for alleged "
-                "Codeform {}".format(expression))
-    elif isinstance(expression, Application):
-        return generate_application(expression)
-    elif isinstance(expression, Sequential):
-        return generate_sequential(expression)
-    elif isinstance(expression, Associative):
-        return generate_associative(expression)
-    elif isinstance(expression, Atom):
-        if isinstance(expression, IdentifierAtom):
-            return represent_identifiable(expression)
-        elif isinstance(expression, IntegerAtom):
-            return "{}isize{}".format(expression.value,
-                                      semicolon_if_statementlike(expression))
-        elif isinstance(expression, FloatAtom):
-            return "{}f64{}".format(expression.value,
-                                      semicolon_if_statementlike(expression))
-        elif isinstance(expression, BooleanAtom):
-            return ("true{}" if expression.value else "false{}").format(
-                semicolon_if_statementlike(expression))
-        elif isinstance(expression, VoidAtom):
-            return "(){}".format(semicolon_if_statementlike(expression))
-        elif isinstance(expression, StringAtom):
-            return '"{}{}"'.format(expression.value,
-                                   semicolon_if_statementlike(expression))
-        else:
-            raise CodeGenerationException("Couldn't generate code for alleged "
-                                          "atom {}".format(expression))
-    else:
-        raise CodeGenerationException("Couldn't generate code for alleged "
-                                      "expression {}".format(expression))
-
-def generate_code(expressions):
-    with open(
-            os.path.join(
-                os.path.dirname(
-                    os.path.realpath(__file__)),
-                "builtins.rs")) as builtins_rs:
-        prelude = builtins_rs.read()
-    return """%s
-
-fn main() {
-%s
-}
-""" % (
-    prelude,
-    '\n'.join(generate_expression(expression)
-              for expression in expressions)
-)
+            waiting[-1][1].append(code)
+            sent = PLACEHOLDER
+        generation, subexpression_codes = waiting[-1]
+        try:
+            subexpression = generation.send(sent)
+        except StopIteration as finished:
+            waiting.pop()
+            code = spliced(finished.value, subexpression_codes)
+            continue
+        code = generation_for(subexpression, compilation)
+
+@CODE_GENERATORS.register(IdentifierAtom)
+def generate_identifier(identifier, compilation):
+    return represent_identifiable(identifier)
+
+@CODE_GENERATORS.register(IntegerAtom)
+def generate_integer(integer, compilation):
+    return "{}isize{}".format(integer.value,
+                              semicolon_if_statementlike(integer))
+
+@CODE_GENERATORS.register(FloatAtom)
+def generate_float(float_, compilation):
+    return "{}f64{}".format(float_.value, semicolon_if_statementlike(float_))
+
+@CODE_GENERATORS.register(BooleanAtom)
+def generate_boolean(boolean, compilation):
+    return ("true{}" if boolean.value else "false{}").format(
+        semicolon_if_statementlike(boolean))
+
+@CODE_GENERATORS.register(VoidAtom)
+def generate_void(void, compilation):
+    return "(){}".format(semicolon_if_statementlike(void))
+
+@CODE_GENERATORS.register(StringAtom)
+def generate_string(string, compilation):
+    return '"{}{}"'.format(string.value, semicolon_if_statementlike(string))
+
+@CODE_GENERATORS.register(Codeform)
+def generate_unknown_codeform(codeform, compilation):
+    raise CodeGenerationException("Couldn't generate code for alleged "
+                                  "Codeform {}".format(codeform))
+
+@CODE_GENERATORS.register(Atom)
+def generate_unknown_atom(atom, compilation):
+    raise CodeGenerationException("Couldn't generate code for alleged "
+                                  "atom {}".format(atom))
+
+@CODE_GENERATORS.register(object)
+def generate_unknown_expression(expression, compilation):
+    raise CodeGenerationException("Couldn't generate code for alleged "
+                                  "expression {}".format(expression))
+
+def generation_for(expression, compilation):
+    """The code for an atom, or a generator that generates the code for a
+    compound expression (see above)."""
+    return CODE_GENERATORS[type(expression)](expression, compilation)
+
+PRELUDE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                            "builtins.rs")
+
+@functools.lru_cache(maxsize=1)
+def _read_prelude(modification_time):
+    with open(PRELUDE_PATH) as builtins_rs:
+        return builtins_rs.read()
+
+def load_prelude():
+    # Only go back to the disk if builtins.rs has changed since we last
+    # read it (which matters for a long-running compile server).
+    return _read_prelude(os.stat(PRELUDE_PATH).st_mtime_ns)
+
+def generate_code_stream(expressions, compilation):
+    """Yield the generated Rust piece by piece, one top-level expression
+    at a time, so that callers can write it out without ever holding
+    the whole program in memory."""
+    yield "%s\n\nfn main() {\nlet _gltrl_output = Output::new(%s);\n" % (
+        load_prelude(), "true" if compilation.unbuffered else "false")
+    separator = ''
+    for expression in plan_reservations(
+            fold_constants(infer_types(resolve(expressions)), compilation),
+            compilation):
+        yield separator
+        yield generate_expression(expression, compilation)
+        separator = '\n'
+    yield "\n}\n"
+
+def generate_code(expressions, compilation):
+    return ''.join(generate_code_stream(expressions, compilation))
@@ -1,10 +1,14 @@
 use std::io;
-use std::fmt::Display;
+use std::io::{BufRead, BufWriter, Read, StdoutLock, Write};
+use std::cell::{Cell, RefCell};
+use std::fmt::{self, Debug, Display};
 use std::collections::HashMap;
-use std::thread::sleep_ms;
+use std::ffi::c_void;
+use std::fs::{self, File};
 use std::ops::{Add, Sub, Mul, Div};
-use std::process::Command;
-use std::str::from_utf8;
+use std::sync::OnceLock;
+use std::thread;
+use std::time::{Duration, Instant, SystemTime, UNIX_EPOCH};
 
 // Glitteral standard library arithmetic
 fn integers_equal(a: isize, b: isize) -> bool { a == b }
@@ -19,44 +23,52 @@ fn not_less<T: PartialOrd>(a: T, b: T) -> bool { a >= b }
 fn not_greater<T: PartialOrd>(a: T, b: T) -> bool { a <= b }
 
 // more builtins
-fn append(list: &mut Vec<isize>, item: isize) -> &mut Vec<isize> {
+fn append<T>(list: &mut Vec<T>, item: T) -> &mut Vec<T> {
     list.push(item);
     list
 }
 fn length<T>(container: &Vec<T>) -> isize {
     container.len() as isize
 }
+// Glitteral's lists of strings hold either borrowed `&str`s (as list
+// literals do) or owned `String`s (as `lines` and the file builtins
+// make), and either way, their strings are gone through (see `strs`)
+// and subscripted (see `str_of`) as `&str`s, so as never to be moved out
+// of the list.
+fn strs<S: AsRef<str>>(strings: &[S])
+                       -> impl ExactSizeIterator<Item = &str> {
+    strings.iter().map(|string| string.as_ref())
+}
+fn str_of<S: AsRef<str>>(string: &S) -> &str {
+    string.as_ref()
+}
 fn range(start: isize, end: isize) -> Vec<isize> {
-    let mut items = vec![];
-    for i in start..end {
-        items.push(i)
-    }
-    items
+    (start..end).collect()
 }
-
-fn parse_float(f: String) -> f64 {
-    f.parse().ok().unwrap()
+fn reverse_range(start: isize, end: isize) -> Vec<isize> {
+    (start..end).rev().collect()
+}
+fn step_range(start: isize, end: isize, step: isize) -> Vec<isize> {
+    (start..end).step_by(step as usize).collect()
 }
 
-// special
-fn list_get_subscript<T: Copy>(container: &mut Vec<T>, index: isize) -> T {
-    container[index as usize]
+// (which panic, saying what they couldn't parse, unless given a default
+// to fall back on)
+fn parse_int<S: AsRef<str>>(s: S) -> isize {
+    let s = s.as_ref();
+    s.trim().parse()
+        .unwrap_or_else(|_| panic!("can't parse {:?} as an integer", s))
 }
-fn vector_get_subscript<T: Copy>(container: &[T], index: isize) -> T {
-    container[index as usize]
+fn parse_float<S: AsRef<str>>(s: S) -> f64 {
+    let s = s.as_ref();
+    s.trim().parse()
+        .unwrap_or_else(|_| panic!("can't parse {:?} as a float", s))
 }
-
-// fn dictionary_get_subscript<K: Eq + Hash + Clone, V>(container: &mut HashMap<K, V>, key: &K) -> V {
-//     *container.get(&key).unwrap().clone()
-// }
-//
-// XXX TODO FIXME: we would really prefer to use a generic hashmap rather than
-// artificially constrain the types of Glitteral associatives or repeat the same
-// function with different types several times, but have temporarily tired of
-// beating our fists against the iron wall of "`cannot move out of borrowed
-// content`"
-fn str_int_dictionary_get_subscript(container: &mut HashMap<&str, isize>, key: &str) -> isize {
-    *container.get(key).unwrap()
+fn parse_int_or<S: AsRef<str>>(s: S, default: isize) -> isize {
+    s.as_ref().trim().parse().unwrap_or(default)
+}
+fn parse_float_or<S: AsRef<str>>(s: S, default: f64) -> f64 {
+    s.as_ref().trim().parse().unwrap_or(default)
 }
 
 // conjunction and disjunction
@@ -68,27 +80,239 @@ fn or(a: bool, b: bool) -> bool {
 }
 
 // Glitteral standard library IO
-fn println_container(l: &mut Vec<isize>) { println!("{:?}", l); }
-fn print<T: Display>(printable: T) { print!("{}", printable); }
-fn println<T: Display>(printable: T) { println!("{}", printable); }
+//
+// Everything printed goes through the one buffered writer, which is
+// flushed by `flush`, before `input` waits for a reply to whatever was
+// printed, and when `main` is over (see `Output`)—or after every print,
+// if the program was compiled --unbuffered.
+thread_local! {
+    static OUTPUT: RefCell<BufWriter<StdoutLock<'static>>> = RefCell::new(
+        BufWriter::with_capacity(1 << 16, io::stdout().lock()));
+    static UNBUFFERED: Cell<bool> = Cell::new(false);
+}
+fn write_output(printed: fmt::Arguments) {
+    OUTPUT.with(|output| {
+        let mut output = output.borrow_mut();
+        output.write_fmt(printed).expect("Glitteral IO failure");
+        if UNBUFFERED.with(Cell::get) {
+            output.flush().expect("Glitteral IO failure");
+        }
+    });
+}
+fn flush() {
+    OUTPUT.with(|output| output.borrow_mut().flush())
+        .expect("Glitteral IO failure");
+}
+// (made at the start of `main`, and dropped at the end of it, even if
+// it panics)
+struct Output;
+impl Output {
+    fn new(unbuffered: bool) -> Output {
+        UNBUFFERED.with(|setting| setting.set(unbuffered));
+        Output
+    }
+}
+impl Drop for Output {
+    fn drop(&mut self) {
+        // (there's nowhere left to complain to)
+        let _ = OUTPUT.with(|output| output.borrow_mut().flush());
+    }
+}
+fn print_container<T: Debug>(l: &[T]) {
+    write_output(format_args!("{:?}", l));
+}
+fn println_container<T: Debug>(l: &[T]) {
+    write_output(format_args!("{:?}\n", l));
+}
+fn print<T: Display>(printable: T) {
+    write_output(format_args!("{}", printable));
+}
+fn println<T: Display>(printable: T) {
+    write_output(format_args!("{}\n", printable));
+}
 fn input() -> String {
+    flush();
     let mut input_buffer = String::new();
-    io::stdin()
+    io::stdin().lock()
         .read_line(&mut input_buffer)
-        .ok().expect("Glitteral IO failure");
-    input_buffer.trim().to_string()
+        .expect("Glitteral IO failure");
+    // (trimmed where it is, rather than copied)
+    input_buffer.truncate(input_buffer.trim_end().len());
+    let leading = input_buffer.len() - input_buffer.trim_start().len();
+    input_buffer.drain(..leading);
+    input_buffer
+}
+fn read_all() -> String {
+    flush();
+    let mut everything = String::new();
+    io::stdin().lock()
+        .read_to_string(&mut everything)
+        .expect("Glitteral IO failure");
+    everything
+}
+// The lines of standard input, one at a time, each read into the same
+// buffer (which is why this isn't an `Iterator`: each line is only
+// borrowed until the next one is read). A `for` loop over `(lines)`
+// compiles to `while let Some(line) = stdin_lines.next_line()`; anywhere
+// else, `lines` makes a list of them all. (Standard input is only locked
+// for as long as it takes to read each line—its lock isn't reentrant,
+// and the loop body might want to `input` a line of its own.)
+struct StdinLines {
+    buffer: String,
+}
+impl StdinLines {
+    fn new() -> StdinLines {
+        flush();
+        StdinLines { buffer: String::new() }
+    }
+    fn next_line(&mut self) -> Option<&str> {
+        self.buffer.clear();
+        let read = io::stdin().lock().read_line(&mut self.buffer)
+            .expect("Glitteral IO failure");
+        if read == 0 {
+            return None;
+        }
+        Some(self.buffer.trim_end_matches(&['\n', '\r'][..]))
+    }
 }
-fn sleep(secs: isize) {
-    sleep_ms((secs * 1000) as u32);
+fn lines() -> Vec<String> {
+    flush();
+    io::stdin().lock().lines()
+        .map(|line| line.expect("Glitteral IO failure"))
+        .collect()
 }
+
+// Glitteral standard library files
+fn read_file<P: AsRef<str>>(path: P) -> String {
+    let path = path.as_ref();
+    fs::read_to_string(path)
+        .unwrap_or_else(|error| panic!("can't read {:?}: {}", path, error))
+}
+fn write_file<P: AsRef<str>, C: AsRef<str>>(path: P, contents: C) {
+    let path = path.as_ref();
+    fs::write(path, contents.as_ref())
+        .unwrap_or_else(|error| panic!("can't write {:?}: {}", path, error))
+}
+#[cfg(unix)]
+mod mapping {
+    use std::ffi::{c_int, c_long, c_void};
+    extern "C" {
+        pub fn mmap(address: *mut c_void, length: usize, protection: c_int,
+                    flags: c_int, descriptor: c_int,
+                    offset: c_long) -> *mut c_void;
+        pub fn munmap(address: *mut c_void, length: usize) -> c_int;
+    }
+    pub const PROT_READ: c_int = 1;
+    pub const MAP_PRIVATE: c_int = 2;
+    pub const MAP_FAILED: *mut c_void = !0 as *mut c_void;
+}
+// A file mapped into memory (read-only—so don't go writing to it while
+// it's mapped), so that its lines and bytes can be gone through without
+// reading it into a buffer first: a `for` loop over `(file_lines path)`
+// or `(mapped_lines file)` compiles to one over `file.lines()`, each
+// line borrowed straight out of the mapping. (Empty files, which can't
+// be mapped, and files on platforms we don't know how to map them on,
+// are read the ordinary way.)
+struct MappedFile {
+    mapping: Option<(*mut c_void, usize)>,
+    read: Vec<u8>,
+}
+impl MappedFile {
+    #[cfg(unix)]
+    fn open(path: &str) -> MappedFile {
+        use std::os::unix::io::AsRawFd;
+        let file = File::open(path)
+            .unwrap_or_else(|error| panic!("can't open {:?}: {}",
+                                           path, error));
+        let length = file.metadata().map(|metadata| metadata.len() as usize)
+            .unwrap_or(0);
+        if length > 0 {
+            let address = unsafe {
+                mapping::mmap(std::ptr::null_mut(), length, mapping::PROT_READ,
+                              mapping::MAP_PRIVATE, file.as_raw_fd(), 0)
+            };
+            // (the mapping outlives the file being closed)
+            if address != mapping::MAP_FAILED {
+                return MappedFile { mapping: Some((address, length)),
+                                    read: Vec::new() };
+            }
+        }
+        MappedFile::read(path)
+    }
+    #[cfg(not(unix))]
+    fn open(path: &str) -> MappedFile {
+        MappedFile::read(path)
+    }
+    fn read(path: &str) -> MappedFile {
+        let read = fs::read(path)
+            .unwrap_or_else(|error| panic!("can't read {:?}: {}",
+                                           path, error));
+        MappedFile { mapping: None, read }
+    }
+    fn as_bytes(&self) -> &[u8] {
+        match self.mapping {
+            Some((address, length)) => unsafe {
+                std::slice::from_raw_parts(address as *const u8, length)
+            },
+            None => &self.read,
+        }
+    }
+    fn lines(&self) -> impl Iterator<Item = &str> {
+        self.as_bytes().split_inclusive(|&byte| byte == b'\n')
+            .map(|line| {
+                let line = line.strip_suffix(b"\n").unwrap_or(line);
+                let line = line.strip_suffix(b"\r").unwrap_or(line);
+                std::str::from_utf8(line)
+                    .unwrap_or_else(|_| panic!("line isn't UTF-8: {:?}",
+                                               String::from_utf8_lossy(line)))
+            })
+    }
+    fn bytes(&self) -> impl Iterator<Item = isize> + '_ {
+        self.as_bytes().iter().map(|&byte| byte as isize)
+    }
+}
+impl Drop for MappedFile {
+    fn drop(&mut self) {
+        #[cfg(unix)]
+        if let Some((address, length)) = self.mapping {
+            unsafe { mapping::munmap(address, length); }
+        }
+    }
+}
+fn map_file<P: AsRef<str>>(path: P) -> MappedFile {
+    MappedFile::open(path.as_ref())
+}
+fn file_lines<P: AsRef<str>>(path: P) -> Vec<String> {
+    mapped_lines(&map_file(path))
+}
+fn mapped_lines(file: &MappedFile) -> Vec<String> {
+    file.lines().map(String::from).collect()
+}
+fn mapped_bytes(file: &MappedFile) -> Vec<isize> {
+    file.bytes().collect()
+}
+fn mapped_size(file: &MappedFile) -> isize {
+    file.as_bytes().len() as isize
+}
+
+// Glitteral standard library time
+trait Seconds { fn seconds(self) -> f64; }
+impl Seconds for isize { fn seconds(self) -> f64 { self as f64 } }
+impl Seconds for f64 { fn seconds(self) -> f64 { self } }
+fn sleep<S: Seconds>(secs: S) {
+    thread::sleep(Duration::from_secs_f64(secs.seconds().max(0.)));
+}
+// seconds since the Unix epoch, by the wall clock (which can jump)
 fn current_time() -> f64 {
-    let date_plus_cent_s = Command::new("bash")
-        .arg("-c")
-        .arg("python3 -c \"import time; print(time.time())\"")
-        .output()
-        .unwrap();
-    let raw_output: Vec<u8> = date_plus_cent_s.stdout;
-    let output: &str = from_utf8(&raw_output).ok().unwrap();
-    let time_option: Option<f64> = output.trim().parse().ok();
-    time_option.unwrap()
+    SystemTime::now().duration_since(UNIX_EPOCH)
+        .map(|since| since.as_secs_f64()).unwrap_or(0.)
+}
+// seconds since the program first asked, by a clock that only goes
+// forward (for measuring with: see `elapsed`)
+static START: OnceLock<Instant> = OnceLock::new();
+fn instant() -> f64 {
+    START.get_or_init(Instant::now).elapsed().as_secs_f64()
+}
+fn elapsed(since: f64) -> f64 {
+    instant() - since
 }
@@ -0,0 +1,123 @@
+import functools
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser("~/.cache")),
+    "glitteral")
+DEFAULT_SIZE_LIMIT = 512 * 1024 * 1024  # bytes
+
+
+@functools.lru_cache(maxsize=None)
+def _rustc_version(rustc_path, modification_time):
+    return subprocess.check_output([rustc_path, '--version']).decode().strip()
+
+def rustc_version(rustc='rustc'):
+    # Asking rustc costs a process spawn; asking the filesystem whether
+    # rustc has been upgraded since we last asked is much cheaper.
+    rustc_path = shutil.which(rustc)
+    if rustc_path is None:
+        raise FileNotFoundError("no {!r} on the PATH".format(rustc))
+    return _rustc_version(rustc_path, os.stat(rustc_path).st_mtime_ns)
+
+
+class CompileCache:
+    """A ccache-style store of executables that rustc has already built,
+    keyed by everything that could make rustc's output differ.
+
+    Entries are plain files named after their key; an entry's mtime
+    records when it was last used, and when the cache grows past its
+    size limit, the least-recently-used entries are evicted.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIRECTORY,
+                 size_limit=DEFAULT_SIZE_LIMIT):
+        self.directory = directory
+        self.size_limit = size_limit
+
+    @staticmethod
+    def key(generated_code_digest, prelude, rustc_arguments, rustc_version):
+        hasher = hashlib.sha256()
+        for ingredient in ([generated_code_digest, prelude, rustc_version] +
+                           list(rustc_arguments)):
+            encoded = ingredient.encode('utf8')
+            # length-prefix each ingredient so that no two different
+            # lists of ingredients can run together into the same bytes
+            hasher.update(str(len(encoded)).encode('ascii') + b':')
+            hasher.update(encoded)
+        return hasher.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def fetch(self, key, destination):
+        """Put the cached executable for `key` at `destination`, returning
+        whether there was one."""
+        entry = self.entry_path(key)
+        # (Another compilation's `store` can evict the entry at any
+        # moment—even between our finding it and our taking it—which
+        # is as good as its never having been there.)
+        try:
+            os.utime(entry)  # most recently used!
+            if os.path.lexists(destination):
+                os.unlink(destination)
+            try:
+                os.link(entry, destination)
+            except FileNotFoundError:
+                raise
+            except OSError:
+                # (different filesystem, or one that doesn't do hard links)
+                shutil.copy2(entry, destination)
+        except FileNotFoundError:
+            logger.debug("compile cache miss for %s", key)
+            return False
+        logger.debug("compile cache hit for %s", key)
+        return True
+
+    def store(self, key, executable):
+        entry = self.entry_path(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        # Copy to a temporary name and then rename into place, so that a
+        # concurrent `fetch` never sees a partially-written entry.
+        descriptor, provisional = tempfile.mkstemp(
+            dir=os.path.dirname(entry))
+        os.close(descriptor)
+        try:
+            shutil.copy2(executable, provisional)
+            os.replace(provisional, entry)
+        except BaseException:
+            os.unlink(provisional)
+            raise
+        os.utime(entry)
+        self.evict()
+
+    def entries(self):
+        for subdirectory, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = os.path.join(subdirectory, filename)
+                try:
+                    status = os.stat(path)
+                except FileNotFoundError:
+                    continue  # someone else evicted it first
+                yield status.st_mtime, status.st_size, path
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= self.size_limit:
+                break
+            logger.debug("evicting %s from compile cache", path)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
@@ -0,0 +1,54 @@
+import json
+import os
+import socket
+
+# This module is imported by every `glitteralc` invocation, so it (and
+# everything it imports) had better be cheap to import: the whole point
+# of a compile server is that its clients don't have to load the
+# compiler themselves.
+
+DEFAULT_SOCKET_PATH = os.path.join(
+    os.environ.get('XDG_RUNTIME_DIR') or os.environ.get('TMPDIR') or "/tmp",
+    "glitteral-{}.sock".format(os.getuid()))
+
+# The protocol: the client sends one line of JSON (the keyword arguments
+# for `driver.compile_program`), and the server answers with lines of
+# JSON, each either `{"stdout": text}` or `{"stderr": text}` (to be
+# written to the client's corresponding stream), finishing with
+# `{"exit_code": n}`. If the server's copy of the compiler is out of
+# date, it answers `{"stale": true}` instead (and shuts down), and the
+# client compiles in-process.
+
+
+def server_is_listening(socket_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return False
+        return True
+
+
+def request_compilation(request, out, err, socket_path=DEFAULT_SOCKET_PATH):
+    """Ask the compile server to carry out `request`, writing its output
+    to `out` and `err` and returning the exit code—or None if there's no
+    server (or only a stale one) to ask, in which case nothing has been
+    written."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            connection.connect(socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return None
+        connection.sendall((json.dumps(request) + "\n").encode('utf8'))
+        for line in connection.makefile('rb'):
+            response = json.loads(line.decode('utf8'))
+            if 'stdout' in response:
+                out.write(response['stdout'])
+            elif 'stderr' in response:
+                err.write(response['stderr'])
+            elif 'exit_code' in response:
+                return response['exit_code']
+            elif response.get('stale'):
+                return None
+    err.write("compile server hung up without finishing\n")
+    return 1
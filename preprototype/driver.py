@@ -0,0 +1,348 @@
+import contextlib
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import sys
+import traceback
+
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
+
+from lexer import lex
+from parser import parse
+from annotator import annotate, Compilation
+from parallel import parse_in_parallel
+from backend import generate_code_stream, load_prelude
+from cache import (CompileCache, rustc_version,
+                   DEFAULT_CACHE_DIRECTORY, DEFAULT_SIZE_LIMIT)
+from instrumentation import count_nodes
+from utils import LookaheadStream, oxford_series
+
+import astcache
+
+
+# what `compile_program` can compile a program to
+EMITS = ['executable', 'rust', 'ast']
+
+RUSTC_ALLOWANCES = [
+    '--allow', "dead_code",
+    '--allow', "non_snake_case",
+    '--allow', "unused_variables",
+    '--allow', "unused_assignments",
+    '--allow', "unused_imports",
+    '--allow', "unused_mut",
+    '--allow', "unused_parens",
+]
+
+def frontend(source_file, compilation, instruments=None, jobs=None):
+    """The annotated top-level forms of the program in `source_file`
+    (lexed and parsed in chunks by up to `jobs` processes, if `jobs`—see
+    parallel.py)."""
+    if jobs is not None:
+        # (which needs the whole program at once, to cut it up)
+        forms = parse_in_parallel(''.join(source_file), jobs)
+        if instruments is None:
+            return annotate(forms, compilation)
+        # (the lexing happens in the workers, where we can't time it)
+        forms = instruments.stage('parse', forms, counted='forms')
+    elif instruments is None:
+        return annotate(parse(lex(source_file)), compilation)
+    else:
+        tokens = LookaheadStream(instruments.stage(
+            'lex', lex(source_file), counted='tokens'))
+        forms = instruments.stage('parse', parse(tokens), counted='forms')
+    return instruments.stage('annotate', annotate(forms, compilation),
+                             count=count_nodes)
+
+def emit_rust(forms, compilation, code_file, instruments=None):
+    """Write the Rust for the annotated top-level `forms` to `code_file`,
+    returning a digest of what was written."""
+    # Each top-level form is lexed, parsed, annotated, and written out
+    # before the next one is read, so memory use is bounded by the
+    # largest form rather than by the size of the program.
+    hasher = hashlib.sha256()
+    chunks = generate_code_stream(forms, compilation)
+    if instruments is not None:
+        chunks = instruments.stage('generate', chunks, counted='chunks')
+        instruments.enter('emit')
+    try:
+        for chunk in chunks:
+            code_file.write(chunk)
+            hasher.update(chunk.encode('utf8'))
+    finally:
+        if instruments is not None:
+            instruments.exit()
+    return hasher.hexdigest()
+
+def compile_to_rust(source_file, code_file, instruments=None,
+                    optimization_level=0, unbuffered=False):
+    """Write the Rust for `source_file` to `code_file`, returning a digest
+    of what was written."""
+    compilation = Compilation(optimization_level, unbuffered)
+    return emit_rust(frontend(source_file, compilation, instruments),
+                     compilation, code_file, instruments)
+
+def annotated_forms(source_path, compilation, use_cache=True,
+                    instruments=None, frontend_jobs=None):
+    """The annotated top-level forms of the program at `source_path`, from
+    the AST cache if they're there (and `use_cache`)."""
+    if not use_cache:
+        with open(source_path) as source_file:
+            yield from frontend(source_file, compilation, instruments,
+                                frontend_jobs)
+        return
+    forms, hit = astcache.cached_forms(
+        source_path, compilation,
+        lambda source_file: frontend(source_file, compilation, instruments,
+                                     frontend_jobs))
+    if instruments is not None:
+        instruments.counts['ast_cache_hits' if hit
+                           else 'ast_cache_misses'] += 1
+        # (on a miss, the frontend's phases are charged as usual, and only
+        # the writing of the cache file to this one)
+        forms = instruments.stage('ast_cache', forms)
+    yield from forms
+
+def intermediate_path(source_path):
+    source_directory, source_filename = os.path.split(source_path)
+    return os.path.join(source_directory,
+                        "__{}_compiled.rs".format(source_filename))
+
+def write_rust(source_path, use_cache=True, instruments=None,
+               frontend_jobs=None, optimization_level=0, unbuffered=False):
+    """Write the Rust for the program at `source_path` alongside it,
+    returning a digest of what was written."""
+    compilation = Compilation(optimization_level, unbuffered)
+    with open(intermediate_path(source_path), 'w') as code_file:
+        return emit_rust(annotated_forms(source_path, compilation,
+                                         use_cache, instruments,
+                                         frontend_jobs),
+                         compilation, code_file, instruments)
+
+def write_ast(source_path, use_cache=True):
+    """Write the AST cache file for the program at `source_path` alongside
+    it (unless the one that's already there is good and `use_cache`)."""
+    compilation = Compilation()
+    forms, _ = astcache.cached_forms(
+        source_path, compilation,
+        lambda source_file: frontend(source_file, compilation),
+        reuse=use_cache)
+    for _ in forms:
+        pass
+
+def emit_ast(source_path, binary_file, use_cache=True, frontend_jobs=None):
+    """Write the annotated AST of the program at `source_path` to
+    `binary_file`, in the AST cache format (see astcache.py)."""
+    cache_file = (astcache.open_cache(source_path,
+                                      astcache.source_digest(source_path))
+                  if use_cache else None)
+    if cache_file is not None:
+        with cache_file:
+            cache_file.seek(0)
+            shutil.copyfileobj(cache_file, binary_file)
+        return
+    compilation = Compilation()
+    written = io.BytesIO()  # (the digests in the header need seeking)
+    for _ in astcache.dump_ast(
+            source_path,
+            lambda source_file: frontend(source_file, compilation,
+                                         jobs=frontend_jobs),
+            written):
+        pass
+    binary_file.write(written.getvalue())
+
+def build_executable(source_path, generated_code_digest, use_cache=True,
+                     cache_directory=DEFAULT_CACHE_DIRECTORY,
+                     cache_size_limit=DEFAULT_SIZE_LIMIT,
+                     capture_rustc_output=False, instruments=None):
+    """Turn the Rust that `write_rust` wrote into an executable, returning
+    rustc's exit code and (if `capture_rustc_output`) what it had to say
+    for itself."""
+    source_directory, source_filename = os.path.split(source_path)
+    output_name = source_filename[:-6]  # less ".gltrl"
+    rustc_arguments = RUSTC_ALLOWANCES + ['--crate-name', output_name]
+    executable_path = os.path.join(source_directory, output_name)
+    if use_cache:
+        cache = CompileCache(cache_directory, cache_size_limit)
+        cache_key = cache.key(generated_code_digest, load_prelude(),
+                              rustc_arguments, rustc_version())
+        if cache.fetch(cache_key, executable_path):
+            if instruments is not None:
+                instruments.counts['compile_cache_hits'] += 1
+            return 0, ''
+
+    if os.path.exists(executable_path):
+        # If this is a hard link into the cache from an earlier hit, we
+        # don't want rustc writing through it.
+        os.unlink(executable_path)
+    rustc_command = (['rustc'] + rustc_arguments +
+                     ['--out-dir', source_directory or os.curdir,
+                      intermediate_path(source_path)])
+    with (instruments.phase('rustc') if instruments is not None
+          else contextlib.nullcontext()):
+        if capture_rustc_output:
+            rustc = subprocess.run(rustc_command, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+            exit_code = rustc.returncode
+            rustc_output = rustc.stdout.decode('utf8', errors='replace')
+        else:
+            exit_code = subprocess.call(rustc_command)
+            rustc_output = ''
+    if exit_code == 0 and use_cache:
+        cache.store(cache_key, executable_path)
+    return exit_code, rustc_output
+
+def compile_program(source_path, emit='executable', use_cache=True,
+                    cache_directory=DEFAULT_CACHE_DIRECTORY,
+                    cache_size_limit=DEFAULT_SIZE_LIMIT,
+                    out=None, err=None, capture_rustc_output=False,
+                    instruments=None, frontend_jobs=None,
+                    optimization_level=0, unbuffered=False):
+    """Compile the Glitteral program at `source_path` to whichever of
+    `EMITS` `emit` says (printing the Rust or the AST rather than
+    leaving it alongside the program), returning an exit code.
+
+    Our own output goes to `out` and `err` (standard output and error by
+    default); rustc's diagnostics go straight to our standard error,
+    unless `capture_rustc_output` says to collect them and write them to
+    `err` too (as the compile server must, having no terminal of its own).
+    Given `instruments` (see instrumentation.py), each phase of the
+    compilation is charged to them. Given `frontend_jobs`, the program
+    is lexed and parsed in that many processes (see parallel.py). The
+    `optimization_level` is as in optimizer.py; an `unbuffered` program
+    flushes its output after every print.
+    """
+    out = out if out is not None else sys.stdout
+    err = err if err is not None else sys.stderr
+
+    if not source_path.endswith(".gltrl"):
+        out.write("Glitteral source files must have the .gltrl extension.\n")
+        return 1
+
+    if emit == 'rust':
+        compilation = Compilation(optimization_level, unbuffered)
+        emit_rust(annotated_forms(source_path, compilation, use_cache,
+                                  instruments, frontend_jobs),
+                  compilation, out, instruments)
+        out.write("\n")
+        return 0
+
+    if emit == 'ast':
+        # (which is binary, so it can't go through the compile server's
+        # JSON lines)
+        out.flush()
+        emit_ast(source_path, out.buffer, use_cache, frontend_jobs)
+        out.buffer.flush()
+        return 0
+
+    exit_code, rustc_output = build_executable(
+        source_path, write_rust(source_path, use_cache, instruments,
+                                frontend_jobs, optimization_level,
+                                unbuffered),
+        use_cache=use_cache, cache_directory=cache_directory,
+        cache_size_limit=cache_size_limit,
+        capture_rustc_output=capture_rustc_output, instruments=instruments)
+    err.write(rustc_output)
+    return exit_code
+
+
+def expand_source_paths(paths):
+    """The given source paths, with directories replaced by the Glitteral
+    source files in them."""
+    expanded = []
+    for path in paths:
+        if os.path.isdir(path):
+            expanded.extend(sorted(
+                os.path.join(path, filename)
+                for filename in os.listdir(path)
+                if filename.endswith(".gltrl")))
+        else:
+            expanded.append(path)
+    return expanded
+
+def _frontend(source_path, emit, use_cache, optimization_level,
+              unbuffered):
+    # (runs in a worker process, so report failure by value rather than
+    # by trying to get a traceback across the process boundary)
+    try:
+        if emit == 'ast':
+            write_ast(source_path, use_cache)
+            return '', ''
+        return write_rust(source_path, use_cache,
+                          optimization_level=optimization_level,
+                          unbuffered=unbuffered), ''
+    except Exception:
+        return None, traceback.format_exc()
+
+def compile_batch(source_paths, jobs=None, emit='executable', use_cache=True,
+                  cache_directory=DEFAULT_CACHE_DIRECTORY,
+                  cache_size_limit=DEFAULT_SIZE_LIMIT, out=None, err=None,
+                  optimization_level=0, unbuffered=False):
+    """Compile many programs at once, returning the exit code of the
+    first of them to fail (if any do; otherwise, 0).
+
+    Frontends run in a pool of `jobs` processes (the GIL being what it
+    is), and each program's rustc starts as soon as its Rust is written,
+    with up to `jobs` of them running at a time. When emitting Rust or
+    the AST, each program's is left alongside it rather than printed.
+    """
+    out = out if out is not None else sys.stdout
+    err = err if err is not None else sys.stderr
+    jobs = jobs or os.cpu_count()
+
+    exit_codes = {}
+
+    def report(source_path, exit_code, diagnostics):
+        exit_codes[source_path] = exit_code
+        out.write("{}: {}\n".format(source_path,
+                                    "ok" if exit_code == 0 else "FAILED"))
+        out.flush()
+        err.write(diagnostics)
+
+    source_paths = list(dict.fromkeys(source_paths))  # (sans duplicates)
+    for source_path in source_paths:
+        if not source_path.endswith(".gltrl"):
+            report(source_path, 1, "Glitteral source files must have the "
+                                   ".gltrl extension.\n")
+    source_paths = [source_path for source_path in source_paths
+                    if source_path not in exit_codes]
+
+    with ProcessPoolExecutor(max_workers=jobs) as frontends, \
+         ThreadPoolExecutor(max_workers=jobs) as rustcs:
+        frontend_futures = {
+            frontends.submit(_frontend, source_path, emit, use_cache,
+                             optimization_level, unbuffered):
+            source_path for source_path in source_paths}
+        build_futures = {}
+        for future in as_completed(frontend_futures):
+            source_path = frontend_futures[future]
+            generated_code_digest, failure = future.result()
+            if generated_code_digest is None:
+                report(source_path, 1, failure)
+            elif emit != 'executable':
+                report(source_path, 0, '')
+            else:
+                build_futures[rustcs.submit(
+                    build_executable, source_path, generated_code_digest,
+                    use_cache=use_cache, cache_directory=cache_directory,
+                    cache_size_limit=cache_size_limit,
+                    capture_rustc_output=True)] = source_path
+        for future in as_completed(build_futures):
+            try:
+                exit_code, rustc_output = future.result()
+            except Exception:
+                exit_code, rustc_output = 1, traceback.format_exc()
+            report(build_futures[future], exit_code, rustc_output)
+
+    failures = [source_path for source_path in exit_codes
+                if exit_codes[source_path] != 0]
+    out.write("compiled {} of {} programs".format(
+        len(exit_codes) - len(failures), len(exit_codes)))
+    if failures:
+        out.write("; failed: {}".format(oxford_series(failures)))
+    out.write("\n")
+    # (not the greatest, a rustc killed by a signal having a negative one)
+    return next((exit_code for exit_code in exit_codes.values()
+                 if exit_code != 0), 0)
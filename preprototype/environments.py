@@ -0,0 +1,215 @@
+from collections.abc import Mapping
+from types import MappingProxyType
+
+
+class Environment(Mapping):
+    """A frame of bindings chained onto an (optional) enclosing frame.
+
+    Frames are shared rather than copied: every child of a node that
+    doesn't introduce any bindings of its own gets the very same
+    `Environment` object, and a node that does introduce bindings gets
+    a new frame whose parent is the old one. Consequently, assigning to
+    a frame that has already been handed out is visible to everyone
+    holding it; to bind a name for just one node, give that node an
+    `extended` frame instead.
+    """
+
+    def __init__(self, bindings=None, parent=None):
+        self.bindings = bindings if bindings is not None else {}
+        self.parent = parent
+
+    def extended(self, bindings):
+        return Environment(bindings, parent=self)
+
+    def __getitem__(self, name):
+        frame = self
+        while frame is not None:
+            if name in frame.bindings:
+                return frame.bindings[name]
+            frame = frame.parent
+        raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        self.bindings[name] = value
+
+    def __iter__(self):
+        seen = set()
+        frame = self
+        while frame is not None:
+            for name in frame.bindings:
+                if name not in seen:
+                    seen.add(name)
+                    yield name
+            frame = frame.parent
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return "<{}: {}>".format(self.__class__.__name__, dict(self))
+
+    def __reduce__(self):
+        # (so that parsed ASTs can be pickled, as when they're sent back
+        # from the worker processes of a parallel frontend, or cached)
+        if self is EMPTY_ENVIRONMENT:
+            return _empty_environment, ()
+        return Environment, (self.bindings, self.parent)
+
+
+# What AST nodes start out with until the annotator gives them the
+# environments they'll actually use: there being only one of it, it's
+# read-only (assigning to it raises a `TypeError`), lest a binding made
+# for one node show up in every other. (It has to come back from a
+# pickle as the very same object, not a copy.)
+EMPTY_ENVIRONMENT = Environment(MappingProxyType({}))
+
+def _empty_environment():
+    return EMPTY_ENVIRONMENT
+
+
+# The global environment is a persistent hash array mapped trie
+# (HAMT): "modifying" it makes a new trie that shares all but the
+# handful of nodes along the path to the modified key with the old
+# one. That way, every node in the AST can hold on to the version of
+# the global environment that was current when it was annotated
+# without our having to copy anything, and versions that nobody holds
+# on to anymore get garbage-collected like anything else.
+
+HASH_BITS = 64
+BRANCH_BITS = 5
+BRANCH_MASK = (1 << BRANCH_BITS) - 1
+
+
+def _population(bitmap):
+    return bin(bitmap).count('1')
+
+
+class _TrieNode:
+    __slots__ = ('bitmap', 'items')
+
+    def __init__(self, bitmap, items):
+        # `items` is a tuple of children, one per set bit of `bitmap`; a
+        # child is either another node or a (key, value) pair
+        self.bitmap = bitmap
+        self.items = items
+
+
+class _CollisionNode:
+    __slots__ = ('items',)
+
+    def __init__(self, items):
+        # (key, value) pairs whose keys' hashes agree in every bit
+        self.items = items
+
+
+def _key_hash(key):
+    return hash(key) & ((1 << HASH_BITS) - 1)
+
+def _pair_node(shift, first_pair, first_hash, second_pair, second_hash):
+    if shift >= HASH_BITS:
+        return _CollisionNode((first_pair, second_pair))
+    first_fragment = (first_hash >> shift) & BRANCH_MASK
+    second_fragment = (second_hash >> shift) & BRANCH_MASK
+    if first_fragment == second_fragment:
+        return _TrieNode(
+            1 << first_fragment,
+            (_pair_node(shift + BRANCH_BITS, first_pair, first_hash,
+                        second_pair, second_hash),))
+    items = ((first_pair, second_pair) if first_fragment < second_fragment
+             else (second_pair, first_pair))
+    return _TrieNode((1 << first_fragment) | (1 << second_fragment), items)
+
+def _associate(node, shift, key_hash, key, value):
+    """Return a version of `node` with `key` bound to `value`, and
+    whether `key` was newly added."""
+    if isinstance(node, _CollisionNode):
+        for i, (existing_key, _) in enumerate(node.items):
+            if existing_key == key:
+                return _CollisionNode(
+                    node.items[:i] + ((key, value),) +
+                    node.items[i+1:]), False
+        return _CollisionNode(node.items + ((key, value),)), True
+
+    bit = 1 << ((key_hash >> shift) & BRANCH_MASK)
+    index = _population(node.bitmap & (bit - 1))
+    if not node.bitmap & bit:
+        return _TrieNode(
+            node.bitmap | bit,
+            node.items[:index] + ((key, value),) + node.items[index:]
+        ), True
+
+    item = node.items[index]
+    if isinstance(item, tuple):
+        existing_key, existing_value = item
+        if existing_key == key:
+            replacement, added = (key, value), False
+        else:
+            replacement, added = _pair_node(
+                shift + BRANCH_BITS, item, _key_hash(existing_key),
+                (key, value), key_hash), True
+    else:
+        replacement, added = _associate(item, shift + BRANCH_BITS,
+                                        key_hash, key, value)
+    return _TrieNode(
+        node.bitmap,
+        node.items[:index] + (replacement,) + node.items[index+1:]
+    ), added
+
+def _walk(node):
+    for item in node.items:
+        if isinstance(item, tuple):
+            yield item
+        else:
+            yield from _walk(item)
+
+
+class PersistentEnvironment(Mapping):
+    """An immutable mapping whose `bind` method returns a new mapping
+    (sharing structure with the old one) rather than modifying it."""
+
+    __slots__ = ('root', 'count')
+
+    def __init__(self, bindings=None, *, _root=None, _count=0):
+        self.root = _root if _root is not None else _TrieNode(0, ())
+        self.count = _count
+        if bindings:
+            for key, value in bindings.items():
+                self.root, added = _associate(self.root, 0, _key_hash(key),
+                                              key, value)
+                self.count += added
+
+    def bind(self, key, value):
+        root, added = _associate(self.root, 0, _key_hash(key), key, value)
+        return PersistentEnvironment(_root=root, _count=self.count + added)
+
+    def __getitem__(self, key):
+        key_hash = _key_hash(key)
+        node = self.root
+        shift = 0
+        while True:
+            if isinstance(node, _CollisionNode):
+                for existing_key, value in node.items:
+                    if existing_key == key:
+                        return value
+                raise KeyError(key)
+            bit = 1 << ((key_hash >> shift) & BRANCH_MASK)
+            if not node.bitmap & bit:
+                raise KeyError(key)
+            item = node.items[_population(node.bitmap & (bit - 1))]
+            if isinstance(item, tuple):
+                if item[0] == key:
+                    return item[1]
+                raise KeyError(key)
+            node = item
+            shift += BRANCH_BITS
+
+    def __iter__(self):
+        for key, _ in _walk(self.root):
+            yield key
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return "<{} of {} bindings>".format(self.__class__.__name__,
+                                            self.count)
@@ -0,0 +1,612 @@
+from collections import namedtuple
+
+from annotator import (Compilation, propogate_environments,
+                       restore_global_environments, IterInto)
+from lexer import (Lexer, TokenizingException, AbstractDent, Dedent,
+                   Identifier)
+from parser import (parse_expression, ParsingException, Definition,
+                    NamedFunctionDefinition, IdentifierAtom, Argument,
+                    BuiltinAtom)
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+
+# An editor wants to hear about a program after every keystroke, and
+# running the whole of `lex` → `parse` → `annotate` over a big program
+# that often is out of the question. So a `Document` remembers, for
+# every line, the tokens it lexed to and the state the lexer was in at
+# the start of it (the indentation level, the delimiter stack, and the
+# newline carried over from the line before, which is all the lexer
+# carries between lines), and, for every top-level form, where its
+# tokens start and stop and what it parsed and annotated to. After an
+# edit,
+#
+#  • lexing starts again at the first edited line, from the state saved
+#    there, and stops at the first line past the edit whose starting
+#    state is what it was before (after which every line would lex just
+#    as it did before);
+#  • parsing starts again at the top-level form that the first edited
+#    line belongs to, and stops at the first form past the re-lexed
+#    lines that starts where some old form started (after which every
+#    form would parse just as it did before);
+#  • the re-parsed forms are annotated starting from the global
+#    environment as it was after the last untouched form, and if they
+#    bind different names than the forms they replace did, the later
+#    forms' diagnostics are rechecked for those names (their global
+#    environments are only brought up to date—see
+#    `restore_global_environments`—when someone looks something up).
+#
+# (Later forms aren't re-annotated when the names bound haven't
+# changed, so the values in their global environments can be the
+# previous versions of the re-parsed definitions—but which names are
+# bound, which is what diagnostics and lookups care about, is always
+# current.)
+
+LexerState = namedtuple('LexerState',
+                        ('indentation_level', 'delimiter_stack', 'carry'))
+INITIAL_LEXER_STATE = LexerState(0, (), '')
+
+# (lines are counted from 0, and columns in characters from 0, with
+# `end_column` exclusive)
+Diagnostic = namedtuple('Diagnostic',
+                        ('line', 'start_column', 'end_column', 'message'))
+Location = namedtuple('Location', ('line', 'start_column', 'end_column'))
+Resolution = namedtuple('Resolution', ('name', 'kind', 'definition'))
+
+
+def split_lines(text):
+    """`text`'s lines, each with its newline—except the last, which has
+    none (and so is empty if `text` ends in a newline)."""
+    pieces = text.split('\n')
+    return [piece + '\n' for piece in pieces[:-1]] + [pieces[-1]]
+
+
+class FormRecord:
+    __slots__ = ('start', 'stop', 'last_line', 'node', 'error',
+                 'environment_before', 'environment_after', 'bindings',
+                 'referenced', 'undefined')
+
+    def __init__(self, start, stop, last_line=None):
+        # `start` is the (line, index) of the form's first token, `stop`
+        # the (line, index) just past its last token (on the same line
+        # as it, even if it's the last token on its line), and
+        # `last_line` the last line that how it parsed depended on
+        # (which, for a form that failed to parse, is wherever parsing
+        # recovered)
+        self.start = start
+        self.stop = stop
+        self.last_line = last_line if last_line is not None else stop[0]
+        self.node = None
+        # (line, index) of the token that parsing or annotation gave up
+        # at, and why
+        self.error = None
+        self.environment_before = None
+        self.environment_after = None
+        # (name, kind) for each global binding the form makes, in order
+        self.bindings = ()
+        self.referenced = frozenset()
+        self.undefined = frozenset()
+
+    def shift(self, delta):
+        self.start = (self.start[0] + delta, self.start[1])
+        self.stop = (self.stop[0] + delta, self.stop[1])
+        self.last_line += delta
+        if self.error is not None:
+            (line, index), message = self.error
+            self.error = (line + delta, index), message
+
+    def __repr__(self):
+        return "<{}: {}–{}: {}>".format(self.__class__.__name__, self.start,
+                                        self.stop, self.node or self.error)
+
+
+class _TokenCursor:
+    # a token stream (with the `peek` and `pop` that the parser wants)
+    # over a document's lines' tokens, that knows where in the document
+    # it is
+    def __init__(self, line_tokens, position):
+        self.line_tokens = line_tokens
+        self.line, self.index = position
+        self.last_popped = None
+        self._settle()
+
+    def _settle(self):
+        while (self.line < len(self.line_tokens) and
+               self.index >= len(self.line_tokens[self.line])):
+            self.line += 1
+            self.index = 0
+
+    @property
+    def position(self):
+        return self.line, self.index
+
+    def at_end(self):
+        return self.line >= len(self.line_tokens)
+
+    def peek(self):
+        if self.at_end():
+            raise StopIteration
+        return self.line_tokens[self.line][self.index]
+
+    def pop(self):
+        token = self.peek()
+        self.last_popped = self.position
+        self.index += 1
+        self._settle()
+        return token
+
+    def __iter__(self):
+        return self
+
+    __next__ = pop
+
+
+def _preorder(expression):
+    # (in the same order that the annotator visits nodes)
+    stack = [expression]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.children))
+
+def _identifier_nodes(expression):
+    # the nodes that the identifiers in `expression` were parsed into, in
+    # the order that the identifiers come in the source (which is
+    # preorder, but for a function definition's name and arguments,
+    # which aren't among its children)
+    stack = [expression]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, NamedFunctionDefinition):
+            yield node.name
+            yield from node.arguments
+        elif isinstance(node, IdentifierAtom):
+            yield node
+        stack.extend(reversed(node.children))
+
+def _bisect_forms(forms, value, attribute, lo=0, right=False):
+    # `bisect.bisect_left` (or `bisect_right`) of `value` among the forms'
+    # `attribute`s (which `bisect` can only be told to look at with the
+    # `key` argument that it doesn't have before Python 3.10)
+    hi = len(forms)
+    while lo < hi:
+        middle = (lo + hi) // 2
+        found = getattr(forms[middle], attribute)
+        if found < value or (right and found == value):
+            lo = middle + 1
+        else:
+            hi = middle
+    return lo
+
+def _survey(form, overridden=frozenset(), defined=None):
+    """The global bindings that annotated `form` makes, in order; the
+    names it refers to; and those of them that aren't in the
+    environments the annotator gave them.
+
+    Whether the names in `overridden` are globally defined is decided
+    not by the global environments in `form` (which might be out of
+    date) but by whether they're in the set `defined` (which gets the
+    form's own bindings of them added as we go).
+    """
+    bindings = []
+    referenced = set()
+    undefined = set()
+    for node in _preorder(form):
+        if isinstance(node, Definition):
+            bindings.append((node.identifier.value, 'definition'))
+        elif isinstance(node, NamedFunctionDefinition):
+            bindings.append((node.name.value, 'function'))
+        elif (isinstance(node, IdentifierAtom) and
+              not isinstance(node, Argument)):
+            name = node.value
+            referenced.add(name)
+            if name in node.local_environment:
+                continue
+            if name in overridden:
+                if name not in defined:
+                    undefined.add(name)
+            elif name not in node.global_environment:
+                undefined.add(name)
+            continue
+        else:
+            continue
+        if bindings[-1][0] in overridden:
+            defined.add(bindings[-1][0])
+    return tuple(bindings), frozenset(referenced), frozenset(undefined)
+
+
+class Document:
+    """A Glitteral program being edited, kept lexed, parsed, and annotated
+    as it changes."""
+
+    def __init__(self, text=''):
+        self._lexer = Lexer()
+        self.lines = split_lines(text)
+        self.line_states = [INITIAL_LEXER_STATE]
+        self.line_tokens = [[]]
+        self.line_errors = [None]
+        self.forms = []
+        # forms from this one on might not have up-to-date global
+        # environments (see `_restore_through`)
+        self._stale_from = 0
+        # and the names that have been bound differently since they went
+        # stale
+        self._stale_names = set()
+        self._relex(0, len(self.lines), len(self.lines) - 1)
+        self._reparse(0, len(self.lines) - 1, 0)
+
+    @property
+    def text(self):
+        return ''.join(self.lines)
+
+    def edit(self, start, end, new_text):
+        """Replace the text from `start` up to `end` (both (line, column)
+        pairs) with `new_text`."""
+        (start_line, start_column), (end_line, end_column) = start, end
+        if end_line >= len(self.lines):
+            end_line = len(self.lines) - 1
+            end_column = len(self.lines[end_line])
+        edited = (self.lines[start_line][:start_column] + new_text +
+                  self.lines[end_line][end_column:])
+        new_lines = split_lines(edited)
+        if end_line != len(self.lines) - 1:
+            # (`edited` ended with the newline of `end_line`, so the
+            # "last line" of it is really the start of the next line)
+            new_lines.pop()
+        self.lines[start_line:end_line + 1] = new_lines
+        delta = len(new_lines) - (end_line + 1 - start_line)
+        last_relexed_line = self._relex(start_line, len(new_lines), delta)
+        self._reparse(start_line, last_relexed_line, delta)
+
+    def _lex_line(self, state, line, is_last):
+        lexer = self._lexer
+        lexer.indentation_level, delimiter_stack, carry = state
+        lexer.delimiter_stack = list(delimiter_stack)
+        lexer.source = carry + line + ('█' if is_last else '')
+        lexer.candidate_start = 0
+        lexer.tokens = []
+        lexer.lines = iter(())  # (for `_runs_off_the_end`)
+        error = None
+        try:
+            if lexer.tokenize_buffer():
+                carry = lexer.source[lexer.candidate_start:]
+            else:
+                # (`lex` would quietly drop the rest of the program, which
+                # is no way to treat someone in the middle of typing)
+                error = "unterminated string literal"
+        except TokenizingException as exception:
+            error = str(exception)
+        if error is not None:
+            carry = '\n' if line.endswith('\n') else ''
+        return (lexer.tokens, error,
+                LexerState(lexer.indentation_level,
+                           tuple(lexer.delimiter_stack), carry))
+
+    def _relex(self, first_line, edited_line_count, delta):
+        """Lex the `edited_line_count` lines starting at `first_line`, and
+        after them as many lines as it takes to get back in step with how
+        the document lexed before the edit (which shifted the lines after
+        the edited ones by `delta`), returning the last line lexed."""
+        old_states = self.line_states
+        state = old_states[first_line]
+        states, tokens, errors = [], [], []
+        line = first_line
+        while line < len(self.lines):
+            if (line >= first_line + edited_line_count and
+                    state == old_states[line - delta]):
+                break
+            line_tokens, error, next_state = self._lex_line(
+                state, self.lines[line], line == len(self.lines) - 1)
+            states.append(state)
+            tokens.append(line_tokens)
+            errors.append(error)
+            state = next_state
+            line += 1
+        old_stop = line - delta
+        self.line_states[first_line:old_stop] = states
+        self.line_tokens[first_line:old_stop] = tokens
+        self.line_errors[first_line:old_stop] = errors
+        logger.debug("re-lexed lines %s through %s", first_line, line - 1)
+        return line - 1
+
+    def _recovery_point(self, after_line):
+        # After a parse error, we pick up again at the first top-level
+        # token on a later line: the first token of a line that starts
+        # outside of any delimiters at the left margin, or the first
+        # after the dedents that bring a line back out to it.
+        for line in range(after_line + 1, len(self.lines)):
+            indentation_level, delimiter_stack, _ = self.line_states[line]
+            if delimiter_stack:
+                continue
+            tokens = self.line_tokens[line]
+            dedents = 0
+            while dedents < len(tokens) and isinstance(tokens[dedents],
+                                                       Dedent):
+                dedents += 1
+            if indentation_level == dedents and dedents < len(tokens):
+                return line, dedents
+        return len(self.lines), 0
+
+    def _parse_form(self, cursor):
+        start = cursor.position
+        try:
+            node = parse_expression(cursor)
+            if isinstance(node, AbstractDent):
+                raise ParsingException("unexpected indentation")
+        except Exception as exception:
+            if cursor.at_end():
+                message = "unexpected end of program ({})".format(
+                    str(exception) or exception.__class__.__name__)
+            else:
+                message = str(exception) or exception.__class__.__name__
+            error_position = cursor.last_popped or start
+            failed_line = max(error_position[0], start[0])
+            recovery_point = self._recovery_point(failed_line)
+            cursor.line, cursor.index = recovery_point
+            cursor._settle()
+            record = FormRecord(
+                start, self._stop_before(recovery_point),
+                min(recovery_point[0], len(self.lines) - 1))
+            record.error = (error_position, message)
+            return record
+        last_line, last_index = cursor.last_popped
+        record = FormRecord(start, (last_line, last_index + 1))
+        record.node = node
+        return record
+
+    def _stop_before(self, position):
+        # just past the last token before `position`
+        line, index = position
+        if index:
+            return line, index
+        line -= 1
+        while line > 0 and not self.line_tokens[line]:
+            line -= 1
+        return line, len(self.line_tokens[line])
+
+    def _annotate(self, record, compilation):
+        record.environment_before = compilation.global_environment
+        if record.node is not None:
+            try:
+                propogate_environments(record.node, compilation)
+            except Exception as exception:
+                compilation.global_environment = record.environment_before
+                record.node = None
+                record.error = (record.start, "couldn't annotate: {}".format(
+                    exception))
+            else:
+                record.bindings, record.referenced, record.undefined = (
+                    _survey(record.node))
+        record.environment_after = compilation.global_environment
+
+    def _restore_through(self, form_index):
+        """Bring the global environments of the forms before `form_index`
+        up to date."""
+        if self._stale_from >= form_index:
+            return
+        compilation = Compilation()
+        if self._stale_from:
+            compilation.global_environment = (
+                self.forms[self._stale_from - 1].environment_after)
+        for record in self.forms[self._stale_from:form_index]:
+            record.environment_before = compilation.global_environment
+            if record.node is not None:
+                restore_global_environments(record.node, compilation)
+            record.environment_after = compilation.global_environment
+        logger.debug("restored global environments of forms %s through %s",
+                     self._stale_from, form_index - 1)
+        self._stale_from = form_index
+        if form_index == len(self.forms):
+            self._stale_names.clear()
+
+    def _reparse(self, first_line, last_relexed_line, delta):
+        # the first form that could have been touched, and where its
+        # predecessor left off
+        first_form = _bisect_forms(self.forms, first_line, 'last_line')
+        self._restore_through(first_form)
+        compilation = Compilation()
+        if first_form:
+            previous = self.forms[first_form - 1]
+            restart = previous.stop
+            compilation.global_environment = previous.environment_after
+        else:
+            restart = (0, 0)
+        untouched_environment = compilation.global_environment
+
+        cursor = _TokenCursor(self.line_tokens, restart)
+        new_forms = []
+        rejoined = len(self.forms)
+        while not cursor.at_end():
+            line, index = cursor.position
+            if line > last_relexed_line:
+                old_start = (line - delta, index)
+                candidate = _bisect_forms(self.forms, old_start, 'start',
+                                          lo=first_form)
+                if (candidate < len(self.forms) and
+                        self.forms[candidate].start == old_start):
+                    rejoined = candidate
+                    break
+            record = self._parse_form(cursor)
+            self._annotate(record, compilation)
+            new_forms.append(record)
+        logger.debug("re-parsed %s forms", len(new_forms))
+
+        later_forms = self.forms[rejoined:]
+        old_bindings = [name for record in self.forms[first_form:rejoined]
+                        for name, _ in record.bindings]
+        new_bindings = [name for record in new_forms
+                        for name, _ in record.bindings]
+        self.forms[first_form:rejoined] = new_forms
+        # (`_restore_through` saw to it that that's no earlier than
+        # `first_form`, and the new forms are up to date)
+        if self._stale_from >= rejoined:
+            self._stale_from += len(new_forms) - (rejoined - first_form)
+        else:
+            self._stale_from = first_form + len(new_forms)
+
+        if delta:
+            for record in later_forms:
+                record.shift(delta)
+        if old_bindings != new_bindings:
+            # The later forms' global environments are out of date now,
+            # but rather than bring them up to date (which takes as long
+            # as annotating them did) on every keystroke of typing a new
+            # definition's name, we only redo their diagnostics for the
+            # names that are bound differently now, and leave the rest
+            # until someone wants to look something up in them.
+            self._stale_from = min(self._stale_from,
+                                   first_form + len(new_forms))
+            changed = set(old_bindings) ^ set(new_bindings)
+            # (including names changed by earlier edits, which stale
+            # global environments are also wrong about)
+            self._stale_names |= changed
+            overridden = frozenset(self._stale_names)
+            defined = {name for name in overridden
+                       if name in compilation.global_environment}
+            # A changed name's being defined or not can only have changed
+            # for the later forms up to the next one that binds it (and
+            # not at all, if it was bound before the edit anyway).
+            unsettled = {name for name in changed
+                         if name not in untouched_environment}
+            for record in later_forms:
+                if not unsettled:
+                    break
+                if record.node is None:
+                    continue
+                if record.referenced & unsettled:
+                    _, _, record.undefined = _survey(record.node, overridden,
+                                                     defined)
+                else:
+                    defined.update(name for name, _ in record.bindings
+                                   if name in overridden)
+                unsettled.difference_update(name for name, _ in
+                                            record.bindings)
+
+    def _tokens_between(self, start, stop):
+        line, index = start
+        while (line, index) < stop and line < len(self.lines):
+            tokens = self.line_tokens[line]
+            end = stop[1] if line == stop[0] else len(tokens)
+            for i in range(index, min(end, len(tokens))):
+                yield line, i, tokens[i]
+            line, index = line + 1, 0
+
+    def _location(self, line, token):
+        if token.source is None:
+            # (a dent, which is the line's indentation)
+            text = self.lines[line]
+            return Location(line, 0, len(text) - len(text.lstrip(' ')))
+        # (tokens are spans of their line with the previous line's
+        # carried-over newline in front)
+        column = token.start - len(self.line_states[line].carry)
+        return Location(line, column, column + (token.end - token.start))
+
+    def diagnostics(self):
+        diagnostics = [Diagnostic(line, 0, len(self.lines[line].rstrip('\n')),
+                                  error)
+                       for line, error in enumerate(self.line_errors)
+                       if error is not None]
+        for record in self.forms:
+            if record.error is not None:
+                (line, index), message = record.error
+                tokens = (self.line_tokens[line] if line < len(self.lines)
+                          else [])
+                if index < len(tokens):
+                    location = self._location(line, tokens[index])
+                else:
+                    location = Location(line, 0, 0)
+                diagnostics.append(Diagnostic(*location[:3], message))
+            if record.undefined:
+                for line, _, token in self._tokens_between(record.start,
+                                                           record.stop):
+                    if (isinstance(token, Identifier) and
+                            token.representation in record.undefined):
+                        diagnostics.append(Diagnostic(
+                            *self._location(line, token),
+                            "{} is not defined".format(
+                                token.representation)))
+        return sorted(diagnostics)
+
+    def _form_at(self, position):
+        index = _bisect_forms(self.forms, position, 'start',
+                              right=True) - 1
+        if index >= 0 and position < self.forms[index].stop:
+            return index
+        return None
+
+    def _first_occurrence(self, record, name):
+        for line, _, token in self._tokens_between(record.start, record.stop):
+            if isinstance(token, Identifier) and token.representation == name:
+                return self._location(line, token)
+        return None
+
+    def lookup(self, line, column):
+        """What the identifier at (or just before) `column` of `line`
+        refers to, as a `Resolution`—or `None`, if there's no identifier
+        there or it isn't defined."""
+        if line >= len(self.lines):
+            return None
+        for index, token in enumerate(self.line_tokens[line]):
+            if not isinstance(token, Identifier):
+                continue
+            location = self._location(line, token)
+            if location.start_column <= column <= location.end_column:
+                break
+        else:
+            return None
+        name = token.representation
+        form_index = self._form_at((line, index))
+        if form_index is None:
+            return None
+        self._restore_through(form_index + 1)
+        record = self.forms[form_index]
+        if record.node is None:
+            return None
+
+        # (the identifiers in the form, paired up with the nodes that they
+        # were parsed into, so that the one at the cursor is looked up in
+        # its own environments, and not those of some other node of the
+        # same name that it might be shadowing or be shadowed by)
+        sites = list(zip(
+            ((site_line, site_index) for site_line, site_index, site_token
+             in self._tokens_between(record.start, record.stop)
+             if isinstance(site_token, Identifier)),
+            _identifier_nodes(record.node)))
+        reference = next((node for position, node in sites
+                          if position == (line, index)), None)
+        if isinstance(reference, Argument):
+            return Resolution(name, "argument", self._location(line, token))
+        if reference is None or reference.value != name:
+            return None
+        if (isinstance(record.node, NamedFunctionDefinition) and
+                reference is record.node.name):
+            # (a function's name isn't annotated, being bound by the
+            # definition rather than in it)
+            environment = record.environment_after
+        elif name in reference.local_environment:
+            bound = reference.local_environment[name]
+            # (where it's bound being the argument itself, or the first
+            # identifier that sees the loop index)
+            binding_line, binding_index = next(
+                position for position, node in sites
+                if node is bound or (not isinstance(node, Argument) and
+                                     node.local_environment.get(name)
+                                     is bound))
+            definition = self._location(
+                binding_line, self.line_tokens[binding_line][binding_index])
+            return Resolution(
+                name, "loop index" if isinstance(bound, IterInto)
+                else "argument", definition)
+        else:
+            environment = reference.global_environment
+        if name not in environment:
+            return None
+        if isinstance(environment[name], BuiltinAtom):
+            return Resolution(name, "builtin", None)
+        for binder in reversed(self.forms[:form_index + 1]):
+            for bound_name, kind in binder.bindings:
+                if bound_name == name:
+                    return Resolution(name, kind,
+                                      self._first_occurrence(binder, name))
+        return None
@@ -0,0 +1,269 @@
+from collections import namedtuple
+
+from parser import *  # it's fine
+from annotator import IterInto
+from utils import DispatchTable, get_logger
+
+logger = get_logger(__name__)
+
+
+class TypeInferenceException(Exception):
+    ...
+
+
+# Glitteral's types are few and simple enough that each can be written
+# as a constructor name and a tuple of the types (if any) it's applied
+# to: `Type("list", (INTEGER,))` is a list of integers, and
+# `Type("function", ((argument types...), return type))` a function.
+
+class Type(namedtuple('Type', ('constructor', 'parameters'))):
+    __slots__ = ()
+
+    def __str__(self):
+        if self.constructor == "list":
+            return "^[{}]".format(str(self.parameters[0])[1:])
+        elif self.constructor == "vector":
+            return "^|{}|".format(str(self.parameters[0])[1:])
+        elif self.constructor == "dictionary":
+            return "^{{{} {}}}".format(
+                *(str(parameter)[1:] for parameter in self.parameters))
+        elif self.constructor == "function":
+            arguments, returns = self.parameters
+            return "λ|{}| → {}".format(
+                ' '.join(str(argument) for argument in arguments), returns)
+        elif self.constructor == "void":
+            return "Void"
+        return "^{}".format(self.constructor)
+
+INTEGER = Type("int", ())
+FLOAT = Type("float", ())
+STRING = Type("str", ())
+BOOLEAN = Type("bool", ())
+# (a file mapped into memory: see `MappedFile` in builtins.rs)
+FILE = Type("file", ())
+VOID = Type("void", ())
+
+def list_of(element_type):
+    return Type("list", (element_type,))
+
+def vector_of(element_type):
+    return Type("vector", (element_type,))
+
+def dictionary_of(key_type, value_type):
+    return Type("dictionary", (key_type, value_type))
+
+def function_of(argument_types, return_type):
+    return Type("function", (tuple(argument_types), return_type))
+
+def is_container(glitteral_type):
+    return (glitteral_type is not None and
+            glitteral_type.constructor in ("list", "vector", "dictionary"))
+
+def element_type(container_type):
+    """The type of what you get by subscripting (or iterating over) a
+    container of type `container_type`."""
+    if container_type is None:
+        return None
+    if container_type.constructor in ("list", "vector"):
+        return container_type.parameters[0]
+    if container_type.constructor == "dictionary":
+        return container_type.parameters[1]
+    raise TypeInferenceException(
+        "{} isn't a container".format(container_type))
+
+SPECIFIED_TYPES = {
+    '^int': INTEGER, '^float': FLOAT, '^str': STRING, '^bool': BOOLEAN,
+    '^file': FILE,
+    '^[int]': list_of(INTEGER), '^[str]': list_of(STRING),
+    None: VOID,  # (`→ Void`)
+}
+
+def specified_type(type_specifier_atom):
+    return SPECIFIED_TYPES[type_specifier_atom.value]
+
+def signature(definition):
+    return function_of(
+        (specified_type(argument.type_specifier)
+         for argument in definition.arguments),
+        specified_type(definition.return_type))
+
+
+# What applying each builtin (by the name of the Rust function that
+# implements it) to arguments of the given types returns. (Most
+# builtins only have the one signature, but the arithmetic ones work on
+# any kind of number.)
+
+def _first_argument_type(argument_types):
+    return argument_types[0] if argument_types else None
+
+def _returning(glitteral_type):
+    return lambda argument_types: glitteral_type
+
+BUILTIN_RETURN_TYPES = {
+    'add': _first_argument_type, 'subtract': _first_argument_type,
+    'multiply': _first_argument_type, 'divide': _first_argument_type,
+    'integers_equal': _returning(BOOLEAN),
+    'integers_not_equal': _returning(BOOLEAN),
+    'greater': _returning(BOOLEAN), 'less': _returning(BOOLEAN),
+    'not_greater': _returning(BOOLEAN), 'not_less': _returning(BOOLEAN),
+    'and': _returning(BOOLEAN), 'or': _returning(BOOLEAN),
+    'append': _first_argument_type,
+    'length': _returning(INTEGER),
+    'range': _returning(list_of(INTEGER)),
+    'reverse_range': _returning(list_of(INTEGER)),
+    'step_range': _returning(list_of(INTEGER)),
+    'sleep': _returning(VOID),
+    'current_time': _returning(FLOAT),
+    'instant': _returning(FLOAT), 'elapsed': _returning(FLOAT),
+    'parse_int': _returning(INTEGER), 'parse_float': _returning(FLOAT),
+    'parse_int_or': _returning(INTEGER),
+    'parse_float_or': _returning(FLOAT),
+    'print': _returning(VOID), 'println': _returning(VOID),
+    'println_container': _returning(VOID),
+    'input': _returning(STRING), 'read_all': _returning(STRING),
+    'lines': _returning(list_of(STRING)),
+    'read_file': _returning(STRING), 'write_file': _returning(VOID),
+    'map_file': _returning(FILE), 'file_lines': _returning(list_of(STRING)),
+    'mapped_lines': _returning(list_of(STRING)),
+    'mapped_bytes': _returning(list_of(INTEGER)),
+    'mapped_size': _returning(INTEGER),
+    'flush': _returning(VOID),
+    'get_subscript': lambda argument_types: element_type(
+        _first_argument_type(argument_types)),
+    # (a list of whatever its item is, whatever it started from)
+    'comprehend': lambda argument_types: list_of(argument_types[2]),
+}
+
+
+# How to work out a node's type from its children's (which have always
+# been worked out first: see `infer_form_types`), by the node's type.
+
+TYPE_RULES = DispatchTable("type rule")
+
+@TYPE_RULES.register(IntegerAtom)
+def integer_type(atom):
+    return INTEGER
+
+@TYPE_RULES.register(FloatAtom)
+def float_type(atom):
+    return FLOAT
+
+@TYPE_RULES.register(StringAtom)
+def string_type(atom):
+    return STRING
+
+@TYPE_RULES.register(BooleanAtom)
+def boolean_type(atom):
+    return BOOLEAN
+
+@TYPE_RULES.register(VoidAtom)
+def void_type(atom):
+    return VOID
+
+@TYPE_RULES.register(IdentifierAtom)
+def identifier_type(identifier):
+    binding = identifier.binding
+    if binding is None or binding.kind == "builtin":
+        # (builtins are typed where they're applied)
+        return None
+    if binding.kind == "argument":
+        return specified_type(binding.node.type_specifier)
+    if binding.kind == "loop index":
+        return element_type(binding.node.iterable.inferred_type)
+    return binding.node.inferred_type
+
+@TYPE_RULES.register(Sequential)
+def sequential_type(sequential):
+    if sequential.elements:
+        contents = sequential.elements[0].inferred_type
+    else:
+        # (the only kind of list that `append!` can grow)
+        contents = INTEGER
+    return (vector_of if isinstance(sequential, Vector)
+            else list_of)(contents)
+
+@TYPE_RULES.register(Associative)
+def associative_type(associative):
+    if associative.associations:
+        first = associative.associations[0]
+        return dictionary_of(first.key.inferred_type,
+                             first.value.inferred_type)
+    # (the only kind that there's a way to subscript)
+    return dictionary_of(STRING, INTEGER)
+
+@TYPE_RULES.register(Application)
+def application_type(application):
+    binding = application.function.binding
+    argument_types = [argument.inferred_type
+                      for argument in application.arguments]
+    if binding is not None and binding.kind == "builtin":
+        return BUILTIN_RETURN_TYPES[binding.node.value](argument_types)
+    function_type = application.function.inferred_type
+    if function_type is None or function_type.constructor != "function":
+        raise TypeInferenceException(
+            "{} isn't a function".format(application.function.value))
+    return function_type.parameters[1]
+
+@TYPE_RULES.register(NamedFunctionDefinition)
+def named_function_definition_type(definition):
+    return signature(definition)
+
+@TYPE_RULES.register(Definition)
+def definition_type(definition):
+    # (`identifier_type` couldn't tell, the identifier having been typed
+    # before what it's being defined as)
+    definition.identifier.inferred_type = definition.identified.inferred_type
+    return VOID
+
+@TYPE_RULES.register(Conditional)
+def conditional_type(conditional):
+    if conditional.alternative is None:
+        return VOID
+    return conditional.consequent.inferred_type
+
+@TYPE_RULES.register(DoBlock)
+def do_block_type(block):
+    return block.expressions[-1].inferred_type if block.expressions else VOID
+
+@TYPE_RULES.register(DeterminateIteration)
+def determinate_iteration_type(iteration):
+    # (like the identifier of a definition, the index identifier comes
+    # before what gives it its type)
+    iteration.index_identifier.inferred_type = element_type(
+        iteration.iterable.inferred_type)
+    return VOID
+
+@TYPE_RULES.register(SubscriptAssignment, SingletrackedConditional,
+                     IndeterminateIteration)
+def statement_type(statement):
+    return VOID
+
+@TYPE_RULES.register(object)
+def untyped(node):
+    # (reserved words, type specifiers, and the like, which don't
+    # evaluate to anything)
+    return None
+
+
+def infer_form_types(form):
+    # (after its children, as it were recursively, but with a stack of
+    # our own: see `parser.parse_expression`)
+    unvisited = [(form, False)]
+    while unvisited:
+        node, children_typed = unvisited.pop()
+        if children_typed:
+            if isinstance(node, Expression):
+                node.inferred_type = TYPE_RULES[type(node)](node)
+            continue
+        if isinstance(node, NamedFunctionDefinition):
+            # (before its body, which might call it)
+            node.inferred_type = signature(node)
+        unvisited.append((node, True))
+        unvisited.extend((child, False) for child in reversed(node.children))
+
+def infer_types(expressionstream):
+    """Pass resolved (see `annotator.resolve`) top-level forms through,
+    having given each expression in them its `inferred_type`."""
+    for expression in expressionstream:
+        infer_form_types(expression)
+        yield expression
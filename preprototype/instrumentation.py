@@ -0,0 +1,199 @@
+import cProfile
+import json
+import resource
+import time
+import tracemalloc
+
+from collections import Counter
+
+
+# the compiler's phases, in pipeline order (for reporting purposes)
+PHASES = ['ast_cache', 'lex', 'parse', 'annotate', 'generate', 'emit', 'rustc']
+
+
+class PhaseRecord:
+    def __init__(self):
+        self.wall_seconds = 0.
+        self.cpu_seconds = 0.
+        self.child_cpu_seconds = 0.
+        self.peak_traced_bytes = 0
+
+    def as_dict(self, trace_memory):
+        record = {'wall_seconds': self.wall_seconds,
+                  'cpu_seconds': self.cpu_seconds}
+        if self.child_cpu_seconds:
+            record['child_cpu_seconds'] = self.child_cpu_seconds
+        if trace_memory:
+            record['peak_traced_bytes'] = self.peak_traced_bytes
+        return record
+
+
+def _children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Instruments:
+    """Attributes time (and optionally memory) to the compiler's phases.
+
+    The frontend is a pipeline of generators, so timing the call that
+    kicks it off would charge the whole pipeline to whichever phase
+    happens to be outermost. Instead, every phase is entered and exited
+    as control passes in and out of it (see `stage`), and the clocks are
+    read at each such transition: whatever time elapsed since the last
+    transition is charged to the phase that was running in between.
+
+    Use as a context manager: memory tracing and profiling (if asked
+    for) are on only inside the `with` block.
+    """
+
+    def __init__(self, trace_memory=False, profile_phase=None):
+        self.trace_memory = trace_memory
+        self.profile_phase = profile_phase
+        self.profiler = cProfile.Profile() if profile_phase else None
+        self.phases = {}
+        self.counts = Counter()
+        self._running = []
+        self._last_wall = None
+        self._last_cpu = None
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        self._last_wall = time.perf_counter()
+        self._last_cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.trace_memory:
+            tracemalloc.stop()
+        if self.profiler is not None:
+            self.profiler.disable()
+
+    def _transition(self, entering=None):
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self._running:
+            record = self.phases.setdefault(self._running[-1], PhaseRecord())
+            record.wall_seconds += wall - self._last_wall
+            record.cpu_seconds += cpu - self._last_cpu
+            if self.trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                record.peak_traced_bytes = max(record.peak_traced_bytes,
+                                               peak)
+                tracemalloc.reset_peak()
+        if entering is not None:
+            self._running.append(entering)
+        else:
+            self._running.pop()
+        # (read the clocks again, so that our own bookkeeping isn't
+        # charged to anyone)
+        self._last_wall = time.perf_counter()
+        self._last_cpu = time.thread_time()
+        if (self.profiler is not None and self._running and
+                self._running[-1] == self.profile_phase):
+            self.profiler.enable()
+
+    def enter(self, phase):
+        self._transition(entering=phase)
+
+    def exit(self):
+        self._transition()
+
+    def phase(self, name):
+        return _PhaseContext(self, name)
+
+    def stage(self, name, iterable, counted=None, count=None):
+        """Wrap a lazy pipeline stage so that the work it does while
+        producing each item is charged to `name`, and count the items it
+        produces (as `counted`, if given), or, given `count`, tally up
+        the counts in the dictionaries that `count(item)` returns (this
+        being charged to an "(instrumentation)" phase of its own)."""
+        iterator = iter(iterable)
+        while True:
+            self.enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.exit()
+            if count is None:
+                self.counts[counted or name] += 1
+            else:
+                self.enter('(instrumentation)')
+                try:
+                    for what, amount in count(item).items():
+                        self.counts[what] += amount
+                finally:
+                    self.exit()
+            yield item
+
+    def report(self):
+        phase_names = ([name for name in PHASES if name in self.phases] +
+                       sorted(name for name in self.phases
+                              if name not in PHASES))
+        report = {
+            'phases': {name: self.phases[name].as_dict(self.trace_memory)
+                       for name in phase_names},
+            'counts': dict(self.counts),
+        }
+        return report
+
+    def format_report(self):
+        report = self.report()
+        columns = ["phase", "wall (s)", "CPU (s)"]
+        if self.trace_memory:
+            columns.append("peak traced (KiB)")
+        lines = ["{:<18}{:>12}{:>12}".format(*columns[:3]) +
+                 ("{:>20}".format(columns[3]) if self.trace_memory else '')]
+        for name, record in report['phases'].items():
+            cpu_seconds = record['cpu_seconds'] + record.get(
+                'child_cpu_seconds', 0)
+            line = "{:<18}{:>12.4f}{:>12.4f}".format(
+                name, record['wall_seconds'], cpu_seconds)
+            if self.trace_memory:
+                line += "{:>20.1f}".format(
+                    record['peak_traced_bytes'] / 1024)
+            lines.append(line)
+        for counted, amount in sorted(report['counts'].items()):
+            lines.append("{}: {}".format(counted, amount))
+        return '\n'.join(lines) + '\n'
+
+    def json_report(self):
+        return json.dumps(self.report(), indent=2) + '\n'
+
+    def dump_profile(self, path):
+        self.profiler.dump_stats(path)
+
+
+class _PhaseContext:
+    # for phases that aren't lazy, like running rustc (whose CPU time,
+    # being spent in a child process, is kept track of separately)
+
+    def __init__(self, instruments, name):
+        self.instruments = instruments
+        self.name = name
+
+    def __enter__(self):
+        self._children_cpu_at_start = _children_cpu_seconds()
+        self.instruments.enter(self.name)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instruments.exit()
+        self.instruments.phases[self.name].child_cpu_seconds += (
+            _children_cpu_seconds() - self._children_cpu_at_start)
+
+
+def count_nodes(expression):
+    """How many nodes there are in the tree rooted at `expression`, in a
+    form that `Instruments.stage` can use as a `count`."""
+    nodes = 0
+    unvisited = [expression]
+    while unvisited:
+        node = unvisited.pop()
+        nodes += 1
+        unvisited.extend(node.children)
+    return {'nodes': nodes}
@@ -0,0 +1,262 @@
+import json
+import sys
+import traceback
+
+from incremental import Document
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+
+# A language server (of the Language Server Protocol that editors speak)
+# over standard input and output: JSON-RPC messages, each preceded by a
+# `Content-Length` header, that keep `incremental.Document`s in step with
+# the editor's buffers and ask them for diagnostics and lookups.
+#
+# Positions in the protocol count columns in UTF-16 code units (as would
+# a JavaScript string), whereas we count characters; for all of the λs
+# and →s in Glitteral, it's only the astral-plane characters (which take
+# two code units each) that make a difference.
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INTERNAL_ERROR = -32603
+SERVER_NOT_INITIALIZED = -32002
+
+ERROR_SEVERITY = 1
+INCREMENTAL_SYNC = 2
+
+
+class ProtocolException(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+def read_message(binary_in):
+    """The next message from `binary_in`, or `None` at the end of input."""
+    content_length = None
+    while True:
+        header = binary_in.readline()
+        if not header:
+            return None
+        header = header.decode('ascii').strip()
+        if not header:
+            break
+        name, _, value = header.partition(':')
+        if name.strip().lower() == 'content-length':
+            content_length = int(value)
+    if content_length is None:
+        raise ProtocolException(INVALID_REQUEST, "no Content-Length header")
+    body = binary_in.read(content_length)
+    if len(body) < content_length:
+        return None
+    try:
+        return json.loads(body.decode('utf8'))
+    except ValueError as error:
+        raise ProtocolException(PARSE_ERROR, str(error))
+
+def write_message(binary_out, message):
+    body = json.dumps(message, ensure_ascii=False).encode('utf8')
+    binary_out.write(
+        "Content-Length: {}\r\n\r\n".format(len(body)).encode('ascii') + body)
+    binary_out.flush()
+
+
+def utf16_column(text, column):
+    return column + sum(1 for character in text[:column]
+                        if ord(character) > 0xFFFF)
+
+def character_column(text, utf16_column):
+    units = 0
+    for column, character in enumerate(text):
+        if units >= utf16_column:
+            return column
+        units += 2 if ord(character) > 0xFFFF else 1
+    return len(text)
+
+
+class LanguageServer:
+
+    def __init__(self, binary_in, binary_out):
+        self.binary_in = binary_in
+        self.binary_out = binary_out
+        self.documents = {}
+        self.initialized = False
+        self.shutting_down = False
+        self.exit_code = None
+
+    def serve(self):
+        """Handle messages until told to exit (or until the input runs
+        out), returning the exit code the protocol calls for."""
+        while self.exit_code is None:
+            try:
+                message = read_message(self.binary_in)
+            except ProtocolException as error:
+                self._respond(None, error=error)
+                continue
+            if message is None:
+                # (the editor went away without so much as an "exit")
+                return 1
+            self.handle(message)
+        return self.exit_code
+
+    def handle(self, message):
+        method = message.get('method')
+        is_request = 'id' in message
+        handler = self.HANDLERS.get(method)
+        try:
+            if handler is None:
+                if not is_request:
+                    # (unknown notifications are to be ignored)
+                    return
+                raise ProtocolException(
+                    METHOD_NOT_FOUND, "unsupported method {}".format(method))
+            if (not self.initialized and
+                    method not in ('initialize', 'exit')):
+                raise ProtocolException(SERVER_NOT_INITIALIZED,
+                                        "not initialized yet")
+            result = handler(self, message.get('params') or {})
+        except ProtocolException as error:
+            if is_request:
+                self._respond(message['id'], error=error)
+            return
+        except Exception as error:
+            logger.error("while handling %s: %s", method,
+                         traceback.format_exc())
+            if is_request:
+                self._respond(message['id'], error=ProtocolException(
+                    INTERNAL_ERROR, "{}: {}".format(type(error).__name__,
+                                                    error)))
+            return
+        if is_request:
+            self._respond(message['id'], result=result)
+
+    def _respond(self, request_id, result=None, error=None):
+        response = {'jsonrpc': "2.0", 'id': request_id}
+        if error is not None:
+            response['error'] = {'code': error.code, 'message': str(error)}
+        else:
+            response['result'] = result
+        write_message(self.binary_out, response)
+
+    def _notify(self, method, params):
+        write_message(self.binary_out,
+                      {'jsonrpc': "2.0", 'method': method, 'params': params})
+
+    # lifecycle
+
+    def initialize(self, params):
+        self.initialized = True
+        return {
+            'capabilities': {
+                'textDocumentSync': {'openClose': True,
+                                     'change': INCREMENTAL_SYNC},
+                'definitionProvider': True,
+                'hoverProvider': True,
+            },
+            'serverInfo': {'name': "glitteral"},
+        }
+
+    def initialized_notification(self, params):
+        pass
+
+    def shutdown(self, params):
+        self.shutting_down = True
+        return None
+
+    def exit(self, params):
+        self.exit_code = 0 if self.shutting_down else 1
+
+    # keeping the documents in step
+
+    def did_open(self, params):
+        text_document = params['textDocument']
+        self.documents[text_document['uri']] = Document(text_document['text'])
+        self._publish_diagnostics(text_document['uri'])
+
+    def did_change(self, params):
+        uri = params['textDocument']['uri']
+        document = self.documents[uri]
+        for change in params['contentChanges']:
+            if 'range' not in change:
+                document = self.documents[uri] = Document(change['text'])
+                continue
+            document.edit(self._position(document, change['range']['start']),
+                          self._position(document, change['range']['end']),
+                          change['text'])
+        self._publish_diagnostics(uri)
+
+    def did_close(self, params):
+        uri = params['textDocument']['uri']
+        self.documents.pop(uri, None)
+        self._notify('textDocument/publishDiagnostics',
+                     {'uri': uri, 'diagnostics': []})
+
+    def _position(self, document, position):
+        """An LSP position as a (line, character column) pair."""
+        line = position['line']
+        if line >= len(document.lines):
+            return (len(document.lines) - 1, len(document.lines[-1]))
+        return (line, character_column(document.lines[line],
+                                       position['character']))
+
+    def _range(self, document, line, start_column, end_column):
+        text = document.lines[line] if line < len(document.lines) else ''
+        return {'start': {'line': line,
+                          'character': utf16_column(text, start_column)},
+                'end': {'line': line,
+                        'character': utf16_column(text, end_column)}}
+
+    def _publish_diagnostics(self, uri):
+        document = self.documents[uri]
+        self._notify('textDocument/publishDiagnostics', {
+            'uri': uri,
+            'diagnostics': [
+                {'range': self._range(document, *diagnostic[:3]),
+                 'severity': ERROR_SEVERITY,
+                 'source': "glitteral",
+                 'message': diagnostic.message}
+                for diagnostic in document.diagnostics()]})
+
+    # questions
+
+    def _resolve(self, params):
+        uri = params['textDocument']['uri']
+        document = self.documents.get(uri)
+        if document is None:
+            return None, None, None
+        line, column = self._position(document, params['position'])
+        return uri, document, document.lookup(line, column)
+
+    def definition(self, params):
+        uri, document, resolution = self._resolve(params)
+        if resolution is None or resolution.definition is None:
+            return None
+        return {'uri': uri,
+                'range': self._range(document, *resolution.definition)}
+
+    def hover(self, params):
+        _, _, resolution = self._resolve(params)
+        if resolution is None:
+            return None
+        return {'contents': {'kind': 'plaintext',
+                             'value': "{} ({})".format(resolution.name,
+                                                       resolution.kind)}}
+
+    HANDLERS = {
+        'initialize': initialize,
+        'initialized': initialized_notification,
+        'shutdown': shutdown,
+        'exit': exit,
+        'textDocument/didOpen': did_open,
+        'textDocument/didChange': did_change,
+        'textDocument/didClose': did_close,
+        'textDocument/definition': definition,
+        'textDocument/hover': hover,
+    }
+
+
+def serve_stdio():
+    return LanguageServer(sys.stdin.buffer, sys.stdout.buffer).serve()
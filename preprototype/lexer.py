@@ -1,10 +1,11 @@
+import functools
 import logging
 import os
 import re
 
 from collections import namedtuple
 
-from utils import LookaheadStream, get_logger
+from utils import LookaheadStream, Slotted, get_logger, regex_opt
 
 
 logger = get_logger(__name__)
@@ -14,13 +15,32 @@ INDENTATION_WIDTH = 3
 PartiallyMatchedSubtoken = namedtuple('PartiallyMatchedSubtoken',
                                       ('tokenclass', 'representation'))
 
-class Token:
-    def __init__(self, representation):
-        self.representation = representation
+class Token(metaclass=Slotted):
+    # A token is a span of the source buffer that it was found in (so
+    # that lexing doesn't have to copy out every token's text, only for
+    # most of the copies to be thrown away unread); a token made by hand
+    # can just be given its representation, which is then the whole of
+    # its "source."
+    __slots__ = ('source', 'start', 'end')
+
+    def __init__(self, source, start=0, end=None):
+        self.source = source
+        self.start = start
+        self.end = end
+
+    @property
+    def representation(self):
+        if self.source is None:
+            return None
+        return self.source[self.start:self.end]
 
     @classmethod
     def match(cls, source_fragment, **kwargs):
-        if cls.recognizer.match(source_fragment):
+        return cls.match_with(cls.recognizer, source_fragment)
+
+    @classmethod
+    def match_with(cls, recognizer, source_fragment):
+        if recognizer.match(source_fragment):
             return cls(source_fragment)
         elif getattr(cls, 'prefix_recognizer',
                      # the empty string is a prefix of anything
@@ -108,6 +128,7 @@ IntegerSpecifer = type_specifier_class("Integer", "int")
 FloatSpecifer = type_specifier_class("Float", "float")
 StringSpecifier = type_specifier_class("String", "str")
 BooleanSpecifier = type_specifier_class("Boolean", "bool")
+FileSpecifier = type_specifier_class("File", "file")
 
 # XXX UNCIVILIZED: composing the regexes to do this in a DRYer (Don't
 # Repeat Yourself) way is an intricate task, so I'm OK with leaving
@@ -224,69 +245,66 @@ class VoidLiteral(Reserved):
 # recognized token and decide how many tokens to actually emit during
 # the chomp-and-resynchronization phase.
 
+# we don't care about indentation between delimiters
+UNRECOGNIZABLE = re.compile(r"(?!)")
+
 class AbstractDent(Token):
     prefix_recognizer = re.compile(r"\n *\Z", re.MULTILINE)
 
     def __init__(self, *args):
         if not args:
-            self.representation = None
+            super().__init__(None)
         else:
             super().__init__(*args)
 
     @classmethod
     def match(cls, source_fragment, *, lexer_context):
-        # CAUTION: monkey-patching a class variable (trust me on this one)
-        cls.recognizer = cls.recognizer_from_lexer_context(lexer_context)
-        return super().match(source_fragment)
-
-class Indent(AbstractDent):
-    delta_indentation = 1
+        return cls.match_with(cls.recognizer_from_lexer_context(lexer_context),
+                              source_fragment)
 
     @classmethod
-    def recognizer_from_lexer_context(self, lexer_context):
+    def recognizer_from_lexer_context(cls, lexer_context):
         if lexer_context.undelimited():
-            return re.compile(r"\n(   ){%d,}\Z" %
-                               (lexer_context.indentation_level + 1),
-                               re.MULTILINE)
+            return cls.recognizer_at_level(lexer_context.indentation_level)
         else:
-            # we don't care about indentation between delimiters
-            return re.compile(r"(?!)")
+            return UNRECOGNIZABLE
+
+class Indent(AbstractDent):
+    delta_indentation = 1
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def recognizer_at_level(indentation_level):
+        return re.compile(r"\n(   ){%d,}\Z" % (indentation_level + 1),
+                          re.MULTILINE)
 
 class Dedent(AbstractDent):
     delta_indentation = -1
 
-    @classmethod
-    def recognizer_from_lexer_context(self, lexer_context):
-        if lexer_context.undelimited():
-            if lexer_context.indentation_level:
-                return re.compile(r"\n(   ){,%d}\Z" %
-                                  (lexer_context.indentation_level - 1),
-                                  re.MULTILINE)
-            else:
-                # we cannot dedent past the left margin
-                return re.compile(r"(?!)")
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def recognizer_at_level(indentation_level):
+        if indentation_level:
+            return re.compile(r"\n(   ){,%d}\Z" % (indentation_level - 1),
+                              re.MULTILINE)
         else:
-            # we don't care
-            return re.compile(r"(?!)")
+            # we cannot dedent past the left margin
+            return UNRECOGNIZABLE
 
 class AlignedNewline(AbstractDent):
     delta_indentation = 0
 
-    @classmethod
-    def recognizer_from_lexer_context(self, lexer_context):
-        if lexer_context.undelimited():
-            return re.compile(r"\n(?:   ){%d}(?!\n)$" %
-                              lexer_context.indentation_level,
-                              re.MULTILINE)
-        else:
-            # we don't care about indentation between delimiters
-            return re.compile(r"(?!)")
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def recognizer_at_level(indentation_level):
+        return re.compile(r"\n(?:   ){%d}(?!\n)$" % indentation_level,
+                          re.MULTILINE)
 
 
 class Commentary(Token):
     def __init__(self, *_):
         # it's not meant for us; don't even bother reading it
-        self.representation = ''
+        super().__init__('')
 
     recognizer = re.compile(r"#.*\Z")
 
@@ -435,7 +453,7 @@ class BaseLexer:
 BASE_KEYWORDS = [If, When, For, While, Lambda, Def, SubscriptDef, Deflambda, Do]
 TYPE_SPECIFIERS = [
     IntegerSpecifer, FloatSpecifer, StringSpecifier, BooleanSpecifier,
-    IntegerListSpecifier, StringListSpecifier,
+    FileSpecifier, IntegerListSpecifier, StringListSpecifier,
     Arrow
 ]
 OTHER_RESERVED = [Dash, Ellipsis]
@@ -454,10 +472,200 @@ TOKENCLASSES = BASE_KEYWORDS + TYPE_SPECIFIERS + OTHER_RESERVED + INDENTATION +
     EndOfFile
 ]
 
+# `BaseLexer` above works for any collection of token classes, but it
+# pays for that generality by growing its candidate one character at a
+# time and asking every token class about every candidate. The
+# production `Lexer` below instead knows the spellings of Glitteral's
+# tokens up front and folds them into a single master regex, so that
+# finding the longest match at any position is one call into the regex
+# engine. (`BaseLexer` stays around as the reference implementation
+# that the master regex is tested against.)
+
+RESERVED_WORDS = {
+    "if": If, "when": When, "for": For, "while": While, "do": Do,
+    "λ": Lambda, ":=": Def, ":=λ": Deflambda, "_:=": SubscriptDef,
+    "Truth": BooleanLiteral, "Falsity": BooleanLiteral,
+    "Void": VoidLiteral,
+}
+
+SCALAR_TYPE_SPECIFIERS = {
+    "^int": IntegerSpecifer, "^float": FloatSpecifer,
+    "^str": StringSpecifier, "^bool": BooleanSpecifier,
+    "^file": FileSpecifier,
+}
+SEQUENTIAL_TYPE_SPECIFIERS = {
+    "^[int]": IntegerListSpecifier, "^[str]": StringListSpecifier,
+}
+
+PUNCTUATION = {
+    "(": OpenParenthesis, ")": CloseParenthesis,
+    "[": OpenBracket, "]": CloseBracket,
+    "{": OpenBrace, "}": CloseBrace,
+    ";": Semicolon, "|": Pipe,
+    "—": Dash, "→": Arrow, "…": Ellipsis,
+    "█": EndOfFile,
+}
+
+def _named(name, pattern):
+    return "(?P<{}>{})".format(name, pattern)
+
+# The order of the alternatives matters: Python's regex alternation
+# takes the first branch that matches rather than the longest, so
+# anything that could be mistaken for a prefix of something else has
+# to come later. In particular, reserved words must be tried before
+# identifiers (and must not be immediately followed by more identifier
+# characters), which is how we honor the rule that `Reserved` tokens
+# take priority over `Identifier`s of the same length.
+MASTER_RECOGNIZER = re.compile('|'.join([
+    _named('dent', r"\n *"),
+    _named('reserved', regex_opt(*RESERVED_WORDS).pattern) +
+    "(?![{}])".format(IDENTIFIER_CHARS),
+    _named('identifier', "(?![0-9])[{}]+".format(IDENTIFIER_CHARS)),
+    _named('float', r"\d+\.\d*|\.\d+"),
+    _named('integer', r"\d+"),
+    _named('type_specifier',
+           r"(?:{})(?!\w)|{}".format(
+               regex_opt(*SCALAR_TYPE_SPECIFIERS).pattern,
+               regex_opt(*SEQUENTIAL_TYPE_SPECIFIERS).pattern)),
+    _named('string', r'"[^"\n]*"'),
+    _named('intern', r"'[^'\n]*'"),
+    _named('commentary', r"#[^\n█]*"),
+    _named('punctuation', regex_opt(*PUNCTUATION).pattern),
+]))
+
+UNDELIMITED_INSIGNIFICANT_WHITESPACE = re.compile(r" *")
+DELIMITED_INSIGNIFICANT_WHITESPACE = re.compile(r"[ \n\t]*")
+
+TOKENCLASSES_BY_KIND = {
+    'identifier': Identifier,
+    'float': FloatLiteral, 'integer': IntegerLiteral,
+    'string': StringLiteral, 'intern': InternLiteral,
+}
+
+
 class Lexer(BaseLexer):
     def __init__(self):
         super().__init__(TOKENCLASSES)
 
+    def skip_insignificant_whitespace(self):
+        skippable = (UNDELIMITED_INSIGNIFICANT_WHITESPACE
+                     if self.undelimited()
+                     else DELIMITED_INSIGNIFICANT_WHITESPACE)
+        self.candidate_start = skippable.match(
+            self.source, self.candidate_start).end()
+
+    def dent_from_representation(self, representation):
+        new_offset, misalignment = divmod(len(representation) - 1,
+                                          INDENTATION_WIDTH)
+        if misalignment:
+            self._handle_tokenizing_error(
+                [], self.source[self.candidate_start:
+                                self.candidate_start + len(representation) + 1])
+        if new_offset > self.indentation_level:
+            return Indent(representation)
+        elif new_offset < self.indentation_level:
+            return Dedent(representation)
+        else:
+            return AlignedNewline(representation)
+
+    def _runs_off_the_end(self):
+        # A string or intern literal that is never closed is
+        # (regrettably, but faithfully to the reference implementation)
+        # silently discarded along with everything after it.
+        opener = self.source[self.candidate_start]
+        if opener not in "\"'":
+            return False
+        if opener in self.source[self.candidate_start + 1:]:
+            return False
+        return not any(opener in line for line in self.lines)
+
+    def tokenize_buffer(self):
+        # Everything before the buffer's last character (which is
+        # either a newline or the end-of-file sentinel) gets tokenized
+        # here; a trailing newline is left for the next buffer, where
+        # it can be seen together with the indentation that follows it.
+        self.skip_insignificant_whitespace()
+        end_of_buffer = len(self.source) - 1
+        while self.candidate_start < end_of_buffer:
+            match = MASTER_RECOGNIZER.match(self.source, self.candidate_start)
+            if match is None:
+                if self._runs_off_the_end():
+                    self.ran_off_the_end = True
+                    return False
+                self._handle_tokenizing_error(
+                    [], self.source[self.candidate_start:
+                                    self.candidate_start + 2])
+            kind = match.lastgroup
+            start, end = match.span()
+            if kind == 'dent':
+                self.indentation_match_special_handling(
+                    self.dent_from_representation(match.group()))
+            elif kind == 'reserved':
+                self.tokens.append(RESERVED_WORDS[match.group()](
+                    self.source, start, end))
+            elif kind == 'type_specifier':
+                representation = match.group()
+                self.tokens.append(
+                    (SCALAR_TYPE_SPECIFIERS.get(representation) or
+                     SEQUENTIAL_TYPE_SPECIFIERS[representation])(
+                         self.source, start, end))
+            elif kind == 'punctuation':
+                matched = PUNCTUATION[match.group()](self.source, start, end)
+                self.tokens.append(matched)
+                if isinstance(matched, Delimiter):
+                    self.delimiter_match_special_handling(matched)
+            elif kind != 'commentary':
+                self.tokens.append(
+                    TOKENCLASSES_BY_KIND[kind](self.source, start, end))
+            self.candidate_start = end
+            self.skip_insignificant_whitespace()
+        return True
+
+    def stream(self, lines):
+        """Lazily tokenize an iterable of newline-terminated lines (such
+        as an open file), holding no more than a line's worth of source
+        and tokens at a time."""
+        self.lines = iter(lines)
+        self.tokens = []
+        self.ran_off_the_end = False
+        carry = ''
+        for line in self.lines:
+            if not line.endswith('\n'):
+                # (only the last line of a file can lack a newline)
+                carry += line
+                break
+            self.source = carry + line
+            self.candidate_start = 0
+            keep_going = self.tokenize_buffer()
+            yield from self.tokens
+            self.tokens = []
+            if not keep_going:
+                return
+            carry = self.source[self.candidate_start:]
+        self.source = carry + '█'  # end-of-file sentinel
+        self.candidate_start = 0
+        self.tokenize_buffer()
+        yield from self.tokens
+        self.tokens = []
+
+    def tokenize(self, source):
+        return list(self.stream(source_lines(source)))
+
+
+def source_lines(source):
+    start = 0
+    while True:
+        end = source.find('\n', start) + 1
+        if not end:
+            if start < len(source):
+                yield source[start:]
+            return
+        yield source[start:end]
+        start = end
+
 
 def lex(source):
-    return LookaheadStream(Lexer().tokenize(source))
+    """Lex `source`, which can be a string or an iterable of lines."""
+    if isinstance(source, str):
+        source = source_lines(source)
+    return LookaheadStream(Lexer().stream(source))
@@ -0,0 +1,488 @@
+import math
+import operator
+
+from parser import *  # there's no getting away from it
+from inference import INTEGER, FLOAT, STRING, BOOLEAN, specified_type
+from utils import DispatchTable, get_logger, trampoline
+
+logger = get_logger(__name__)
+
+
+# What the optimization levels (`Compilation.optimization_level`, or
+# glitteralc's -O) do—
+#
+# 0. nothing: the Rust says what the program says.
+# 1. arithmetic, comparisons, and conjunctions and disjunctions of
+#    constants get worked out at compile time, as do references to
+#    definitions whose value is (thereby) constant, where it's safe to
+#    say that the definition being referred to is the one in force.
+#    And `for` loops over ranges and lists (whose lengths are known
+#    before the loop starts) make room up front in the lists that they
+#    `append!` to, rather than have them reallocate as they grow.
+# 2. calls to pure functions (that only do the above, to their
+#    arguments and to each other) with constant arguments get worked
+#    out at compile time, too.
+#
+# Whatever gets worked out is set as the node's `constant`, which the
+# backend generates a literal for instead of the code to work it out.
+# (Room to be made is set as a loop's `reservations`: see
+# `plan_reservations`.)
+
+class NotConstant(Exception):
+    # (what something that can't be worked out at compile time—or
+    # shouldn't be, like an overflowing multiplication, which has to
+    # be left to panic at runtime—raises)
+    ...
+
+
+# (the least and most an `isize` can be on the 64-bit targets we
+# compile for)
+ISIZE_MIN = -(1 << 63)
+ISIZE_MAX = (1 << 63) - 1
+
+def _checked(result):
+    if type(result) is int and not ISIZE_MIN <= result <= ISIZE_MAX:
+        raise NotConstant("{} overflows an isize".format(result))
+    if type(result) is float and not math.isfinite(result):
+        # (which Rust has, but not as literals)
+        raise NotConstant("{} isn't finite".format(result))
+    return result
+
+def _divide(dividend, divisor):
+    if divisor == 0:
+        raise NotConstant("division by zero")
+    if type(dividend) is float:
+        return dividend / divisor
+    # (Rust's integer division truncates toward zero, where Python's
+    # floors)
+    quotient = abs(dividend) // abs(divisor)
+    return quotient if (dividend < 0) == (divisor < 0) else -quotient
+
+NUMBERS = (int, float)
+
+# The builtins (by the name of the Rust function that implements each)
+# that we know how to apply at compile time: what types of arguments
+# they can be applied to (both arguments being of the same one), and
+# how to apply them.
+PURE_BUILTINS = {
+    'add': (NUMBERS, operator.add),
+    'subtract': (NUMBERS, operator.sub),
+    'multiply': (NUMBERS, operator.mul),
+    'divide': (NUMBERS, _divide),
+    'integers_equal': ((int,), operator.eq),
+    'integers_not_equal': ((int,), operator.ne),
+    'greater': (NUMBERS, operator.gt), 'less': (NUMBERS, operator.lt),
+    'not_greater': (NUMBERS, operator.le), 'not_less': (NUMBERS, operator.ge),
+    'and': ((bool,), operator.and_), 'or': ((bool,), operator.or_),
+}
+
+# (which can be applied to more than two arguments, associating to the
+# left, as `backend.VARIADIC_BUILTINS` are)
+VARIADIC_BUILTINS = {'add', 'subtract', 'multiply', 'divide', 'and', 'or'}
+
+# (what `and` and `or` stop evaluating their arguments at, Rust's `&&`
+# and `||` being what they're generated as)
+SHORT_CIRCUITS = {'and': False, 'or': True}
+
+def apply_builtin(builtin, arguments):
+    """What applying the pure builtin named `builtin` to the constant
+    `arguments` evaluates to in Rust, or `NotConstant`."""
+    kinds, operation = PURE_BUILTINS[builtin]
+    if len(arguments) < 2 or (len(arguments) > 2 and
+                              builtin not in VARIADIC_BUILTINS):
+        raise NotConstant("can't {} {} arguments".format(builtin,
+                                                        len(arguments)))
+    # (`type` rather than `isinstance`, lest `True` pass for an integer;
+    # mismatched types are rustc's to complain about)
+    kind = type(arguments[0])
+    if kind not in kinds or any(type(argument) is not kind
+                                for argument in arguments):
+        raise NotConstant("can't {} {}".format(
+            builtin, ' and '.join(repr(argument)
+                                  for argument in arguments)))
+    result, *rest = arguments
+    for argument in rest:
+        # (each step's overflow panicking at runtime, like Rust's)
+        result = _checked(operation(result, argument))
+    return result
+
+# (what types of values can be constants, and how they're told apart)
+SCALAR_TYPES = {INTEGER: int, FLOAT: float, BOOLEAN: bool, STRING: str}
+
+LITERALS = (IntegerAtom, FloatAtom, BooleanAtom, StringAtom)
+
+def constant_of(node):
+    """What `node` is known to evaluate to, or `None`."""
+    if isinstance(node, LITERALS):
+        return node.value
+    if isinstance(node, Expression):
+        return node.constant
+    return None
+
+LOOPS = (IndeterminateIteration, DeterminateIteration)
+
+def _names_defined_in_loops(form):
+    defined = set()
+    unvisited = [(form, False)]
+    while unvisited:
+        node, in_loop = unvisited.pop()
+        if in_loop and isinstance(node, Definition):
+            defined.add(node.identifier.value)
+        in_loop = in_loop or isinstance(node, LOOPS)
+        unvisited.extend((child, in_loop) for child in node.children)
+    return defined
+
+
+# How to evaluate each kind of node in the body of a pure function (see
+# `ConstantFolder.is_pure`): like the code generator (see
+# `backend.generate_expression`), each evaluator for a compound node is
+# a generator that yields the (node, frame) pairs it needs the values of
+# and gets sent back their values, so that a deeply recursive function
+# doesn't make for a deeply recursive compiler. A frame is the values
+# of the arguments and local definitions of one call, by name.
+
+EVALUATORS = DispatchTable("evaluator")
+
+@EVALUATORS.register(IdentifierAtom)
+def evaluate_identifier(folder, identifier, frame):
+    try:
+        return frame[identifier.value]
+    except KeyError:
+        raise NotConstant("{} isn't defined yet".format(identifier.value))
+
+@EVALUATORS.register(VoidAtom)
+def evaluate_void(folder, void, frame):
+    return None
+
+@EVALUATORS.register(Application)
+def evaluate_application(folder, application, frame):
+    function = application.function.binding
+    short_circuit = (SHORT_CIRCUITS.get(function.node.value)
+                     if function.kind == "builtin" else None)
+    arguments = []
+    for argument in application.arguments:
+        arguments.append((yield (argument, frame)))
+        if arguments[-1] is short_circuit and short_circuit is not None:
+            return short_circuit
+    if function.kind == "builtin":
+        return apply_builtin(function.node.value, arguments)
+    return (yield from folder.call(function.node, arguments))
+
+@EVALUATORS.register(Definition)
+def evaluate_definition(folder, definition, frame):
+    frame[definition.identifier.value] = yield (definition.identified, frame)
+
+@EVALUATORS.register(Conditional)
+def evaluate_conditional(folder, conditional, frame):
+    condition = yield (conditional.condition, frame)
+    if type(condition) is not bool:
+        raise NotConstant("{!r} isn't a condition".format(condition))
+    if condition:
+        return (yield (conditional.consequent, frame))
+    if conditional.alternative is not None:
+        return (yield (conditional.alternative, frame))
+
+@EVALUATORS.register(SingletrackedConditional)
+def evaluate_singletracked_conditional(folder, one_conditional, frame):
+    condition = yield (one_conditional.condition, frame)
+    if type(condition) is not bool:
+        raise NotConstant("{!r} isn't a condition".format(condition))
+    if condition:
+        for expression in one_conditional.expressions:
+            yield (expression, frame)
+
+@EVALUATORS.register(DoBlock)
+def evaluate_do_block(folder, block, frame):
+    value = None
+    for expression in block.expressions:
+        value = yield (expression, frame)
+    return value
+
+@EVALUATORS.register(object)
+def evaluate_impurity(folder, node, frame):
+    # (`ConstantFolder.is_pure` should have kept us from getting here)
+    raise NotConstant("can't evaluate {} at compile time".format(node))
+
+# (the most nodes that working out one call at compile time may take
+# evaluating, lest the compiler take forever to work out something that
+# the program was only ever going to do once, or never finish at all)
+EVALUATION_BUDGET = 1 << 16
+
+# (the nodes that can be in the body of a pure function)
+PURE_NODES = (LITERALS + (VoidAtom, IdentifierAtom, Application, Definition,
+                          Conditional, SingletrackedConditional, DoBlock))
+
+
+class ConstantFolder:
+    """What's been worked out so far about the program being optimized:
+    which definitions are of constants, which functions are pure, and
+    what calls to them have evaluated to."""
+
+    def __init__(self, optimization_level):
+        self.optimization_level = optimization_level
+        # the defined node, its value, and the function (if any) that it's
+        # local to, by the `id` of the defined node
+        self.constants = {}
+        # pure functions by `id` (and the values of calls to them by
+        # function `id` and the `repr`s of the arguments, which tell `1`
+        # from `1.` from `Truth`, and `0.` from `-0.`)
+        self.pure_functions = {}
+        self.calls = {}
+        self.evaluation_steps = 0
+        # (the names defined in loops in the form being folded)
+        self.loop_defined = set()
+
+    def fold(self, form):
+        """Work out whatever can be worked out about top-level `form`."""
+        self.loop_defined = _names_defined_in_loops(form)
+        # (after its children, and with a stack of our own, as in
+        # `inference.infer_form_types`, with each node's function (if
+        # any), whether it's in a loop, and whether it's evaluated
+        # unconditionally and only the once (per call of its function))
+        unvisited = [(form, False, None, False, True)]
+        while unvisited:
+            node, children_folded, function, in_loop, once = unvisited.pop()
+            if children_folded:
+                self.fold_node(node, function, in_loop, once)
+                continue
+            unvisited.append((node, True, function, in_loop, once))
+            if isinstance(node, NamedFunctionDefinition):
+                children = [(child, node, False, True)
+                            for child in node.expressions]
+            else:
+                in_loop = in_loop or isinstance(node, LOOPS)
+                children = [(child, function, in_loop, False)
+                            for child in node.children
+                            # (which is being defined, not referred to)
+                            if not (isinstance(node, Definition) and
+                                    child is node.identifier)]
+            unvisited.extend(
+                (child, False, child_function, child_in_loop, child_once)
+                for child, child_function, child_in_loop, child_once
+                in reversed(children))
+
+    def fold_node(self, node, function, in_loop, once):
+        if isinstance(node, IdentifierAtom):
+            binding = node.binding
+            if binding is None or binding.kind != "global":
+                return
+            constant = self.constants.get(id(binding.node))
+            # A definition is only sure to be the one in force when a
+            # reference to it is evaluated if it was evaluated
+            # unconditionally (see `fold`) in the same function, and (if
+            # the reference is in a loop) isn't superseded by a
+            # redefinition later in the loop. (Redefinitions between the
+            # definition and the reference would have been what the
+            # reference was bound to instead.)
+            if (constant is not None and constant[0] is binding.node and
+                    constant[2] is function and
+                    not (in_loop and node.value in self.loop_defined)):
+                node.constant = constant[1]
+        elif isinstance(node, Application):
+            self.fold_application(node)
+        elif isinstance(node, Definition):
+            value = constant_of(node.identified)
+            if once and value is not None:
+                self.constants[id(node.identified)] = (node.identified,
+                                                       value, function)
+        elif (isinstance(node, NamedFunctionDefinition) and
+              self.optimization_level >= 2 and self.is_pure(node)):
+            self.pure_functions[id(node)] = node
+
+    def fold_application(self, application):
+        arguments = [constant_of(argument)
+                     for argument in application.arguments]
+        function = application.function.binding
+        short_circuit = (SHORT_CIRCUITS.get(function.node.value)
+                         if function.kind == "builtin" else None)
+        if short_circuit is not None:
+            # (where the arguments that there's no telling the value of
+            # would never be evaluated anyway)
+            for argument in arguments:
+                if argument is None:
+                    break
+                if argument is short_circuit:
+                    application.constant = short_circuit
+                    return
+        if None in arguments:
+            return
+        try:
+            if function.kind == "builtin":
+                if function.node.value not in PURE_BUILTINS:
+                    return
+                application.constant = apply_builtin(function.node.value,
+                                                     arguments)
+            elif id(function.node) in self.pure_functions:
+                self.evaluation_steps = 0
+                application.constant = trampoline(
+                    self.evaluate,
+                    self.call(function.node, arguments))
+        except NotConstant as reason:
+            logger.debug("not folding %s: %s", application, reason)
+
+    def is_pure(self, definition):
+        """Whether calls to the function `definition` can be worked out
+        at compile time: that is, whether its body consists only of the
+        `PURE_NODES`, referring only to its arguments, its own local
+        definitions, pure builtins, and pure functions (itself
+        included), and it returns something that can be a constant."""
+        if specified_type(definition.return_type) not in SCALAR_TYPES:
+            return False
+        local_definitions = set()
+        unvisited = list(definition.expressions)
+        body = []
+        while unvisited:
+            node = unvisited.pop()
+            if not isinstance(node, PURE_NODES):
+                return False
+            if isinstance(node, Definition):
+                local_definitions.add(id(node.identified))
+            body.append(node)
+            unvisited.extend(node.children)
+        for node in body:
+            if not isinstance(node, IdentifierAtom):
+                continue
+            binding = node.binding
+            if binding.kind == "builtin":
+                pure = binding.node.value in PURE_BUILTINS
+            elif binding.kind == "argument":
+                pure = any(binding.node is argument
+                           for argument in definition.arguments)
+            elif binding.kind == "global":
+                pure = (id(binding.node) in local_definitions or
+                        binding.node is definition or
+                        id(binding.node) in self.pure_functions)
+            else:
+                pure = False
+            if not pure:
+                return False
+        return True
+
+    def call(self, function, arguments):
+        """Evaluate a call of the pure `function` with constant
+        `arguments` (to be `yield from`ed, or handed to `trampoline`)."""
+        key = (id(function), tuple(repr(argument)
+                                   for argument in arguments))
+        if key in self.calls:
+            return self.calls[key]
+        if len(arguments) != len(function.arguments):
+            raise NotConstant("{} takes {} arguments".format(
+                function.name.value, len(function.arguments)))
+        frame = {}
+        for argument, value in zip(function.arguments, arguments):
+            if (type(value) is not
+                    SCALAR_TYPES.get(specified_type(argument.type_specifier))):
+                raise NotConstant("{!r} isn't a {}".format(
+                    value, argument.type_specifier.value))
+            frame[argument.value.value] = value
+        value = None
+        for expression in function.expressions:
+            value = yield (expression, frame)
+        if (type(value) is not
+                SCALAR_TYPES[specified_type(function.return_type)]):
+            raise NotConstant("{} returned {!r}".format(function.name.value,
+                                                         value))
+        self.calls[key] = value
+        return value
+
+    def evaluate(self, request):
+        # (for `trampoline`: a call's generator (from `call`) to start with,
+        # and then the (node, frame) pairs that evaluators yield)
+        if not isinstance(request, tuple):
+            return request
+        node, frame = request
+        self.evaluation_steps += 1
+        if self.evaluation_steps > EVALUATION_BUDGET:
+            raise NotConstant("ran out of evaluation budget")
+        constant = constant_of(node)
+        if constant is not None:
+            return constant
+        return EVALUATORS[type(node)](self, node, frame)
+
+
+def fold_constants(expressionstream, compilation):
+    """Pass typed (see `inference.infer_types`) top-level forms through,
+    having worked out at compile time what `compilation`'s
+    `optimization_level` says to."""
+    if not compilation.optimization_level:
+        yield from expressionstream
+        return
+    folder = ConstantFolder(compilation.optimization_level)
+    for expression in expressionstream:
+        folder.fold(expression)
+        yield expression
+
+
+# (the builtins that make lists of integers that a `for` loop can go
+# through without making them—see `backend.NATIVE_ITERABLES`—whose
+# lengths are then known, from their arguments, before it starts)
+SIZED_RANGES = {'range': 2, 'reverse_range': 2, 'step_range': 3}
+
+def known_length(iterable):
+    """Whether how many times a `for` loop over `iterable` will go around
+    is known (at runtime, but) before the loop starts: that is, whether
+    it's a range or a list or vector that's already been made."""
+    if isinstance(iterable, Application):
+        function = iterable.function.binding
+        return (function.kind == "builtin" and
+                SIZED_RANGES.get(function.node.value) ==
+                len(iterable.arguments))
+    return (isinstance(iterable, IdentifierAtom) and
+            iterable.binding.kind != "builtin" and
+            iterable.inferred_type is not None and
+            iterable.inferred_type.constructor in ("list", "vector"))
+
+def _descendants(node):
+    descendants = set()
+    unvisited = [node]
+    while unvisited:
+        node = unvisited.pop()
+        descendants.add(id(node))
+        unvisited.extend(node.children)
+    return descendants
+
+def appended_lists(iteration):
+    """The names of the lists that `iteration`'s body `append!`s to
+    every time around (with how many times it does), that were made
+    before the loop."""
+    inside = None
+    appended = {}
+    for expression in iteration.body:
+        # (only appends at the top of the body, which happen every time
+        # around—not ones in conditionals or nested loops)
+        if not (isinstance(expression, Application) and
+                expression.function.binding.kind == "builtin" and
+                expression.function.binding.node.value == "append" and
+                expression.arguments and
+                isinstance(expression.arguments[0], IdentifierAtom)):
+            continue
+        appendee = expression.arguments[0]
+        binding = appendee.binding
+        if (binding.kind not in ("global", "argument") or
+                appendee.inferred_type is None or
+                appendee.inferred_type.constructor != "list"):
+            continue
+        if inside is None:
+            inside = _descendants(iteration)
+        # (a list made in the loop can't have room made in it before)
+        if id(binding.node) in inside:
+            continue
+        appended[appendee.value] = appended.get(appendee.value, 0) + 1
+    return tuple(appended.items())
+
+def plan_reservations(expressionstream, compilation):
+    """Pass typed top-level forms through, having given each `for` loop
+    of known length (under `optimization_level` 1 and up) the
+    `reservations` of room to make in the lists it appends to."""
+    if not compilation.optimization_level:
+        yield from expressionstream
+        return
+    for expression in expressionstream:
+        unvisited = [expression]
+        while unvisited:
+            node = unvisited.pop()
+            if (isinstance(node, DeterminateIteration) and
+                    known_length(node.iterable)):
+                node.reservations = appended_lists(node)
+            unvisited.extend(node.children)
+        yield expression
@@ -0,0 +1,110 @@
+import os
+import re
+
+from concurrent.futures import ProcessPoolExecutor
+
+from lexer import Lexer, lex, source_lines
+from parser import parse
+from utils import LookaheadStream, get_logger
+
+logger = get_logger(__name__)
+
+
+# Lexing and parsing are most of the frontend's work on a big program,
+# and, unlike annotation (which has to see the definitions in order, to
+# know what's in the global environment at each of them), they don't
+# need anything from one top-level form to do the next: between
+# top-level forms, the lexer is always at indentation level 0 with no
+# open delimiters. So a big program can be cut into chunks at lines that
+# start top-level forms, and the chunks lexed and parsed in a pool of
+# processes (the GIL being what it is), with the forms handed back in
+# order for annotation.
+#
+# Finding exactly where the top-level forms start would take lexing the
+# whole program, which is what we're trying not to do in one process;
+# instead, we cut at the first line after each chunk's worth of source
+# that starts with something that could start a form (not whitespace, a
+# comment, or a closing delimiter), and have each worker report whether
+# its chunk really did end at the top level. A chunk that didn't (being
+# in the middle of a parenthesized expression whose continuation line
+# happens to be flush left, say) has its forms thrown away, and
+# everything from its start onward gets lexed and parsed here instead.
+# (A chunk that failed to lex or parse is treated the same way, so that
+# a genuine error gets raised just as it would have been without
+# chunking—and a spurious one, from a chunk cut off in the middle of a
+# form, doesn't.)
+
+CANDIDATE_FORM_START = re.compile(r"\n(?=[^\s#)\]}|])")
+
+# (below which the process pool costs more than it saves)
+MINIMUM_CHUNK_SIZE = 1 << 16
+# (enough chunks per worker that one slow chunk doesn't hold up the rest)
+CHUNKS_PER_JOB = 4
+
+
+def chunk_boundaries(source, chunk_size):
+    """Offsets into `source` at which to cut it into chunks of at least
+    `chunk_size` characters (with 0 and `len(source)` at either end),
+    each cut at a line that might start a top-level form."""
+    boundaries = [0]
+    while boundaries[-1] + chunk_size < len(source):
+        candidate = CANDIDATE_FORM_START.search(source,
+                                                boundaries[-1] + chunk_size)
+        if candidate is None:
+            break
+        boundaries.append(candidate.end())
+    boundaries.append(len(source))
+    return boundaries
+
+def lex_and_parse_chunk(chunk):
+    """The top-level forms parsed from `chunk`, and whether the lexer was
+    at the top level at the end of it—or `None`, if it didn't lex and
+    parse."""
+    lexer = Lexer()
+    try:
+        forms = list(parse(LookaheadStream(lexer.stream(
+            source_lines(chunk)))))
+    except Exception as error:
+        # (which is as likely to be because the chunk was cut off in the
+        # middle of a form as anything)
+        logger.debug("chunk didn't parse (%s: %s)", type(error).__name__,
+                     error)
+        return None
+    at_top_level = (not lexer.ran_off_the_end and
+                    not lexer.delimiter_stack and
+                    lexer.indentation_level == 0)
+    return forms, at_top_level
+
+def parse_in_parallel(source, jobs=None, chunk_size=None):
+    """The top-level forms (unannotated) of the program `source`, lexed
+    and parsed in chunks by a pool of up to `jobs` processes."""
+    jobs = jobs or os.cpu_count()
+    if chunk_size is None:
+        chunk_size = max(MINIMUM_CHUNK_SIZE,
+                         len(source) // (jobs * CHUNKS_PER_JOB) + 1)
+    boundaries = chunk_boundaries(source, chunk_size)
+    if jobs == 1 or len(boundaries) <= 2:
+        yield from parse(lex(source))
+        return
+
+    chunks = [source[start:stop]
+              for start, stop in zip(boundaries, boundaries[1:])]
+    logger.debug("parsing %s chunks in up to %s processes",
+                 len(chunks), jobs)
+    workers = ProcessPoolExecutor(max_workers=jobs)
+    try:
+        parsed_chunks = workers.map(lex_and_parse_chunk, chunks)
+        for start, stop, parsed in zip(boundaries, boundaries[1:],
+                                       parsed_chunks):
+            if parsed is not None:
+                forms, at_top_level = parsed
+                if at_top_level or stop == len(source):
+                    yield from forms
+                    continue
+            logger.debug("chunk at %s wasn't top-level forms; parsing the "
+                         "rest of the program sequentially", start)
+            workers.shutdown(wait=False, cancel_futures=True)
+            yield from parse(lex(source[start:]))
+            return
+    finally:
+        workers.shutdown(cancel_futures=True)
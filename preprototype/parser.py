@@ -1,20 +1,35 @@
 from collections import namedtuple, ChainMap
 
+from environments import EMPTY_ENVIRONMENT
 from lexer import *  # yeah, yeah
-from utils import twopartitions, get_logger, oxford_series
+from utils import (Slotted, DispatchTable, twopartitions, get_logger,
+                   oxford_series, trampoline)
 
 logger = get_logger(__name__)
 
 
-class Expression:
+# There can be a lot of AST nodes (one per element of a big list
+# literal, say), so they keep their attributes in `__slots__` rather
+# than a per-node `__dict__` (see `utils.Slotted`).
+
+class Expression(metaclass=Slotted):
+    __slots__ = ('global_environment', 'local_environment', 'statementlike',
+                 'inferred_type', 'constant')
+
     # unless otherwise overridden
     mutable = False
 
     def __init__(self):
-        # These will be reassigned during annotation.
-        self.global_environment = {}
-        self.local_environment = {}
+        # These will be reassigned during annotation (and new
+        # environments only get made for nodes that bind something).
+        self.global_environment = EMPTY_ENVIRONMENT
+        self.local_environment = EMPTY_ENVIRONMENT
         self.statementlike = None
+        # (see inference.py)
+        self.inferred_type = None
+        # (what it's known at compile time to evaluate to, if anything:
+        # see optimizer.py)
+        self.constant = None
 
     @property
     def environment(self):
@@ -26,6 +41,8 @@ class Codeform(Expression):
 
 
 class NamedFunctionDefinition(Codeform):
+    __slots__ = ('name', 'arguments', 'return_type', 'expressions')
+
     def __init__(self, name, argument_sequential, return_type, expressions):
         super().__init__()
         self.name = name
@@ -47,10 +64,15 @@ class NamedFunctionDefinition(Codeform):
         )
 
 class Definition(Codeform):
+    __slots__ = ('identifier', 'identified', 'superseded')
+
     def __init__(self, identifier, identified):
         super().__init__()
         self.identifier = identifier
         self.identified = identified
+        # (the binding of the identifier from before this definition, if
+        # any, as worked out by `annotator.resolve`)
+        self.superseded = None
 
         # XXX??
         self.identifier.statementlike = False
@@ -67,6 +89,8 @@ class Definition(Codeform):
 
 
 class DoBlock(Codeform):
+    __slots__ = ('expressions',)
+
     def __init__(self, expressions):
         super().__init__()
         self.expressions = expressions
@@ -80,12 +104,18 @@ class DoBlock(Codeform):
 
 
 class SubscriptAssignment(Codeform):
+    __slots__ = ('collection_identifier', 'key', 'value')
+
     def __init__(self, collection_identifier, key, value):
         super().__init__()
         self.collection_identifier = collection_identifier
         self.key = key
         self.value = value
 
+        # (as with `Definition`)
+        self.collection_identifier.statementlike = False
+        self.key.statementlike = False
+
     @property
     def children(self):
         return [self.collection_identifier, self.key, self.value]
@@ -97,6 +127,8 @@ class SubscriptAssignment(Codeform):
         )
 
 class Conditional(Codeform):
+    __slots__ = ('condition', 'consequent', 'alternative')
+
     def __init__(self, condition, consequent, alternative=None):
         super().__init__()
         self.condition = condition
@@ -117,6 +149,8 @@ class Conditional(Codeform):
         )
 
 class SingletrackedConditional(Codeform):
+    __slots__ = ('condition', 'expressions')
+
     def __init__(self, condition, expressions):
         super().__init__()
         self.condition = condition
@@ -135,6 +169,8 @@ class SingletrackedConditional(Codeform):
         )
 
 class IndeterminateIteration(Codeform):
+    __slots__ = ('condition', 'body')
+
     def __init__(self, condition, body):
         super().__init__()
         self.condition = condition
@@ -153,11 +189,17 @@ class IndeterminateIteration(Codeform):
         )
 
 class DeterminateIteration(Codeform):
+    __slots__ = ('index_identifier', 'iterable', 'body', 'reservations')
+
     def __init__(self, index_identifier, iterable, body):
         super().__init__()
         self.index_identifier = index_identifier
         self.iterable = iterable
         self.body = body
+        # (the names of the lists that the loop appends to, each with how
+        # many times it does so each time around, that it can make room
+        # in before it starts: see `optimizer.plan_reservations`)
+        self.reservations = ()
 
         self.index_identifier.statementlike = False
         self.iterable.statementlike = False
@@ -184,6 +226,8 @@ class DeterminateIteration(Codeform):
         )
 
 class Application(Expression):
+    __slots__ = ('function', 'arguments')
+
     def __init__(self, function, arguments):
         super().__init__()
         self.function = function
@@ -201,6 +245,8 @@ class Application(Expression):
 
 
 class Sequential(Expression):
+    __slots__ = ('elements',)
+
     def __init__(self, elements):
         super().__init__()
         self.elements = elements
@@ -236,6 +282,8 @@ class Vector(Sequential):
 
 
 class Associative(Expression):
+    __slots__ = ('associations', 'identifier')
+
     def __init__(self, associations):
         super().__init__()
         self.associations = associations
@@ -251,7 +299,11 @@ class Associative(Expression):
 # Hashtable literal. Could there be an argument for a common
 # superclass with Argument and iteration bindings strong than "I don't
 # really know what to do with any of these"?
-class Association:
+class Association(metaclass=Slotted):
+    __slots__ = ('key', 'value', 'statementlike',
+                 # (the annotator treats us like an expression)
+                 'global_environment', 'local_environment')
+
     def __init__(self, key, value):
         self.key = key
         self.value = value
@@ -280,6 +332,8 @@ class Hashtable(Associative):
 
 
 class Atom(Expression):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         super().__init__()
         self.value = value
@@ -299,9 +353,16 @@ class Atom(Expression):
         return "<{}: {}>".format(self.__class__.__name__, self.value)
 
 class IdentifierAtom(Atom):
-    ...
+    __slots__ = ('binding',)
+
+    def __init__(self, value):
+        super().__init__(value)
+        # (see `annotator.resolve`)
+        self.binding = None
 
 class Argument(IdentifierAtom):
+    __slots__ = ('type_specifier',)
+
     def __init__(self, name, type_specifier):
         self.value = name
         self.type_specifier = type_specifier
@@ -335,6 +396,8 @@ class TypeSpecifierAtom(Atom):
     ...
 
 class BuiltinAtom(Atom):
+    __slots__ = ('special',)
+
     def __init__(self, value, special=False):
         super().__init__(value)
         self.special = special
@@ -343,12 +406,20 @@ class ParsingException(Exception):
     ...
 
 
+# Glitteral expressions nest as deep as anyone cares to write them, and
+# Python's stack doesn't, so the parsing functions below don't call each
+# other. Each one that needs a subexpression parsed is a generator that
+# yields the parser to parse it with (usually `parse_subexpression`) and
+# gets sent back the result, and `parse_expression` runs them all off of
+# a stack of its own (see `utils.trampoline`); a parser that doesn't
+# need any subexpressions (as for atoms) just returns what it parsed.
+
 def parse_rest(tokenstream, *, closer, item_parser=None):
     if item_parser is None:
         # because can't supply this as a ordinary default argument if we want
-        # this function defined earlier than `parse_expression` while Python is
-        # loading this module
-        item_parser = parse_expression
+        # this function defined earlier than `parse_subexpression` while
+        # Python is loading this module
+        item_parser = parse_subexpression
     body = []
     done_here = False
     while not done_here:
@@ -357,7 +428,7 @@ def parse_rest(tokenstream, *, closer, item_parser=None):
             tokenstream.pop()
             done_here = True
         else:
-            body.append(item_parser(tokenstream))
+            body.append((yield item_parser))
     return body
 
 def parse_expression_expecting(tokenstream, *, being_instance,
@@ -366,7 +437,7 @@ def parse_expression_expecting(tokenstream, *, being_instance,
     and whose values are predicates indicating whether the parsing is OK)"""
     if further_conditions is None:
         further_conditions = {}
-    expression = parse_expression(tokenstream)
+    expression = yield parse_subexpression
     violated_expectations = []
     if not isinstance(expression, being_instance):
         violated_expectations.append(
@@ -391,66 +462,71 @@ def parse_codeform(tokenstream):
             "Expected a keyword token, got {}.".format(open_keyword))
 
     if open_keyword.representation == "if":
-        condition = parse_expression(tokenstream)
-        dash = parse_expression_expecting(
+        condition = yield parse_subexpression
+        dash = yield from parse_expression_expecting(
             tokenstream,
             being_instance=ReservedAtom,
             further_conditions={'it\'s an em dash': lambda d: d.value == "—"}
         )
-        indent = parse_expression_expecting(tokenstream,
-                                            being_instance=Indent)
-        consequent = parse_expression(tokenstream)
-        post_consequent = parse_expression(tokenstream)
+        indent = yield from parse_expression_expecting(tokenstream,
+                                                       being_instance=Indent)
+        consequent = yield parse_subexpression
+        post_consequent = yield parse_subexpression
         if isinstance(post_consequent, Dedent):
             return Conditional(condition, consequent)
         else:
             alternative = post_consequent
-            parse_expression_expecting(tokenstream, being_instance=Dedent)
+            yield from parse_expression_expecting(tokenstream,
+                                                  being_instance=Dedent)
             return Conditional(condition, consequent, alternative)
     elif open_keyword.representation == "when":
-        condition = parse_expression(tokenstream)
-        dash = parse_expression_expecting(
+        condition = yield parse_subexpression
+        dash = yield from parse_expression_expecting(
             tokenstream,
             being_instance=ReservedAtom,
             further_conditions={'it\'s an em dash': lambda d: d.value == "—"}
         )
-        indent = parse_expression_expecting(tokenstream,
-                                            being_instance=Indent)
-        body = parse_rest(tokenstream, closer=Dedent)
+        indent = yield from parse_expression_expecting(tokenstream,
+                                                       being_instance=Indent)
+        body = yield from parse_rest(tokenstream, closer=Dedent)
         return SingletrackedConditional(condition, body)
     elif open_keyword.representation == ":=":
         # TODO: same error-checking guarantees throughout this entire (long)
         # `parse_codeform` function
-        identifier, identified = [parse_expression(tokenstream)
-                                  for _ in range(2)]
+        identifier = yield parse_subexpression
+        identified = yield parse_subexpression
         return Definition(identifier, identified)
     elif open_keyword.representation == "_:=":
-        collection, subscript, identified = [parse_expression(tokenstream)
-                                             for _ in range(3)]
+        collection = yield parse_subexpression
+        subscript = yield parse_subexpression
+        identified = yield parse_subexpression
         return SubscriptAssignment(collection, subscript, identified)
     elif open_keyword.representation == ":=λ":
-        name = parse_expression(tokenstream)
-        argument_sequential = parse_expression(tokenstream)
-        _arrow = parse_expression(tokenstream)
-        return_type = parse_expression(tokenstream)
-        indent = parse_expression(tokenstream)
-        body = parse_rest(tokenstream, closer=Dedent)
+        name = yield parse_subexpression
+        argument_sequential = yield parse_subexpression
+        _arrow = yield parse_subexpression
+        return_type = yield parse_subexpression
+        indent = yield parse_subexpression
+        body = yield from parse_rest(tokenstream, closer=Dedent)
         return NamedFunctionDefinition(name, argument_sequential, return_type,
                                        body)
     elif open_keyword.representation == "do":
-        dash, indent = [parse_expression(tokenstream) for _ in range(2)]
-        body = parse_rest(tokenstream, closer=Dedent)
+        dash = yield parse_subexpression
+        indent = yield parse_subexpression
+        body = yield from parse_rest(tokenstream, closer=Dedent)
         return DoBlock(body)
     elif open_keyword.representation == "for":
-        bindings = parse_expression(tokenstream)
+        bindings = yield parse_subexpression
         index_identifier, iterable = bindings.elements
-        dash, indent = [parse_expression(tokenstream) for _ in range(2)]
-        body = parse_rest(tokenstream, closer=Dedent)
+        dash = yield parse_subexpression
+        indent = yield parse_subexpression
+        body = yield from parse_rest(tokenstream, closer=Dedent)
         return DeterminateIteration(index_identifier, iterable, body)
     elif open_keyword.representation == "while":
-        condition = parse_expression(tokenstream)
-        dash, indent = [parse_expression(tokenstream) for _ in range(2)]
-        body = parse_rest(tokenstream, closer=Dedent)
+        condition = yield parse_subexpression
+        dash = yield parse_subexpression
+        indent = yield parse_subexpression
+        body = yield from parse_rest(tokenstream, closer=Dedent)
         return IndeterminateIteration(condition, body)
     else:
         raise ParsingException("Expected keyword, got {}".format(open_keyword))
@@ -460,8 +536,8 @@ def parse_application(tokenstream):
     if not isinstance(open_paren, OpenParenthesis):
         raise ParsingException(
             "Expected an open parenthesis token, got {}.".format(open_paren))
-    first = parse_expression(tokenstream)
-    rest = parse_rest(tokenstream, closer=CloseParenthesis)
+    first = yield parse_subexpression
+    rest = yield from parse_rest(tokenstream, closer=CloseParenthesis)
 
     if not isinstance(first, IdentifierAtom):
         raise ParsingException("Expected first element of application to be "
@@ -498,18 +574,21 @@ def parse_collection(tokenstream, *, item_parser=None):
         # TODO: error checking
         _close_block_signifier = tokenstream.pop()
         _dash = tokenstream.pop()
-        _indent = parse_expression_expecting(tokenstream, being_instance=Indent)
-        items = parse_rest(tokenstream, closer=Dedent, **item_parsing_kwargs)
+        _indent = yield from parse_expression_expecting(
+            tokenstream, being_instance=Indent)
+        items = yield from parse_rest(tokenstream, closer=Dedent,
+                                      **item_parsing_kwargs)
     else:
-        items = parse_rest(tokenstream, closer=closer, **item_parsing_kwargs)
+        items = yield from parse_rest(tokenstream, closer=closer,
+                                      **item_parsing_kwargs)
     return collection_class(items)
 
 def parse_sequential(tokenstream):
     return parse_collection(tokenstream)
 
 def parse_association(tokenstream):
-    key = parse_expression(tokenstream)
-    value = parse_expression(tokenstream)
+    key = yield parse_subexpression
+    value = yield parse_subexpression
     association_delimiter = tokenstream.pop()
     if not isinstance(association_delimiter, Semicolon):
         raise ParsingException("Expected semicolon to separate associations")
@@ -518,62 +597,90 @@ def parse_association(tokenstream):
 def parse_associative(tokenstream):
     return parse_collection(tokenstream, item_parser=parse_association)
 
-def parse_expression(tokenstream):
+# Which parser takes it from here depends only on the type of the token
+# we're at, so rather than asking the token whether it's an instance of
+# each kind of token in turn, we look its type up in a table (which new
+# kinds of token can be added to with `@PARSELETS.register`).
+
+PARSELETS = DispatchTable("parselet")
+
+PARSELETS.register(Keyword)(parse_codeform)  # indented codeforms
+PARSELETS.register(OpenParenthesis)(parse_application)
+PARSELETS.register(OpenBracket, Pipe)(parse_sequential)
+# (still need to name the '<' thingy)
+PARSELETS.register(OpenBrace)(parse_associative)
+
+@PARSELETS.register(OpenDelimiter)
+def parse_unadvanceable(tokenstream):
+    raise ParsingException(
+        "Failed to advance from opening delimiter {}".format(
+            tokenstream.peek()))
+
+@PARSELETS.register(AbstractDent)
+def parse_dent(tokenstream):
+    # XXX INCONSISTENCY TODO FIXME RESEARCH: the indent/dedent/aligned-newline
+    # tokens don't have representations; rather than recreate parallel
+    # boilerplate here, maybe try out letting the token stand for itself??
+    # Distinguishing "atoms" in this module and "tokens" in the lexer seemed
+    # like a good idea on the grounds that lexing and parsing are different
+    # things, but maybe the token/atom distinction isn't actually buying us
+    # very much??
+    return tokenstream.pop()
+
+@PARSELETS.register(TypeSpecifier)
+def parse_type_specifier(tokenstream):
+    return TypeSpecifierAtom(tokenstream.pop().representation)
+
+@PARSELETS.register(IntegerLiteral)
+def parse_integer(tokenstream):
+    return IntegerAtom(int(tokenstream.pop().representation))
+
+@PARSELETS.register(FloatLiteral)
+def parse_float(tokenstream):
+    return FloatAtom(float(tokenstream.pop().representation))
+
+@PARSELETS.register(StringLiteral)
+def parse_string(tokenstream):
+    return StringAtom(tokenstream.pop().representation.strip('"'))
+
+@PARSELETS.register(BooleanLiteral)
+def parse_boolean(tokenstream):
+    return BooleanAtom(tokenstream.pop().representation == "Truth")
+
+@PARSELETS.register(VoidLiteral)
+def parse_void(tokenstream):
+    tokenstream.pop()
+    return VoidAtom(None)
+
+@PARSELETS.register(Identifier)
+def parse_identifier(tokenstream):
+    return IdentifierAtom(tokenstream.pop().representation)
+
+@PARSELETS.register(Reserved)
+def parse_reserved(tokenstream):
+    return ReservedAtom(tokenstream.pop().representation)
+
+@PARSELETS.register(Token)
+def parse_unrecognizable(tokenstream):
+    raise ParsingException("Failed to recognize an expression from "
+                           "{}".format(tokenstream.pop()))
+
+def parse_subexpression(tokenstream):
+    """An atom, or a generator that parses a compound expression (see
+    above)."""
     leading_token = tokenstream.peek()
-    logger.debug("leading_token in parse_expression is %s", leading_token)
-
-    if isinstance(leading_token, Keyword):  # indented codeforms
-        return parse_codeform(tokenstream)
-    elif isinstance(leading_token, OpenDelimiter):  # collections
-        if isinstance(leading_token, OpenParenthesis):
-            return parse_application(tokenstream)
-        elif (isinstance(leading_token, OpenBracket) or
-            isinstance(leading_token, Pipe)):
-            return parse_sequential(tokenstream)
-        elif (isinstance(leading_token, OpenBrace) or
-              # still need to name the '<' thingy
-              False):
-            return parse_associative(tokenstream)
-        else:
-            raise ParsingException(
-                "Failed to advance from opening delimiter {}".format(
-                    leading_token))
-    else:  # atoms
-        expression_token = tokenstream.pop()
-        if isinstance(expression_token, Keyword):
-            return PrimitiveAtom(expression_token.representation)
-        elif isinstance(expression_token, AbstractDent):
-            # XXX INCONSISTENCY TODO FIXME RESEARCH: the
-            # indent/dedent/aligned-newline tokens don't have representations;
-            # rather than recreate parallel boilerplate here, maybe try out
-            # letting the token stand for itself?? Distinguishing "atoms" in
-            # this module and "tokens" in the lexer seemed like a good idea on
-            # the grounds that lexing and parsing are different things, but
-            # maybe the token/atom distinction isn't actually buying us very
-            # much??
-            return expression_token
-        elif isinstance(expression_token, TypeSpecifier):
-            return TypeSpecifierAtom(expression_token.representation)
-        elif isinstance(expression_token, IntegerLiteral):
-            return IntegerAtom(int(leading_token.representation))
-        elif isinstance(expression_token, FloatLiteral):
-            return FloatAtom(float(leading_token.representation))
-        elif isinstance(expression_token, StringLiteral):
-            return StringAtom(expression_token.representation.strip('"'))
-        elif isinstance(expression_token, BooleanLiteral):
-            return (BooleanAtom(True)
-                    if expression_token.representation == "Truth"
-                    else BooleanAtom(False))
-        elif isinstance(expression_token, VoidLiteral):
-            return VoidAtom(None)
-        elif isinstance(expression_token, Identifier):
-            return IdentifierAtom(expression_token.representation)
-        elif isinstance(expression_token, Reserved):
-            return ReservedAtom(expression_token.representation)
-        else:
-            raise ParsingException("Failed to recognize an expression from "
-                                   "{}".format(expression_token))
+    logger.debug("leading_token in parse_subexpression is %s", leading_token)
+    return PARSELETS[type(leading_token)](tokenstream)
+
+def parse_expression(tokenstream):
+    return trampoline(lambda parser: parser(tokenstream), parse_subexpression)
 
 def parse(tokenstream):
     while True:
+        try:
+            tokenstream.peek()
+        except StopIteration:
+            # (a bare `StopIteration` escaping a generator becomes a
+            # `RuntimeError` as of PEP 479)
+            return
         yield parse_expression(tokenstream)
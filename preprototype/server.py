@@ -0,0 +1,118 @@
+import json
+import os
+import signal
+import socketserver
+import threading
+import traceback
+
+import driver
+from client import DEFAULT_SOCKET_PATH, server_is_listening
+from utils import get_logger
+
+logger = get_logger(__name__)
+
+
+COMPILER_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+
+# (See client.py for the protocol.)
+
+
+def compiler_fingerprint():
+    """Modification times of the compiler's own source, so that a server
+    can notice that it's running yesterday's compiler."""
+    fingerprint = []
+    for filename in sorted(os.listdir(COMPILER_DIRECTORY)):
+        if filename.endswith(".py") or filename == "builtins.rs":
+            fingerprint.append(
+                (filename, os.stat(os.path.join(COMPILER_DIRECTORY,
+                                                filename)).st_mtime_ns))
+    return fingerprint
+
+
+class _ResponseStream:
+    """A writable file-like object that forwards what's written to it to
+    the client as one of its output streams."""
+
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+
+    def write(self, text):
+        if text:
+            self.connection.write(
+                (json.dumps({self.name: text}) + "\n").encode('utf8'))
+        return len(text)
+
+    def flush(self):
+        self.connection.flush()
+
+
+class CompileRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        request = json.loads(self.rfile.readline().decode('utf8'))
+        if compiler_fingerprint() != self.server.fingerprint:
+            logger.info("compiler source has changed; shutting down")
+            self._respond(stale=True)
+            # (`shutdown` waits for `serve_forever` to notice, so it
+            # can't be called from the thread that's serving)
+            threading.Thread(target=self.server.shutdown).start()
+            return
+
+        out = _ResponseStream(self.wfile, 'stdout')
+        err = _ResponseStream(self.wfile, 'stderr')
+        try:
+            exit_code = driver.compile_program(
+                **request, out=out, err=err, capture_rustc_output=True)
+        except Exception:
+            err.write(traceback.format_exc())
+            exit_code = 1
+        self._respond(exit_code=exit_code)
+
+    def _respond(self, **response):
+        self.wfile.write((json.dumps(response) + "\n").encode('utf8'))
+
+
+class CompileServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        # Importing the driver has already compiled the lexer's regexes
+        # and so forth; read the prelude before taking any requests, too.
+        driver.load_prelude()
+        self.fingerprint = compiler_fingerprint()
+
+        if os.path.exists(socket_path):
+            if server_is_listening(socket_path):
+                raise OSError("a compile server is already listening "
+                              "on {}".format(socket_path))
+            os.unlink(socket_path)  # left behind by a server that crashed
+        # Anyone who can connect to the socket can get us to read and
+        # write files on their behalf, so don't let anyone but us connect.
+        previous_umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, CompileRequestHandler)
+        finally:
+            os.umask(previous_umask)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+
+
+def serve(socket_path=DEFAULT_SOCKET_PATH):
+    server = CompileServer(socket_path)
+
+    def stop(signal_number, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, stop)
+
+    logger.info("Glitteral compile server listening on %s", socket_path)
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
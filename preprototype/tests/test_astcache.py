@@ -0,0 +1,151 @@
+import sys
+sys.path.insert(0, '..')
+
+import hashlib
+import io
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import astcache
+from annotator import Compilation
+from backend import generate_code
+from driver import compile_program, compile_to_rust
+from instrumentation import Instruments
+
+
+REPOSITORY_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "..", "..")
+EXAMPLES = ["bubblesort", "collatz", "fizzbuzz", "meet_and_greet"]
+
+
+class AstCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scratch = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.scratch.cleanup()
+
+    def _example(self, example):
+        source_path = os.path.join(self.scratch.name, example + ".gltrl")
+        shutil.copy(os.path.join(REPOSITORY_ROOT, "eg", example + ".gltrl"),
+                    source_path)
+        return source_path
+
+    def _compile(self, source_path, **options):
+        out = io.StringIO()
+        with Instruments() as instruments:
+            self.assertEqual(0, compile_program(
+                source_path, emit='rust', out=out, instruments=instruments,
+                **options))
+        return out.getvalue(), instruments.report()['counts']
+
+    def test_cached_ast_compiles_to_the_same_rust(self):
+        for example in EXAMPLES:
+            source_path = self._example(example)
+            uncached, _ = self._compile(source_path, use_cache=False)
+            self.assertFalse(
+                os.path.exists(astcache.cache_path(source_path)))
+
+            first, counts = self._compile(source_path)
+            self.assertEqual(1, counts['ast_cache_misses'])
+            self.assertTrue(os.path.exists(astcache.cache_path(source_path)))
+
+            second, counts = self._compile(source_path)
+            self.assertEqual(1, counts['ast_cache_hits'])
+            self.assertNotIn('tokens', counts)  # (no lexing at all)
+
+            self.assertEqual(uncached, first)
+            self.assertEqual(uncached, second)
+
+    def test_changed_source_is_recompiled(self):
+        source_path = self._example("fizzbuzz")
+        self._compile(source_path)
+        with open(source_path, 'a') as source_file:
+            source_file.write("(println \"and that's all\")\n")
+        rust, counts = self._compile(source_path)
+        self.assertEqual(1, counts['ast_cache_misses'])
+        self.assertIn("and that's all", rust)
+
+    def test_other_frontend_versions_cache_is_rejected(self):
+        source_path = self._example("fizzbuzz")
+        self._compile(source_path)
+        with mock.patch('astcache.frontend_version',
+                        return_value=bytes(astcache.DIGEST_SIZE)):
+            _, counts = self._compile(source_path)
+            self.assertEqual(1, counts['ast_cache_misses'])
+            _, counts = self._compile(source_path)
+            self.assertEqual(1, counts['ast_cache_hits'])
+        _, counts = self._compile(source_path)
+        self.assertEqual(1, counts['ast_cache_misses'])
+
+    def test_damaged_cache_is_rejected(self):
+        source_path = self._example("collatz")
+        expected, _ = self._compile(source_path)
+        with open(astcache.cache_path(source_path), 'r+b') as cache_file:
+            cache_file.truncate(os.path.getsize(cache_file.name) - 10)
+        rust, counts = self._compile(source_path)
+        self.assertEqual(1, counts['ast_cache_misses'])
+        self.assertEqual(expected, rust)
+
+    def test_hostile_cache_is_rejected(self):
+        source_path = self._example("collatz")
+        planted = os.path.join(self.scratch.name, "planted")
+
+        class Hostile:
+            def __reduce__(self):
+                return os.mkdir, (planted,)
+
+        # (a cache file whose header is in perfect order, as anyone with
+        # the source could make one)
+        payload = b''.join(pickle.dumps(item, astcache.PROTOCOL)
+                           for item in (1, Hostile(), None))
+        with open(astcache.cache_path(source_path), 'wb') as cache_file:
+            cache_file.write(
+                astcache.MAGIC + bytes([astcache.FORMAT_VERSION]) +
+                astcache.frontend_version() +
+                astcache.source_digest(source_path) +
+                hashlib.sha256(payload).digest() + payload)
+        with self.assertRaises(astcache.AstCacheException):
+            compile_program(source_path, emit='rust', out=io.StringIO())
+        self.assertFalse(os.path.exists(planted))
+
+    def test_abandoned_compilation_leaves_no_cache_file(self):
+        source_path = self._example("bubblesort")
+        forms, hit = astcache.cached_forms(
+            source_path, Compilation(),
+            lambda source_file: iter([mock.Mock()]))
+        self.assertFalse(hit)
+        with self.assertRaises(Exception):
+            next(forms)  # (a `Mock` doesn't pickle)
+        self.assertEqual(["bubblesort.gltrl"], os.listdir(self.scratch.name))
+
+    def _emit_ast(self, source_path):
+        emitted = io.BytesIO()
+        out = io.TextIOWrapper(emitted, write_through=True)
+        self.assertEqual(0, compile_program(source_path, emit='ast', out=out))
+        return emitted.getvalue()
+
+    def test_emitted_ast_can_be_read_back(self):
+        source_path = self._example("bubblesort")
+        with open(source_path) as source_file:
+            expected_rust = io.StringIO()
+            compile_to_rust(source_file, expected_rust)
+
+        from_scratch = self._emit_ast(source_path)
+        self._compile(source_path)  # (which leaves a cache file behind)
+        from_cache = self._emit_ast(source_path)
+        self.assertEqual(from_scratch, from_cache)
+
+        compilation = Compilation()
+        forms = astcache.read_ast(io.BytesIO(from_cache), compilation)
+        self.assertEqual(expected_rust.getvalue(),
+                         generate_code(forms, compilation))
+
+
+if __name__ == "__main__":
+    unittest.main()
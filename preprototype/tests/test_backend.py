@@ -4,9 +4,8 @@ sys.path.insert(0, '..')
 import textwrap
 import unittest
 
-from unittest import mock
-
-from backend import condescend_to_ascii, generate_associative
+from annotator import Binding, Compilation
+from backend import condescend_to_ascii, generate_expression
 from parser import Dictionary, Association, StringAtom, IntegerAtom, IdentifierAtom
 
 
@@ -23,10 +22,11 @@ class CodeGenerationTestCase(unittest.TestCase):
              Association(StringAtom("quux"), IntegerAtom(5))]
         )
         dictionary_node.identifier = IdentifierAtom("dee")
-        dictionary_node.identifier.local_environment['dee'] = mock.Mock()
+        dictionary_node.identifier.binding = Binding("global",
+                                                     dictionary_node, True)
         expected_code = """HashMap::new();
-&mut dee.insert("bar", 4isize);
-&mut dee.insert("quux", 5isize);
+dee.insert("bar", 4isize);
+dee.insert("quux", 5isize);
 """
-        generated_code = generate_associative(dictionary_node)
+        generated_code = generate_expression(dictionary_node, Compilation())
         self.assertEqual(expected_code, generated_code)
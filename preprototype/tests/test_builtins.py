@@ -0,0 +1,262 @@
+import sys
+sys.path.insert(0, '..')
+
+import contextlib
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from driver import compile_program
+
+
+@contextlib.contextmanager
+def _compiled(source, **options):
+    """The path to an executable of the program `source` (compiled with
+    `options`, as for `compile_program`)."""
+    with tempfile.TemporaryDirectory() as scratch:
+        source_path = os.path.join(scratch, "program.gltrl")
+        with open(source_path, 'w') as source_file:
+            source_file.write(source)
+        if compile_program(source_path, use_cache=False, **options) != 0:
+            raise AssertionError("{!r} didn't compile".format(source))
+        yield source_path[:-6]
+
+def _run(source, stdin=b'', timeout=None, **options):
+    """Compile the program `source`, run it (for no longer than
+    `timeout` seconds, if given), and return what it printed."""
+    with _compiled(source, **options) as executable_path:
+        return subprocess.run([executable_path], input=stdin,
+                              stdout=subprocess.PIPE, timeout=timeout,
+                              check=True).stdout
+
+
+@unittest.skipUnless(shutil.which("rustc"), "needs rustc")
+class ListBuiltinsTestCase(unittest.TestCase):
+
+    def test_named_builtin_lists(self):
+        self.assertEqual(b"[0, 1, 2]\n3\n[0, 1, 2, 7]\n10\n[9, 6, 3, 0]\n18\n",
+                         _run("""
+:=λ total |xs ^[int]| → ^int
+   := t 0
+   for |x xs|—
+      := t (+ t x)
+   t
+:= r (range 0 3)
+(println_container r)
+(println (length r))
+(append! r 7)
+(println r)
+:= countdown (reverse_range 0 10)
+(println (length countdown))
+:= threes (comprehend [] [i (step_range 0 10 3)] (− 9 i))
+(println threes)
+(println (total threes))
+"""))
+
+
+@unittest.skipUnless(shutil.which("rustc"), "needs rustc")
+class TimeBuiltinsTestCase(unittest.TestCase):
+
+    def test_clocks(self):
+        self.assertEqual(b"true\ntrue\ntrue\n", _run("""
+:= start (instant)
+(sleep 0.05)
+(sleep 0)
+:= measured (elapsed start)
+(println (not_less? measured 0.05))
+(println (less? measured 1.))
+(println (greater? (current_time) 1500000000.))
+"""))
+
+
+@unittest.skipUnless(shutil.which("rustc"), "needs rustc")
+class OutputBuiltinsTestCase(unittest.TestCase):
+
+    def _first_output(self, source, expected, **options):
+        # (what the program prints before it goes to sleep, which we
+        # mustn't wait out)
+        with _compiled(source, **options) as executable_path:
+            program = subprocess.Popen([executable_path],
+                                       stdout=subprocess.PIPE)
+            try:
+                self.assertEqual(expected,
+                                 program.stdout.read(len(expected)))
+            finally:
+                program.kill()
+                program.wait()
+                program.stdout.close()
+
+    def test_output_flushed_before_input_and_at_exit(self):
+        self.assertEqual(b"Name? Hello, Pinkie!\n" + b"[1, 2]\n" * 1000,
+                         _run("""
+(print "Name? ")
+:= name (input)
+(print "Hello, ")
+(print name)
+(println "!")
+:= xs [1 2]
+for |i (range 0 1000)|—
+   (println xs)
+""", stdin=b"Pinkie\n"))
+
+    def test_flush(self):
+        self._first_output("(print \"ready\")\n(flush)\n(sleep 60)\n",
+                           b"ready")
+
+    def test_unbuffered(self):
+        self._first_output("(print \"ready\")\n(sleep 60)\n", b"ready",
+                           unbuffered=True)
+
+    def test_output_flushed_when_panicking(self):
+        with _compiled("""
+(println "before")
+:= xs [1]
+(println (_ xs 5))
+""") as executable_path:
+            panicked = subprocess.run([executable_path],
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.DEVNULL)
+        self.assertEqual(101, panicked.returncode)
+        self.assertEqual(b"before\n", panicked.stdout)
+
+
+
+@unittest.skipUnless(shutil.which("rustc"), "needs rustc")
+class InputBuiltinsTestCase(unittest.TestCase):
+
+    def test_lines(self):
+        self.assertEqual(b"[1]\n[ 2 ]\n[]\n[x]\n[40]\n43\n", _run("""
+:= total 0
+for |line (lines)|—
+   (print "[")
+   (print line)
+   (println "]")
+   := total (+ total (parse_int_or line 0))
+(println total)
+""", stdin=b"1\n 2 \n\nx\r\n40"))
+
+    def test_lines_alongside_input(self):
+        # (standard input mustn't still be locked by the loop when its
+        # body reads from it)
+        self.assertEqual(b'a b\n["c", "d"]\n', _run("""
+for |line (lines)|—
+   (print line)
+   (print " ")
+   (println (input))
+   (println (lines))
+""", stdin=b"a\nb\nc\nd\n", timeout=10))
+
+    def test_named_lines(self):
+        self.assertEqual(b"[a]\n[b]\nb\n2\n", _run("""
+:= ls (lines)
+for |l ls|—
+   (print "[")
+   (print l)
+   (println "]")
+(println (_ ls 1))
+(println (length ls))
+""", stdin=b"a\nb\n"))
+
+    def test_lines_listed(self):
+        self.assertEqual(b'["a", "b"]\n', _run("(println (lines))\n",
+                                                stdin=b"a\nb\n"))
+
+    def test_read_all_and_input(self):
+        self.assertEqual(b"Fluttershy.\n1.5 -1\nall\nthe rest\n", _run("""
+:= name (input)
+(print name)
+(println ".")
+(print (parse_float_or (input) 0.))
+(print " ")
+(println (parse_int_or (input) (− 0 1)))
+(print (read_all))
+""", stdin=b"  Fluttershy \n 1.5\nseven\nall\nthe rest\n"))
+
+    def test_parse_int(self):
+        self.assertEqual(b"42\n", _run("(println (parse_int (input)))\n",
+                                       stdin=b"42\n"))
+        with self.assertRaises(subprocess.CalledProcessError):
+            _run("(println (parse_int (input)))\n", stdin=b"many\n")
+
+
+@unittest.skipUnless(shutil.which("rustc"), "needs rustc")
+class FileBuiltinsTestCase(unittest.TestCase):
+
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            path = os.path.join(scratch, "numbers.txt")
+            empty_path = os.path.join(scratch, "empty.txt")
+            self.assertEqual(
+                b"1\n 2\r\n\nx\n40\n" + b"43\n12\n12\n5\n"
+                b'["1", " 2", "", "x", "40"]\n[]\n',
+                _run("""
+(write_file "{0}" "1\\n 2\\r\\n\\nx\\n40\\n")
+(print (read_file "{0}"))
+:= total 0
+for |line (file_lines "{0}")|—
+   := total (+ total (parse_int_or line 0))
+(println total)
+:= numbers (map_file "{0}")
+:=λ size |file ^file| → ^int
+   (mapped_size file)
+(println (size numbers))
+(println (length (mapped_bytes numbers)))
+:= newlines 0
+for |byte (mapped_bytes numbers)|—
+   if (= byte 10)—
+      := newlines (+ newlines 1)
+(println newlines)
+(println (mapped_lines numbers))
+(write_file "{1}" "")
+(println (file_lines "{1}"))
+""".format(path, empty_path)))
+
+    def test_named_file_lines(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            path = os.path.join(scratch, "ponies.txt")
+            with open(path, 'w') as ponies:
+                ponies.write("Rarity\nApplejack\n")
+            self.assertEqual(
+                b"Rarity\nApplejack\nApplejack 2\n"
+                b"Rarity\nApplejack\nRarity 2\n", _run("""
+:= listed (file_lines "{0}")
+for |pony listed|—
+   (println pony)
+(print (_ listed 1))
+(print " ")
+(println (length listed))
+:= mapped (mapped_lines (map_file "{0}"))
+for |pony mapped|—
+   (println pony)
+(print (_ mapped 0))
+(print " ")
+(println (length mapped))
+""".format(path)))
+
+    def test_missing_file(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            _run("(println (read_file \"/nonexistent/file\"))\n")
+
+
+@unittest.skipUnless(shutil.which("rustc"), "needs rustc")
+class ComprehensionTestCase(unittest.TestCase):
+
+    def test_comprehensions(self):
+        self.assertEqual(
+            b"[0, 1, 4, 9, 16, 25, 36, 49, 64, 81, 100]\n"
+            b'["Twilight", "Applejack", "Rarity"]\n[1, 3, 9, 15]\n6\n',
+            _run("""
+:= squares (comprehend [] [i (range 0 10)] (⋅ i i))
+(append! squares 100)
+(println squares)
+:= ponies ["Applejack" "Rarity"]
+(println (comprehend ["Twilight"] [pony ponies] pony))
+(println (comprehend [1] [i (step_range 1 10 3)] (+ (⋅ i 2) 1)))
+(println (length (comprehend [] [line (lines)] (parse_int line))))
+""", stdin=b"1\n2\n3\n4\n5\n6\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
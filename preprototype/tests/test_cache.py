@@ -0,0 +1,87 @@
+import sys
+sys.path.insert(0, '..')
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from cache import CompileCache
+
+
+class CompileCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scratch = tempfile.TemporaryDirectory()
+        self.cache = CompileCache(os.path.join(self.scratch.name, "cache"),
+                                  size_limit=1024)
+
+    def tearDown(self):
+        self.scratch.cleanup()
+
+    def _executable(self, name, contents):
+        path = os.path.join(self.scratch.name, name)
+        with open(path, 'wb') as executable:
+            executable.write(contents)
+        return path
+
+    def test_key_depends_on_every_ingredient(self):
+        ingredients = ("digest", "prelude", ["--allow", "dead_code"],
+                       "rustc 1.0.0")
+        key = CompileCache.key(*ingredients)
+        self.assertEqual(key, CompileCache.key(*ingredients))
+        for i in range(len(ingredients)):
+            varied = list(ingredients)
+            varied[i] = (["--allow", "unused_mut"] if i == 2
+                         else ingredients[i] + "!")
+            with self.subTest(varied=i):
+                self.assertNotEqual(key, CompileCache.key(*varied))
+        # ingredients can't bleed into each other
+        self.assertNotEqual(CompileCache.key("ab", "c", [], ""),
+                            CompileCache.key("a", "bc", [], ""))
+
+    def test_store_and_fetch(self):
+        executable = self._executable("built", b"\x7fELF and so on")
+        destination = os.path.join(self.scratch.name, "wanted")
+        self.assertFalse(self.cache.fetch("0" * 64, destination))
+        self.cache.store("0" * 64, executable)
+        self.assertTrue(self.cache.fetch("0" * 64, destination))
+        with open(destination, 'rb') as fetched:
+            self.assertEqual(b"\x7fELF and so on", fetched.read())
+
+    def test_entry_evicted_while_fetching_is_a_miss(self):
+        key = "0" * 64
+        destination = os.path.join(self.scratch.name, "wanted")
+        self.cache.store(key, self._executable("built", b"\x7fELF"))
+        link = os.link
+
+        def evicting_link(source, link_name):
+            # (as though another compilation got there first)
+            os.unlink(self.cache.entry_path(key))
+            link(source, link_name)
+
+        with mock.patch('os.link', evicting_link):
+            self.assertFalse(self.cache.fetch(key, destination))
+        self.assertFalse(os.path.exists(destination))
+
+        self.cache.store(key, self._executable("built", b"\x7fELF"))
+        with mock.patch('os.link', side_effect=OSError("no hard links")), \
+             mock.patch('shutil.copy2', side_effect=FileNotFoundError):
+            self.assertFalse(self.cache.fetch(key, destination))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        first, second, third = ("a" * 64, "b" * 64, "c" * 64)
+        for i, key in enumerate((first, second)):
+            self.cache.store(key, self._executable(key, bytes(400)))
+            os.utime(self.cache.entry_path(key), (i, i))
+        # using the first entry makes the second one the least recent
+        self.assertTrue(self.cache.fetch(
+            first, os.path.join(self.scratch.name, "wanted")))
+        self.cache.store(third, self._executable(third, bytes(400)))
+        self.assertTrue(os.path.exists(self.cache.entry_path(first)))
+        self.assertFalse(os.path.exists(self.cache.entry_path(second)))
+        self.assertTrue(os.path.exists(self.cache.entry_path(third)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import sys
+sys.path.insert(0, '..')
+
+import glob
+import io
+import os
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from lexer import lex, BaseLexer, TOKENCLASSES
+from parser import parse
+from annotator import annotate, Compilation
+from driver import compile_to_rust
+
+
+REPOSITORY_ROOT = os.path.join(os.path.dirname(__file__), "..", "..")
+
+def example_sources():
+    source_paths = sorted(
+        glob.glob(os.path.join(REPOSITORY_ROOT, "eg", "*.gltrl")) +
+        glob.glob(os.path.join(REPOSITORY_ROOT, "preprototype", "*.gltrl")))
+    sources = []
+    for source_path in source_paths:
+        with open(source_path) as source_file:
+            sources.append(source_file.read())
+    return sources
+
+def rust_for(source):
+    code = io.StringIO()
+    compile_to_rust(source, code)
+    return code.getvalue()
+
+
+class ConcurrentCompilationTestCase(unittest.TestCase):
+    REPETITIONS = 8
+
+    def test_concurrent_compilations_match_sequential_ones(self):
+        sources = example_sources() * self.REPETITIONS
+        sequential = [rust_for(source) for source in sources]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            concurrent = list(executor.map(rust_for, sources))
+        self.assertEqual(sequential, concurrent)
+
+    def test_concurrent_reference_lexing(self):
+        # The reference lexer consults the indentation recognizers, whose
+        # choice depends on each lexer's own indentation level.
+        def reference_tokenization(source):
+            return BaseLexer(TOKENCLASSES).tokenize(source)
+
+        # (the reference lexer is slow, so we go easy on repetitions)
+        sources = example_sources() * 2
+        sequential = [reference_tokenization(source) for source in sources]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            concurrent = list(executor.map(reference_tokenization, sources))
+        self.assertEqual(sequential, concurrent)
+
+    def test_compilations_do_not_share_definitions(self):
+        first, second = Compilation(), Compilation()
+        list(annotate(parse(lex(":= shared? Truth\n")), first))
+        self.assertIn('shared?', first.global_environment)
+        self.assertNotIn('shared?', second.global_environment)
+
+
+if __name__ == "__main__":
+    unittest.main()
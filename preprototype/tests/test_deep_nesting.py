@@ -0,0 +1,44 @@
+import sys
+sys.path.insert(0, '..')
+
+import io
+import os
+import tempfile
+import unittest
+
+import astcache
+from driver import compile_program
+
+
+DEPTH = 100000
+
+
+class DeepNestingTestCase(unittest.TestCase):
+
+    def test_compile_deeply_nested_expression(self):
+        recursion_limit = sys.getrecursionlimit()
+        self.assertLess(recursion_limit, DEPTH)  # (no cheating)
+        with tempfile.TemporaryDirectory() as scratch:
+            source_path = os.path.join(scratch, "deep.gltrl")
+            with open(source_path, 'w') as source_file:
+                source_file.write("(println {}1{})\n".format(
+                    "(+ 1 " * DEPTH, ")" * DEPTH))
+            # (once through the whole frontend, writing the AST cache,
+            # and once reading it back)
+            compilations = []
+            for _ in range(2):
+                out = io.StringIO()
+                self.assertEqual(0, compile_program(source_path,
+                                                    emit='rust', out=out))
+                compilations.append(out.getvalue())
+            self.assertTrue(
+                os.path.exists(astcache.cache_path(source_path)))
+        first, second = compilations
+        self.assertEqual(first, second)
+        self.assertEqual(DEPTH + 1, first.count("1isize"))
+        self.assertIn("1isize" + ")" * DEPTH, first)
+        self.assertEqual(recursion_limit, sys.getrecursionlimit())
+
+
+if __name__ == "__main__":
+    unittest.main()
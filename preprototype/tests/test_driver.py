@@ -0,0 +1,87 @@
+import sys
+sys.path.insert(0, '..')
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from driver import compile_batch, compile_program, expand_source_paths
+
+
+REPOSITORY_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "..", "..")
+EXAMPLES = ["bubblesort", "collatz", "fizzbuzz"]
+
+
+class BatchCompilationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scratch = tempfile.TemporaryDirectory()
+        for example in EXAMPLES:
+            shutil.copy(
+                os.path.join(REPOSITORY_ROOT, "eg", example + ".gltrl"),
+                self.scratch.name)
+
+    def tearDown(self):
+        self.scratch.cleanup()
+
+    def _path(self, filename):
+        return os.path.join(self.scratch.name, filename)
+
+    def test_expand_source_paths(self):
+        self.assertEqual(
+            [self._path(example + ".gltrl") for example in EXAMPLES] +
+            ["elsewhere.gltrl"],
+            expand_source_paths([self.scratch.name, "elsewhere.gltrl"]))
+
+    def test_batch_writes_what_single_compilations_print(self):
+        out, err = io.StringIO(), io.StringIO()
+        exit_code = compile_batch(expand_source_paths([self.scratch.name]),
+                                  jobs=2, emit='rust', out=out, err=err)
+        self.assertEqual(0, exit_code)
+        self.assertIn("compiled 3 of 3 programs", out.getvalue())
+        for example in EXAMPLES:
+            printed = io.StringIO()
+            compile_program(self._path(example + ".gltrl"), emit='rust',
+                            out=printed)
+            with open(self._path(
+                    "__{}.gltrl_compiled.rs".format(example))) as written:
+                # (`--just-rust` adds a trailing newline when printing)
+                self.assertEqual(printed.getvalue(), written.read() + "\n")
+
+    def test_batch_reports_each_failure(self):
+        with open(self._path("broken.gltrl"), 'w') as broken:
+            broken.write("(println not_defined_anywhere)\n")
+        out, err = io.StringIO(), io.StringIO()
+        exit_code = compile_batch(
+            expand_source_paths([self.scratch.name]) + ["not_glitteral.py"],
+            emit='rust', out=out, err=err)
+        self.assertEqual(1, exit_code)
+        self.assertIn("{}: FAILED".format(self._path("broken.gltrl")),
+                      out.getvalue())
+        self.assertIn("not_glitteral.py: FAILED", out.getvalue())
+        self.assertIn("{}: ok".format(self._path("fizzbuzz.gltrl")),
+                      out.getvalue())
+        self.assertIn("compiled 3 of 5 programs", out.getvalue())
+        self.assertIn("not_defined_anywhere", err.getvalue())
+
+    def test_batch_fails_when_rustc_is_killed(self):
+        def build_executable(source_path, *args, **kwargs):
+            # (as when rustc is OOM-killed)
+            return (-9 if source_path.endswith("collatz.gltrl") else 0), ''
+
+        out, err = io.StringIO(), io.StringIO()
+        with mock.patch('driver.build_executable', build_executable):
+            exit_code = compile_batch(
+                expand_source_paths([self.scratch.name]), out=out, err=err)
+        self.assertEqual(-9, exit_code)
+        self.assertIn("{}: FAILED".format(self._path("collatz.gltrl")),
+                      out.getvalue())
+        self.assertIn("compiled 2 of 3 programs", out.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
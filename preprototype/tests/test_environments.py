@@ -0,0 +1,79 @@
+import sys
+sys.path.insert(0, '..')
+
+import unittest
+import weakref
+
+from environments import *  # it's fine
+
+
+class EnvironmentTestCase(unittest.TestCase):
+
+    def test_extended_frames_shadow_without_copying(self):
+        outer = Environment({'a': 1, 'b': 2})
+        inner = outer.extended({'b': 3})
+        self.assertEqual(1, inner['a'])
+        self.assertEqual(3, inner['b'])
+        self.assertEqual(2, outer['b'])
+        self.assertEqual({'a': 1, 'b': 3}, dict(inner))
+        self.assertIs(outer, inner.parent)
+
+    def test_missing_names(self):
+        self.assertIsNone(Environment().extended({'a': 1}).get('b'))
+        with self.assertRaises(KeyError):
+            Environment()['b']
+
+
+class PersistentEnvironmentTestCase(unittest.TestCase):
+
+    def test_binding_leaves_earlier_versions_alone(self):
+        before = PersistentEnvironment({'+': "add"})
+        between = before.bind('a', 1)
+        after = between.bind('a', 2)
+
+        self.assertIsNone(before.get('a'))
+        self.assertEqual("add", before['+'])
+        self.assertEqual(1, between['a'])
+        self.assertEqual(2, after['a'])
+        self.assertEqual({'+', 'a'}, set(after))
+        self.assertEqual({'+'}, set(before))
+        self.assertEqual(2, len(after))
+
+    def test_many_bindings(self):
+        environment = PersistentEnvironment()
+        for i in range(5000):
+            environment = environment.bind("name_{}".format(i), i)
+        self.assertEqual(5000, len(environment))
+        self.assertEqual(list(range(5000)),
+                         [environment["name_{}".format(i)]
+                          for i in range(5000)])
+        self.assertNotIn("name_5000", environment)
+
+    def test_hash_collisions(self):
+        class Colliding(str):
+            def __hash__(self):
+                return 42
+
+        environment = PersistentEnvironment().bind(Colliding('a'), 1)
+        environment = environment.bind(Colliding('b'), 2)
+        environment = environment.bind(Colliding('a'), 3)
+        self.assertEqual(3, environment[Colliding('a')])
+        self.assertEqual(2, environment[Colliding('b')])
+        self.assertEqual(2, len(environment))
+        with self.assertRaises(KeyError):
+            environment[Colliding('c')]
+
+    def test_superseded_versions_can_be_collected(self):
+        class Definiendum:
+            ...
+
+        original = Definiendum()
+        original_reference = weakref.ref(original)
+        environment = PersistentEnvironment().bind('a', original)
+        environment = environment.bind('a', Definiendum())
+        del original
+        self.assertIsNone(original_reference())
+
+
+if __name__ == "__main__":
+    unittest.main()
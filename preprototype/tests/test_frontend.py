@@ -7,7 +7,8 @@ import unittest
 
 from lexer import lex
 from parser import *
-from annotator import annotate
+from annotator import (annotate, resolve, IterInto,
+                       UndefinedIdentifierException)
 
 class FrontendTestCase(unittest.TestCase):
 
@@ -47,6 +48,40 @@ for |i a|—
             for_i_in_a.global_environment['a']
         )
 
+    def test_environments_are_shared_not_copied(self):
+        source = """
+:=λ twice |a ^int| → ^int
+   (println a)
+   (+ a a)
+"""
+        defn_twice, = annotate(parse(lex(source)))
+        println_a, add_a_a = defn_twice.expressions
+        self.assertIs(println_a.local_environment, add_a_a.local_environment)
+        self.assertIs(add_a_a.local_environment,
+                      add_a_a.arguments[0].local_environment)
+        self.assertIsNot(defn_twice.local_environment,
+                         add_a_a.local_environment)
+
+    def test_unannotated_nodes_share_one_read_only_environment(self):
+        seven, eight = IntegerAtom(7), IntegerAtom(8)
+        self.assertIs(seven.local_environment, eight.global_environment)
+        with self.assertRaises(TypeError):
+            seven.local_environment['x'] = eight
+
+    def test_nodes_have_no_dict(self):
+        source = """
+:= dee {"rah" 1; "hey" 2;}
+:=λ twice |a ^int| → ^int
+   (+ a a)
+for |i (range 0 3)|—
+   (println [i 2.0 "three" Truth])
+"""
+        unvisited = list(annotate(parse(lex(source))))
+        while unvisited:
+            node = unvisited.pop()
+            self.assertFalse(hasattr(node, '__dict__'), node)
+            unvisited.extend(node.children)
+
     def test_dictionary_literal_annotated_with_definition(self):
         source = """
 := dee {"rah" 1; "hey" 2;}"""
@@ -56,6 +91,69 @@ for |i a|—
         self.assertEqual(IdentifierAtom("dee"),
                          dictionary_literal_node.identifier)
 
+    def test_identifiers_resolved_to_bindings(self):
+        source = """
+:= xs [1 2]
+:=λ f |a ^int| → ^int
+   (+ a 1)
+for |i xs|—
+   (println (f i))
+:= xs [3]
+"""
+        def_xs, defn_f, loop, redef_xs = resolve(annotate(parse(lex(source))))
+        self.assertIsNone(def_xs.superseded)
+        self.assertEqual(("global", def_xs.identified, True),
+                         redef_xs.superseded)
+
+        plus, a, _one = defn_f.expressions[0].children
+        self.assertEqual(("builtin", False), (plus.binding.kind,
+                                              plus.binding.mutable))
+        self.assertEqual("add", plus.binding.node.value)
+        self.assertEqual("argument", a.binding.kind)
+        self.assertIs(defn_f.arguments[0], a.binding.node)
+
+        i, xs, println_f_i = loop.children
+        self.assertEqual("loop index", i.binding.kind)
+        self.assertIsInstance(i.binding.node, IterInto)
+        self.assertEqual(("global", def_xs.identified, True), xs.binding)
+        f, i_again = println_f_i.arguments[0].children
+        self.assertEqual(("global", defn_f, False), f.binding)
+        self.assertEqual("loop index", i_again.binding.kind)
+
+    def test_definitions_refer_to_what_they_supersede(self):
+        source = """
+:= total 0
+:= total (+ total 1)
+:= fresh (+ fresh 1)
+"""
+        def_total, redef_total, def_fresh = annotate(parse(lex(source)))
+        list(resolve([def_total, redef_total]))
+        _plus, total, _one = redef_total.identified.children
+        # (the `total` from before, not the one being defined)
+        self.assertEqual(("global", def_total.identified, False),
+                         total.binding)
+        self.assertIs(redef_total.superseded, total.binding)
+        self.assertEqual(("global", redef_total.identified, False),
+                         redef_total.identifier.binding)
+        with self.assertRaises(UndefinedIdentifierException) as raised:
+            list(resolve([def_fresh]))
+        self.assertEqual(["fresh"], raised.exception.names)
+
+    def test_all_undefined_identifiers_reported(self):
+        source = """
+(println a)
+:= b (+ c 1)
+(print (+ a d))
+"""
+        resolved = []
+        with self.assertRaises(UndefinedIdentifierException) as raised:
+            for form in resolve(annotate(parse(lex(source)))):
+                resolved.append(form)
+        self.assertEqual(["a", "c", "d"], raised.exception.names)
+        self.assertEqual("a, c, and d are not defined",
+                         str(raised.exception))
+        self.assertEqual([], resolved)
+
     def test_block_sequential_literals(self):
         sequential_types = (List, Vector)
         item_specs = ((int, IntegerAtom,
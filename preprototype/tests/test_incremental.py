@@ -0,0 +1,160 @@
+import sys
+sys.path.insert(0, '..')
+
+import os
+import random
+import unittest
+
+from incremental import Document, Diagnostic, Location, Resolution
+
+
+REPOSITORY_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "..", "..")
+EXAMPLES = ["bubblesort", "collatz", "fizzbuzz", "fallsim", "meet_and_greet"]
+
+# things to type (or paste) into the examples, some of which break them
+# in interesting ways
+SNIPPETS = ["(", ")", "[", "]", "|", '"', "\n", "   ", "—\n   ", "#", "x",
+            ":= x 1\n", "(println x)\n", "when Truth—\n   (print 1)\n",
+            ":=λ f |a ^int| → ^int—\n   a\n", ""]
+
+
+def _shape(node):
+    # (`repr` won't do: not every node type's `__repr__` works)
+    if node is None:
+        return None
+    children = getattr(node, 'children', None)
+    if children is None or type(node).__name__.endswith("Atom"):
+        return (type(node).__name__, getattr(node, 'value', None))
+    return (type(node).__name__, tuple(_shape(child) for child in children))
+
+def _state(document):
+    return (
+        document.line_states, document.line_errors,
+        [[(type(token).__name__, token.representation) for token in tokens]
+         for tokens in document.line_tokens],
+        [(record.start, record.stop, record.last_line, _shape(record.node),
+          record.error, record.bindings, record.undefined)
+         for record in document.forms],
+        document.diagnostics()
+    )
+
+
+class IncrementalDocumentTestCase(unittest.TestCase):
+
+    def _example(self, example):
+        with open(os.path.join(REPOSITORY_ROOT, "eg",
+                               example + ".gltrl")) as source_file:
+            return source_file.read()
+
+    def test_edited_document_is_as_if_it_were_new(self):
+        randomness = random.Random(12)
+        for trial in range(15):
+            document = Document(self._example(randomness.choice(EXAMPLES)))
+            for _ in range(15):
+                lines = document.lines
+                start_line = randomness.randrange(len(lines))
+                start_column = randomness.randrange(
+                    len(lines[start_line].rstrip('\n')) + 1)
+                end_line = min(len(lines) - 1,
+                               start_line + randomness.choice([0, 0, 1, 2]))
+                end_column = randomness.randrange(
+                    start_column if end_line == start_line else 0,
+                    len(lines[end_line].rstrip('\n')) + 1)
+                document.edit((start_line, start_column),
+                              (end_line, end_column),
+                              randomness.choice(SNIPPETS))
+                fresh = Document(document.text)
+                self.assertEqual(_state(fresh), _state(document))
+                for _ in range(3):
+                    line = randomness.randrange(len(document.lines))
+                    column = randomness.randrange(
+                        len(document.lines[line]) + 1)
+                    self.assertEqual(fresh.lookup(line, column),
+                                     document.lookup(line, column))
+
+    def test_diagnostics(self):
+        document = Document(":= a 1\n(println b)\n:= c (+ a 1\n")
+        diagnostics = document.diagnostics()
+        self.assertEqual(Diagnostic(1, 9, 10, "b is not defined"),
+                         diagnostics[0])
+        # (the unclosed parenthesis)
+        self.assertEqual([2], [diagnostic.line
+                               for diagnostic in diagnostics[1:]])
+
+        # defining the name fixes it
+        document.edit((0, 0), (0, 0), ":= b 2\n")
+        self.assertNotIn("b is not defined",
+                         [diagnostic.message
+                          for diagnostic in document.diagnostics()])
+        # and renaming the definition breaks it again
+        document.edit((0, 3), (0, 4), "bb")
+        self.assertIn(Diagnostic(2, 9, 10, "b is not defined"),
+                      document.diagnostics())
+        self.assertEqual(document.text,
+                         ":= bb 2\n:= a 1\n(println b)\n:= c (+ a 1\n")
+
+    def test_lookup(self):
+        document = Document(self._example("fallsim"))
+        # (on `acceleration`, down in the while loop)
+        line = next(i for i, text in enumerate(document.lines)
+                    if "(⋅ acceleration elapsed_time)" in text)
+        column = document.lines[line].index("acceleration") + 3
+        self.assertEqual(
+            Resolution("acceleration", "definition", Location(5, 3, 15)),
+            document.lookup(line, column))
+
+        column = document.lines[line].index("elapsed_time")
+        self.assertEqual("definition",
+                         document.lookup(line, column).kind)
+        self.assertEqual(
+            Resolution("⋅", "builtin", None),
+            document.lookup(line, document.lines[line].index("⋅")))
+
+        # an argument
+        line = next(i for i, text in enumerate(document.lines)
+                    if "(square elapsed)" in text)
+        resolution = document.lookup(
+            line, document.lines[line].index("elapsed)"))
+        self.assertEqual("argument", resolution.kind)
+        self.assertEqual("distance_fallen",
+                         document.lines[resolution.definition.line].split()[1])
+
+        self.assertIsNone(document.lookup(0, 3))  # (a comment)
+
+    def test_lookup_of_shadowed_names(self):
+        document = Document(":= x 10\n"
+                            ":=λ f |x ^int| → ^int\n"
+                            "   for |x (range 0 3)|—\n"
+                            "      (println x)\n"
+                            "   x\n"
+                            "(println (f x))\n")
+        self.assertEqual(Resolution("x", "loop index", Location(2, 8, 9)),
+                         document.lookup(3, 15))
+        self.assertEqual(Resolution("x", "argument", Location(1, 7, 8)),
+                         document.lookup(4, 3))
+        self.assertEqual(Resolution("x", "argument", Location(1, 7, 8)),
+                         document.lookup(1, 7))
+        self.assertEqual(Resolution("x", "definition", Location(0, 3, 4)),
+                         document.lookup(5, 12))
+        self.assertEqual("function", document.lookup(5, 10).kind)
+        self.assertEqual("function", document.lookup(1, 4).kind)
+
+    def test_big_edits_stay_local(self):
+        forms = (":= total (+ 1 2)\n"
+                 "when (greater? total 2)—\n"
+                 "   (println total)\n")
+        document = Document(forms * 300)
+        first_records = document.forms[:10]
+        last_records = document.forms[-10:]
+        document.edit((450, 12), (450, 13), "3")
+        self.assertEqual(":= total (+ 3 2)\n", document.lines[450])
+        # the forms before and after the edit weren't re-parsed
+        self.assertTrue(all(old is new for old, new in
+                            zip(first_records, document.forms[:10])))
+        self.assertTrue(all(old is new for old, new in
+                            zip(last_records, document.forms[-10:])))
+
+
+if __name__ == "__main__":
+    unittest.main()
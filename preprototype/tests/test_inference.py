@@ -0,0 +1,202 @@
+import sys
+sys.path.insert(0, '..')
+
+import io
+import os
+import unittest
+
+from lexer import lex
+from parser import parse
+from annotator import annotate, resolve, Compilation
+from backend import generate_code
+from driver import compile_program
+from inference import (infer_types, TypeInferenceException, INTEGER, FLOAT,
+                       STRING, BOOLEAN, VOID, list_of, dictionary_of,
+                       function_of)
+
+
+REPOSITORY_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "..", "..")
+
+
+def _typed(source):
+    return list(infer_types(resolve(annotate(parse(lex(source))))))
+
+
+class TypeInferenceTestCase(unittest.TestCase):
+
+    def test_types(self):
+        def_xs, def_dee, defn_halve, loop, print_halved = _typed("""
+:= xs [1 2 3]
+:= dee {"a" 1;}
+:=λ halve |x ^float| → ^float
+   (÷ x 2.)
+for |i xs|—
+   (println (_ dee "a"))
+(println (halve (+ (parse_float (input)) 1.)))
+""")
+        self.assertEqual(VOID, def_xs.inferred_type)
+        self.assertEqual(list_of(INTEGER), def_xs.identifier.inferred_type)
+        self.assertEqual(dictionary_of(STRING, INTEGER),
+                         def_dee.identified.inferred_type)
+        self.assertEqual(function_of([FLOAT], FLOAT),
+                         defn_halve.inferred_type)
+        self.assertEqual(FLOAT, defn_halve.expressions[0].inferred_type)
+
+        index, iterable, print_subscript = loop.children
+        self.assertEqual(INTEGER, index.inferred_type)
+        self.assertEqual(list_of(INTEGER), iterable.inferred_type)
+        self.assertEqual(INTEGER,
+                         print_subscript.arguments[0].inferred_type)
+        self.assertEqual(VOID, print_subscript.inferred_type)
+
+        halved, = print_halved.arguments
+        self.assertEqual(FLOAT, halved.inferred_type)
+        self.assertEqual(
+            [FLOAT, FLOAT],
+            [argument.inferred_type
+             for argument in halved.arguments[0].arguments])
+        self.assertEqual("^[int]", str(list_of(INTEGER)))
+        self.assertEqual("^{str int}", str(dictionary_of(STRING, INTEGER)))
+
+    def test_conditional_types(self):
+        def_b, conditional = _typed("""
+:= b (greater? 2 1)
+if b—
+   "yes"
+   "no"
+""")
+        self.assertEqual(BOOLEAN, def_b.identifier.inferred_type)
+        self.assertEqual(STRING, conditional.inferred_type)
+
+    def test_subscripting_a_non_container(self):
+        with self.assertRaises(TypeInferenceException):
+            _typed(":= n 1\n(println (_ n 0))\n")
+
+    def test_types_choose_code(self):
+        compilation = Compilation()
+        code = generate_code(annotate(parse(lex("""
+:= xs [3 1 2]
+:= dee {"a" 1;}
+_:= xs 0 (_ dee "a")
+_:= dee "b" (length xs)
+(println xs)
+(print (_ xs 2))
+""")), compilation), compilation)
+        main = code[code.index("fn main()"):]
+        self.assertIn("xs[0isize as usize] = dee[\"a\"];", main)
+        self.assertIn("dee.insert(\"b\", length(&xs));", main)
+        self.assertIn("println_container(&xs);", main)
+        self.assertIn("print(xs[2isize as usize]);", main)
+        self.assertNotIn("&mut", main)
+
+    def test_types_choose_operators(self):
+        compilation = Compilation()
+        code = generate_code(annotate(parse(lex("""
+:= n 2
+:= x 1.5
+(println (+ n 1 (⋅ n n)))
+(println (− x 0.5 (÷ x 3.)))
+(println (& (≠ n 0) (greater? (÷ 10 n) 1) (∨ (= n 2) (less? x 0.))))
+""")), compilation), compilation)
+        main = code[code.index("fn main()"):]
+        self.assertIn("println((n + 1isize + (n * n)));", main)
+        self.assertIn("println((x - 0.5f64 - (x / 3.0f64)));", main)
+        self.assertIn("println(((n != 0isize) && ((10isize / n) > 1isize) "
+                      "&& ((n == 2isize) || (x < 0.0f64))));", main)
+
+    def test_accumulators_use_native_operators(self):
+        compilation = Compilation()
+        code = generate_code(annotate(parse(lex("""
+:= total 0
+:= product 1.
+for |x (range 1 5)|—
+   := total (+ total x)
+   := product (⋅ product 2.)
+(println total)
+(println product)
+""")), compilation), compilation)
+        main = code[code.index("fn main()"):]
+        self.assertIn("total = (total + x);", main)
+        self.assertIn("product = (product * 2.0f64);", main)
+        self.assertNotIn("add(", main)
+        self.assertNotIn("multiply(", main)
+
+    def test_ranges_iterated_natively(self):
+        compilation = Compilation()
+        code = generate_code(annotate(parse(lex("""
+:= n 10
+:= evens (step_range 0 n 2)
+for |i (range 0 n)|—
+   for |j (reverse_range i (+ i 3))|—
+      for |k (step_range 0 j 2)|—
+         (println k)
+for |e evens|—
+   (println e)
+""")), compilation), compilation)
+        main = code[code.index("fn main()"):]
+        self.assertIn("for i in 0isize..n {", main)
+        self.assertIn("for j in (i..(i + 3isize)).rev() {", main)
+        self.assertIn("for k in (0isize..j).step_by(2isize as usize) {",
+                      main)
+        # (a range that's been given a name is a list like any other)
+        self.assertIn("let mut evens = step_range(0isize, n, 2isize);", main)
+        self.assertIn("for &e in evens.iter() {", main)
+
+    def test_named_builtin_lists_borrowed(self):
+        compilation = Compilation()
+        code = generate_code(annotate(parse(lex("""
+:= r (range 0 3)
+:= evens (step_range 0 10 2)
+(println_container r)
+(println (length evens))
+(append! r 3)
+""")), compilation), compilation)
+        main = code[code.index("fn main()"):]
+        self.assertIn("println_container(&r);", main)
+        self.assertIn("println(length(&evens));", main)
+        self.assertIn("append(&mut r, 3isize);", main)
+
+    def test_strings_borrowed_out_of_lists(self):
+        compilation = Compilation()
+        code = generate_code(annotate(parse(lex("""
+:= ls (lines)
+:= words ["a" "b"]
+for |l ls|—
+   (println l)
+(println (_ words 1))
+""")), compilation), compilation)
+        main = code[code.index("fn main()"):]
+        self.assertIn("for l in strs(&ls) {", main)
+        self.assertIn("println(str_of(&words[1isize as usize]));", main)
+
+    def test_file_lines_iterated_natively(self):
+        compilation = Compilation()
+        code = generate_code(annotate(parse(lex("""
+:= log (map_file "log.txt")
+:=λ bytes_in |file ^file| → ^int
+   (mapped_size file)
+for |line (file_lines "words.txt")|—
+   (println line)
+for |line (mapped_lines log)|—
+   (println (bytes_in log))
+""")), compilation), compilation)
+        self.assertIn("fn bytes_in(file: &MappedFile) -> isize {", code)
+        main = code[code.index("fn main()"):]
+        self.assertIn("for line in map_file(\"words.txt\").lines() {", main)
+        self.assertIn("for line in log.lines() {", main)
+        self.assertIn("for line in log.lines() { println(bytes_in(&log)); }",
+                      main)
+
+    def test_bubblesort_subscripts_natively(self):
+        out = io.StringIO()
+        compile_program(os.path.join(REPOSITORY_ROOT, "eg",
+                                     "bubblesort.gltrl"),
+                        emit='rust', use_cache=False, out=out)
+        code = out.getvalue()
+        self.assertIn("this_list[i as usize]", code)
+        self.assertNotIn("get_subscript", code)
+
+
+if __name__ == "__main__":
+    unittest.main()
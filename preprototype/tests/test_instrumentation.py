@@ -0,0 +1,76 @@
+import sys
+sys.path.insert(0, '..')
+
+import io
+import json
+import os
+import pstats
+import tempfile
+import time
+import unittest
+
+from driver import compile_to_rust
+from instrumentation import Instruments, count_nodes
+from lexer import lex
+from parser import parse
+
+
+REPOSITORY_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "..", "..")
+
+def dawdling(items, seconds):
+    for item in items:
+        time.sleep(seconds)
+        yield item
+
+
+class InstrumentsTestCase(unittest.TestCase):
+
+    def test_lazy_stages_are_charged_their_own_time(self):
+        with Instruments() as instruments:
+            upstream = instruments.stage('upstream',
+                                         dawdling(range(5), 0.01))
+            downstream = instruments.stage('downstream',
+                                           dawdling(upstream, 0.03))
+            self.assertEqual(list(range(5)), list(downstream))
+        phases = instruments.report()['phases']
+        # If time were attributed to whoever called `next` first,
+        # "downstream" would get 0.2 seconds and "upstream" none.
+        self.assertAlmostEqual(0.05, phases['upstream']['wall_seconds'],
+                               delta=0.04)
+        self.assertAlmostEqual(0.15, phases['downstream']['wall_seconds'],
+                               delta=0.04)
+        self.assertEqual({'upstream': 5, 'downstream': 5},
+                         instruments.report()['counts'])
+
+    def test_compilation_report(self):
+        with open(os.path.join(REPOSITORY_ROOT, "eg",
+                               "bubblesort.gltrl")) as source_file:
+            source = source_file.read()
+        with Instruments(trace_memory=True,
+                         profile_phase='parse') as instruments:
+            compile_to_rust(io.StringIO(source), io.StringIO(), instruments)
+        report = json.loads(instruments.json_report())
+
+        self.assertEqual(['lex', 'parse', 'annotate', 'generate', 'emit'],
+                         [phase for phase in report['phases']
+                          if not phase.startswith('(')])
+        for record in report['phases'].values():
+            self.assertGreater(record['peak_traced_bytes'], 0)
+        self.assertEqual(len(list(lex(source))), report['counts']['tokens'])
+        forms = list(parse(lex(source)))
+        self.assertEqual(len(forms), report['counts']['forms'])
+        self.assertEqual(sum(count_nodes(form)['nodes'] for form in forms),
+                         report['counts']['nodes'])
+
+        with tempfile.TemporaryDirectory() as scratch:
+            profile_path = os.path.join(scratch, "parse.prof")
+            instruments.dump_profile(profile_path)
+            profiled = {function_name for (_, _, function_name)
+                        in pstats.Stats(profile_path).stats}
+        self.assertIn('parse_expression', profiled)
+        self.assertNotIn('propogate_environments', profiled)
+
+
+if __name__ == "__main__":
+    unittest.main()
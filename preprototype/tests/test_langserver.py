@@ -0,0 +1,120 @@
+import sys
+sys.path.insert(0, '..')
+
+import io
+import os
+import subprocess
+import unittest
+
+from langserver import (LanguageServer, read_message, write_message,
+                        utf16_column, character_column, METHOD_NOT_FOUND)
+
+
+COMPILER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "..", "glitteralc")
+URI = "file:///tmp/example.gltrl"
+
+
+def _framed(*messages):
+    stream = io.BytesIO()
+    for message in messages:
+        write_message(stream, dict(message, jsonrpc="2.0"))
+    return stream.getvalue()
+
+def _unframed(output):
+    stream = io.BytesIO(output)
+    messages = []
+    while True:
+        message = read_message(stream)
+        if message is None:
+            return messages
+        messages.append(message)
+
+def _position(line, character):
+    return {'line': line, 'character': character}
+
+
+class LanguageServerTestCase(unittest.TestCase):
+
+    def _converse(self, *messages):
+        out = io.BytesIO()
+        server = LanguageServer(io.BytesIO(_framed(*messages)), out)
+        return server.serve(), _unframed(out.getvalue())
+
+    def test_utf16_columns(self):
+        text = ":= 𝔵 (λ x)\n"  # (𝔵 is two UTF-16 code units)
+        self.assertEqual(3, utf16_column(text, 3))
+        self.assertEqual(6, utf16_column(text, 5))
+        self.assertEqual(5, character_column(text, 6))
+        self.assertEqual(len(text), character_column(text, 100))
+
+    def test_conversation(self):
+        exit_code, responses = self._converse(
+            {'id': 1, 'method': "initialize", 'params': {}},
+            {'method': "initialized", 'params': {}},
+            {'method': "textDocument/didOpen", 'params': {'textDocument': {
+                'uri': URI, 'languageId': "glitteral", 'version': 1,
+                'text': ":= a 1\n(println b)\n"}}},
+            {'method': "textDocument/didChange", 'params': {
+                'textDocument': {'uri': URI, 'version': 2},
+                'contentChanges': [{
+                    'range': {'start': _position(1, 9),
+                              'end': _position(1, 10)},
+                    'text': "a"}]}},
+            {'id': 2, 'method': "textDocument/definition", 'params': {
+                'textDocument': {'uri': URI},
+                'position': _position(1, 9)}},
+            {'id': 3, 'method': "textDocument/hover", 'params': {
+                'textDocument': {'uri': URI},
+                'position': _position(1, 3)}},
+            {'id': 4, 'method': "textDocument/rename", 'params': {}},
+            {'method': "textDocument/didClose", 'params': {
+                'textDocument': {'uri': URI}}},
+            {'id': 5, 'method': "shutdown"},
+            {'method': "exit"},
+        )
+        self.assertEqual(0, exit_code)
+        (initialized, opened, changed, definition, hover, rename, closed,
+         shut_down) = responses
+
+        self.assertEqual(
+            2, initialized['result']['capabilities']['textDocumentSync'][
+                'change'])
+        self.assertEqual(
+            [{'range': {'start': _position(1, 9), 'end': _position(1, 10)},
+              'severity': 1, 'source': "glitteral",
+              'message': "b is not defined"}],
+            opened['params']['diagnostics'])
+        self.assertEqual([], changed['params']['diagnostics'])
+        self.assertEqual(
+            {'uri': URI,
+             'range': {'start': _position(0, 3), 'end': _position(0, 4)}},
+            definition['result'])
+        self.assertEqual("println (builtin)",
+                         hover['result']['contents']['value'])
+        self.assertEqual(METHOD_NOT_FOUND, rename['error']['code'])
+        self.assertEqual([], closed['params']['diagnostics'])
+        self.assertEqual(5, shut_down['id'])
+
+    def test_exit_without_shutdown_is_unsuccessful(self):
+        exit_code, _ = self._converse(
+            {'id': 1, 'method': "initialize", 'params': {}},
+            {'method': "exit"})
+        self.assertEqual(1, exit_code)
+
+    def test_glitteralc_language_server(self):
+        completed = subprocess.run(
+            [sys.executable, COMPILER, "--language-server"],
+            input=_framed(
+                {'id': 1, 'method': "initialize", 'params': {}},
+                {'id': 2, 'method': "shutdown"},
+                {'method': "exit"}),
+            stdout=subprocess.PIPE, timeout=60)
+        self.assertEqual(0, completed.returncode)
+        self.assertEqual([1, 2],
+                         [response['id']
+                          for response in _unframed(completed.stdout)])
+
+
+if __name__ == "__main__":
+    unittest.main()
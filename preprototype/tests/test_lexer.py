@@ -1,6 +1,8 @@
 import sys
 sys.path.append('..')
 
+import glob
+import os
 import unittest
 
 from lexer import *  # I know
@@ -87,6 +89,7 @@ class LexerTestCase(unittest.TestCase):
     def test_recognize_type_specifier(self):
         self.assertEqual(Lexer().tokenize("^int"), [IntegerSpecifer("^int")])
         self.assertEqual(Lexer().tokenize("^str"), [StringSpecifier("^str")])
+        self.assertEqual(Lexer().tokenize("^file"), [FileSpecifier("^file")])
         self.assertEqual(Lexer().tokenize("^[int]"),
                          [IntegerListSpecifier("^[int]")])
         self.assertEqual(Lexer().tokenize("^[str]"),
@@ -236,5 +239,100 @@ if (= indent "{} spaces")—
                 with self.assertRaises(IndentationException):
                     list(lex(source))
 
+class StreamingTestCase(unittest.TestCase):
+
+    def test_lex_lazily_from_lines(self):
+        def lines():
+            yield ":= a 1\n"
+            yield "(println a)\n"
+            raise AssertionError("read further than necessary")
+
+        tokenstream = lex(lines())
+        self.assertEqual(Def(":="), tokenstream.pop())
+        self.assertEqual(Identifier("a"), tokenstream.pop())
+        self.assertEqual(IntegerLiteral("1"), tokenstream.pop())
+
+    def test_lines_and_string_lex_alike(self):
+        source = """(function_whose
+   arguments_are
+      spread)
+if (= a 1)—
+   (attack! c)
+"""
+        self.assertEqual(Lexer().tokenize(source),
+                         list(Lexer().stream(source.splitlines(True))))
+
+
+class CompactTokenTestCase(unittest.TestCase):
+
+    def test_tokens_are_spans_of_their_line(self):
+        tokens = list(lex("(println 12345)\n"))
+        number = tokens[2]
+        self.assertEqual(IntegerLiteral("12345"), number)
+        self.assertEqual("(println 12345)\n", number.source)
+        self.assertEqual((9, 14), (number.start, number.end))
+
+    def test_tokens_have_no_dict(self):
+        for token in lex(":= a […]—\n   1\n# commentary\n(f a ^int)\n"):
+            self.assertFalse(hasattr(token, '__dict__'), token)
+        self.assertFalse(hasattr(Indent(), '__dict__'))
+        self.assertFalse(hasattr(IntegerSpecifer("^int"), '__dict__'))
+
+
+class MasterRecognizerTestCase(unittest.TestCase):
+
+    REPOSITORY_ROOT = os.path.join(os.path.dirname(__file__), "..", "..")
+
+    @staticmethod
+    def _reference_tokenization(source):
+        reference_lexer = BaseLexer(TOKENCLASSES)
+        try:
+            return reference_lexer.tokenize(source)
+        except TokenizingException as e:
+            return e.__class__
+
+    @staticmethod
+    def _master_regex_tokenization(source):
+        try:
+            return Lexer().tokenize(source)
+        except TokenizingException as e:
+            return e.__class__
+
+    def test_spellings_agree_with_recognizers(self):
+        for spellings in (RESERVED_WORDS, SCALAR_TYPE_SPECIFIERS,
+                          SEQUENTIAL_TYPE_SPECIFIERS, PUNCTUATION):
+            for spelling, tokenclass in spellings.items():
+                with self.subTest(spelling=spelling):
+                    self.assertEqual(tokenclass(spelling),
+                                     tokenclass.match(spelling))
+
+    def test_agrees_with_reference_lexer_on_examples(self):
+        source_paths = (
+            glob.glob(os.path.join(self.REPOSITORY_ROOT, "eg", "*.gltrl")) +
+            glob.glob(os.path.join(self.REPOSITORY_ROOT,
+                                   "preprototype", "*.gltrl"))
+        )
+        self.assertTrue(source_paths)
+        for source_path in source_paths:
+            with open(source_path) as source_file:
+                source = source_file.read()
+            with self.subTest(source_path=os.path.basename(source_path)):
+                self.assertEqual(self._reference_tokenization(source),
+                                 self._master_regex_tokenization(source))
+
+    def test_agrees_with_reference_lexer_on_edge_cases(self):
+        edge_cases = [
+            ":=λ", ":=λx", "Truthy", "if(", "for|i", "-5", "1.5.3", "12.x",
+            ".x", "1..", "^", "^intx", "^[int]x", "^[in]", '"never closed',
+            '"broken\nstring"', "# just commentary", "foo █ bar",
+            "a\tb", "(a\n\tb)", "\n    x", "\n   \n   x",
+            "x\n      y\n z", "\n\n\n  ",
+        ]
+        for source in edge_cases:
+            with self.subTest(source=source):
+                self.assertEqual(self._reference_tokenization(source),
+                                 self._master_regex_tokenization(source))
+
+
 if __name__ == "__main__":
     unittest.main()
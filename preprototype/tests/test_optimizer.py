@@ -0,0 +1,262 @@
+import sys
+sys.path.insert(0, '..')
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from lexer import lex
+from parser import parse
+from annotator import annotate, Compilation
+from backend import generate_code
+from driver import compile_program
+
+
+REPOSITORY_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "..", "..")
+
+
+def _main(source, optimization_level):
+    compilation = Compilation(optimization_level)
+    code = generate_code(annotate(parse(lex(source)), compilation),
+                         compilation)
+    return code[code.index("fn main()"):]
+
+
+class ConstantFoldingTestCase(unittest.TestCase):
+
+    def test_arithmetic_comparisons_and_logic(self):
+        main = _main("""
+(println (+ (⋅ 2 3) 4))
+(println (÷ (− 0 7) 2))
+(println (÷ 1. 4.))
+(println (& (greater? 2 1) (∨ Falsity (= 3 3))))
+""", 1)
+        self.assertIn("println(10isize);", main)
+        # (truncating toward zero, like Rust)
+        self.assertIn("println(-3isize);", main)
+        self.assertIn("println(0.25f64);", main)
+        self.assertIn("println(true);", main)
+
+    def test_variadic_and_short_circuiting(self):
+        main = _main("""
+(println (− 100 1 2 3))
+(println (∨ (= 1 1) (greater? (input) 0)))
+(println (& (greater? (parse_float (input)) 0.) Falsity))
+""", 1)
+        self.assertIn("println(94isize);", main)
+        self.assertIn("println(true);", main)
+        # (the input has to be read, whatever it is)
+        self.assertIn("println(((parse_float(input()) > 0.0f64) && false));",
+                      main)
+
+    def test_nothing_folded_unoptimized(self):
+        main = _main("(println (+ (⋅ 2 3) 4))\n", 0)
+        self.assertIn("println(((2isize * 3isize) + 4isize));", main)
+
+    def test_what_would_panic_is_left_to_panic(self):
+        main = _main("""
+(println (⋅ 9223372036854775807 2))
+(println (÷ 1 0))
+""", 2)
+        self.assertIn("(9223372036854775807isize * 2isize)", main)
+        self.assertIn("(1isize / 0isize)", main)
+
+    def test_constant_definitions_propagate(self):
+        with open(os.path.join(REPOSITORY_ROOT, "eg",
+                               "fallsim.gltrl")) as source_file:
+            main = _main(source_file.read(), 1)
+        self.assertIn("let mut time_to_terminal_velocity = {!r}f64;".format(
+            54. / 9.807), main)
+        # `speed` could be either of its definitions by the time it's
+        # printed
+        self.assertIn("print(speed);", main)
+
+    def test_redefinitions_in_loops_and_branches_dont_propagate(self):
+        main = _main("""
+:= n 3
+while (≠ n 1)—
+   := n 1
+:= x 1
+if (greater? n 0)—
+   := x 2
+   := x 3
+(println x)
+(println (+ x 1))
+""", 2)
+        self.assertIn("while (n != 1isize) {", main)
+        self.assertIn("println(x);", main)
+        self.assertIn("println((x + 1isize));", main)
+
+
+class PureFunctionEvaluationTestCase(unittest.TestCase):
+
+    FACTORIAL = """
+:=λ factorial |n ^int| → ^int
+   if (less? n 2)—
+      1
+      (⋅ n (factorial (− n 1)))
+
+:=λ shout |n ^int| → ^int
+   (println n)
+   n
+
+(println (factorial 20))
+(println (shout 2))
+(println (factorial 21))
+"""
+
+    def test_pure_calls_evaluated(self):
+        main = _main(self.FACTORIAL, 2)
+        self.assertIn("println(2432902008176640000isize);", main)
+        self.assertIn("println(shout(2isize));", main)
+        # (overflows, so it's left to panic at runtime)
+        self.assertIn("println(factorial(21isize));", main)
+
+    def test_pure_calls_only_evaluated_at_level_two(self):
+        main = _main(self.FACTORIAL, 1)
+        self.assertIn("println(factorial(20isize));", main)
+
+    def test_deep_recursion_doesnt_recurse(self):
+        main = _main("""
+:=λ triangle |n ^int| → ^int
+   if (= n 0)—
+      0
+      (+ n (triangle (− n 1)))
+
+(println (triangle 1000))
+(println (triangle 1000000))
+""", 2)
+        self.assertIn("println(500500isize);", main)
+        # (over budget)
+        self.assertIn("println(triangle(1000000isize));", main)
+
+
+class ReservationTestCase(unittest.TestCase):
+
+    APPENDING = """
+:= xs []
+:= ys [1]
+:= n 5
+for |i (range 0 n)|—
+   (append! xs i)
+   (append! xs (⋅ i i))
+   if (greater? i 2)—
+      (append! ys i)
+for |x xs|—
+   := zs []
+   (append! zs x)
+   (append! ys x)
+while (less? (length ys) 10)—
+   (append! ys 0)
+"""
+
+    def test_appending_loops_reserve(self):
+        main = _main(self.APPENDING, 1)
+        self.assertIn("{ let _gltrl_autoidentifier_1 = 0isize..5isize; "
+                      "xs.reserve(2 * _gltrl_autoidentifier_1.len()); "
+                      "for i in _gltrl_autoidentifier_1 {", main)
+        # (neither the list made in the loop nor the one that's only
+        # appended to conditionally gets room made in it)
+        self.assertIn("{ let _gltrl_autoidentifier_2 = xs.iter(); "
+                      "ys.reserve(_gltrl_autoidentifier_2.len()); "
+                      "for &x in _gltrl_autoidentifier_2 {", main)
+        self.assertEqual(2, main.count(".reserve("))
+
+    @unittest.skipUnless(shutil.which("rustc"), "needs rustc")
+    def test_reserving_programs_behave_the_same(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            outputs = []
+            for level in (0, 1):
+                source_path = os.path.join(scratch,
+                                           "appending{}.gltrl".format(level))
+                with open(source_path, 'w') as source_file:
+                    source_file.write(self.APPENDING + "(println xs)\n"
+                                      "(println ys)\n")
+                self.assertEqual(0, compile_program(
+                    source_path, use_cache=False,
+                    optimization_level=level))
+                outputs.append(subprocess.check_output(source_path[:-6]))
+        self.assertEqual(b"[0, 0, 1, 1, 2, 4, 3, 9, 4, 16]\n"
+                         b"[1, 3, 4, 0, 0, 1, 1, 2, 4, 3, 9, 4, 16]\n",
+                         outputs[0])
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_nothing_reserved_unoptimized(self):
+        main = _main(self.APPENDING, 0)
+        self.assertIn("for i in 0isize..n {", main)
+        self.assertNotIn(".reserve(", main)
+
+    def test_comprehensions_always_reserve(self):
+        main = _main("""
+:= squares (comprehend [] [i (range 0 10)] (⋅ i i))
+(println (comprehend [0] [s squares] (+ s 1)))
+(println (comprehend [] [line (lines)] line))
+""", 0)
+        self.assertIn("let mut squares = { let mut _gltrl_autoidentifier_1 = "
+                      "vec![]; { let _gltrl_autoidentifier_2 = "
+                      "0isize..10isize; _gltrl_autoidentifier_1.reserve("
+                      "_gltrl_autoidentifier_2.len()); for i in "
+                      "_gltrl_autoidentifier_2 { append(&mut "
+                      "_gltrl_autoidentifier_1, (i * i)); } } "
+                      "_gltrl_autoidentifier_1 };", main)
+        self.assertIn("_gltrl_autoidentifier_3 = vec![0isize]; { let "
+                      "_gltrl_autoidentifier_4 = squares.iter(); "
+                      "_gltrl_autoidentifier_3.reserve(", main)
+        # (there's no knowing how many lines there'll be)
+        self.assertEqual(2, main.count(".reserve("))
+
+
+@unittest.skipUnless(shutil.which("rustc"), "needs rustc")
+class OptimizedOutputTestCase(unittest.TestCase):
+
+    PROGRAM = """
+:= acceleration 9.807
+:= terminal_velocity 54.
+:= time_to_terminal_velocity (÷ terminal_velocity acceleration)
+
+:=λ modulo |a ^int n ^int| → ^int
+   := quotient (÷ a n)
+   (− a (⋅ quotient n))
+
+:=λ fibonacci |n ^int| → ^int
+   if (less? n 2)—
+      n
+      (+ (fibonacci (− n 1)) (fibonacci (− n 2)))
+
+(println time_to_terminal_velocity)
+(println (modulo (− 0 17) 5))
+(println (fibonacci 20))
+:= i 0
+while (less? i 3)—
+   (println (+ i (⋅ 2 (fibonacci 10))))
+   := i (+ i 1)
+(println (& (greater? (fibonacci 10) 50) (∨ Falsity (= (modulo 10 4) 2))))
+(println (+ 1 2 3 (− 100 1 2 3)))
+:= d 0
+(println (& (≠ d 0) (greater? (÷ 10 d) 1)))
+"""
+
+    def test_optimized_programs_behave_the_same(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            outputs = []
+            for level in (0, 1, 2):
+                source_path = os.path.join(scratch,
+                                           "constants{}.gltrl".format(level))
+                with open(source_path, 'w') as source_file:
+                    source_file.write(self.PROGRAM)
+                self.assertEqual(0, compile_program(
+                    source_path, use_cache=False,
+                    optimization_level=level))
+                outputs.append(subprocess.check_output(source_path[:-6]))
+        unoptimized, *optimized = outputs
+        self.assertEqual(b"5.506271030896299\n-2\n6765\n110\n111\n112\n"
+                         b"true\n100\nfalse\n", unoptimized)
+        for output in optimized:
+            self.assertEqual(unoptimized, output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import sys
+sys.path.insert(0, '..')
+
+import io
+import os
+import unittest
+
+from lexer import lex, TokenizingException
+from parser import parse
+from driver import compile_program
+from parallel import chunk_boundaries, parse_in_parallel
+
+from test_incremental import _shape
+
+
+REPOSITORY_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "..", "..")
+
+FORMS = """:= total (+ 1 2)
+when (greater? total 2)—
+   (println total)
+# a comment, flush left
+for |i (range 0 3)|—
+   (print i)
+"""
+
+
+class ParallelFrontendTestCase(unittest.TestCase):
+
+    def assertParsesTheSame(self, source, chunk_size=200):
+        expected = [_shape(form) for form in parse(lex(source))]
+        self.assertEqual(
+            expected, [_shape(form) for form in
+                       parse_in_parallel(source, jobs=2,
+                                         chunk_size=chunk_size)])
+
+    def test_chunks_are_cut_at_candidate_form_starts(self):
+        source = FORMS * 20
+        boundaries = chunk_boundaries(source, 200)
+        self.assertEqual(0, boundaries[0])
+        self.assertEqual(len(source), boundaries[-1])
+        self.assertGreater(len(boundaries), 10)
+        for boundary in boundaries[1:-1]:
+            self.assertEqual("\n", source[boundary - 1])
+            self.assertIn(source[boundary], ":wf")
+
+    def test_same_forms_as_sequential_parsing(self):
+        self.assertParsesTheSame(FORMS * 50)
+        with open(os.path.join(REPOSITORY_ROOT, "eg",
+                               "fallsim.gltrl")) as source_file:
+            self.assertParsesTheSame(source_file.read(), chunk_size=10)
+
+    def test_flush_left_continuation_lines(self):
+        # (where a chunk might be cut in the middle of a form)
+        self.assertParsesTheSame(
+            (FORMS + ":= sum (+ 1\n2\n3)\n(println sum)\n") * 30)
+        self.assertParsesTheSame(
+            (FORMS + ":= total [1 2\n3]\n") * 30, chunk_size=5)
+
+    def test_same_errors_as_sequential_parsing(self):
+        source = FORMS * 30 + ":= total $\n" + FORMS * 30
+        with self.assertRaises(TokenizingException) as sequential:
+            list(parse(lex(source)))
+        with self.assertRaises(TokenizingException) as parallel:
+            list(parse_in_parallel(source, jobs=2, chunk_size=200))
+        self.assertEqual(str(sequential.exception),
+                         str(parallel.exception))
+
+    def test_compile_with_frontend_jobs(self):
+        source_path = os.path.join(REPOSITORY_ROOT, "eg", "bubblesort.gltrl")
+        expected, parallel = io.StringIO(), io.StringIO()
+        compile_program(source_path, emit='rust', use_cache=False,
+                        out=expected)
+        compile_program(source_path, emit='rust', use_cache=False,
+                        out=parallel, frontend_jobs=2)
+        self.assertEqual(expected.getvalue(), parallel.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import sys
+sys.path.insert(0, '..')
+
+import io
+import os
+import tempfile
+import threading
+import unittest
+
+from driver import compile_program
+from client import request_compilation
+from server import CompileServer
+
+
+REPOSITORY_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "..", "..")
+
+
+class CompileServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scratch = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.scratch.name, "glitteral.sock")
+        self.server = CompileServer(self.socket_path)
+        self.serving = threading.Thread(target=self.server.serve_forever)
+        self.serving.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.serving.join()
+        self.server.server_close()
+        self.scratch.cleanup()
+
+    def _request(self, source_path, **options):
+        request = {'source_path': source_path, 'emit': 'rust',
+                   'use_cache': False,
+                   'cache_directory': os.path.join(self.scratch.name, "cache"),
+                   'cache_size_limit': 1024}
+        request.update(options)
+        out, err = io.StringIO(), io.StringIO()
+        exit_code = request_compilation(request, out, err,
+                                        socket_path=self.socket_path)
+        return exit_code, out.getvalue(), err.getvalue()
+
+    def test_server_output_matches_in_process_output(self):
+        source_path = os.path.join(REPOSITORY_ROOT, "eg", "fizzbuzz.gltrl")
+        in_process = io.StringIO()
+        self.assertEqual(
+            0, compile_program(source_path, emit='rust', use_cache=False,
+                               out=in_process))
+        exit_code, served, _ = self._request(source_path)
+        self.assertEqual(0, exit_code)
+        self.assertEqual(in_process.getvalue(), served)
+
+    def test_server_reports_failure(self):
+        exit_code, out, _ = self._request("not_glitteral.py")
+        self.assertEqual(1, exit_code)
+        self.assertIn(".gltrl extension", out)
+
+        exit_code, _, err = self._request(
+            os.path.join(self.scratch.name, "nonexistent.gltrl"))
+        self.assertEqual(1, exit_code)
+        self.assertIn("FileNotFoundError", err)
+
+    def test_server_refuses_to_share_its_socket(self):
+        with self.assertRaises(OSError):
+            CompileServer(self.socket_path)
+
+    def test_no_server_means_no_answer(self):
+        out, err = io.StringIO(), io.StringIO()
+        self.assertIsNone(request_compilation(
+            {}, out, err,
+            socket_path=os.path.join(self.scratch.name, "nobody_home.sock")))
+        self.assertEqual("", out.getvalue() + err.getvalue())
+
+    def test_stale_server_steps_aside(self):
+        self.server.fingerprint = [("lexer.py", 0)]
+        exit_code, out, err = self._request(
+            os.path.join(REPOSITORY_ROOT, "eg", "fizzbuzz.gltrl"))
+        self.assertIsNone(exit_code)
+        self.assertEqual("", out + err)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import sys
+sys.path.insert(0, '..')
+
+import os
+import subprocess
+import tempfile
+import unittest
+
+
+GLITTERALC = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "..", "glitteralc")
+
+# Run glitteralc and report its peak resident set size, as seen from
+# inside the process itself. (The parent's view of its children's
+# `ru_maxrss` isn't good enough, because a child forked from a large
+# parent—such as a test runner that has been at it a while—inherits the
+# parent's high-water mark, even across `exec`.)
+MEASURING_HARNESS = """
+import os, runpy, sys
+sys.argv = sys.argv[1:]
+sys.path.insert(0, os.path.dirname(sys.argv[0]))
+try:
+    runpy.run_path(sys.argv[0], run_name='__main__')
+except SystemExit:
+    pass
+with open('/proc/self/status') as status:
+    for line in status:
+        if line.startswith('VmHWM:'):
+            sys.stderr.write(line.split()[1])
+"""
+
+# a top-level form or four, to be repeated until we have a big program
+SYNTHETIC_FORMS = """:= total (+ 1 2)
+when (greater? total 2)—
+   (println total)
+for |i (range 0 3)|—
+   (print i)
+"""
+
+
+class StreamingCompilationTestCase(unittest.TestCase):
+    # The peak resident set size shouldn't grow with the program at all:
+    # we compile two programs, one several times the size of the other,
+    # and check that the bigger one doesn't take more memory (give or
+    # take a little allocator noise). Even one node kept alive per
+    # top-level form would show up as megabytes of growth at these
+    # sizes. Set GLITTERAL_STREAMING_TEST_MEGABYTES=8,64 (say) for the
+    # full-sized experience; the default keeps the test suite quick.
+    SOURCE_MEGABYTES = tuple(float(megabytes) for megabytes in
+                             os.environ.get(
+                                 'GLITTERAL_STREAMING_TEST_MEGABYTES',
+                                 "0.125,1").split(','))
+    RSS_CEILING_KILOBYTES = 32 * 1024  # (as VmHWM reports)
+    RSS_GROWTH_ALLOWANCE_KILOBYTES = 2 * 1024
+
+    def peak_rss_compiling(self, megabytes):
+        with tempfile.TemporaryDirectory() as scratch:
+            source_path = os.path.join(scratch, "synthetic.gltrl")
+            repetitions = int(megabytes * 1024 * 1024 /
+                              len(SYNTHETIC_FORMS.encode('utf8')))
+            with open(source_path, 'w') as source_file:
+                for _ in range(repetitions):
+                    source_file.write(SYNTHETIC_FORMS)
+
+            with open(os.devnull, 'w') as nowhere:
+                measurement = subprocess.run(
+                    [sys.executable, '-c', MEASURING_HARNESS,
+                     GLITTERALC, source_path, '--just-rust', '--no-server'],
+                    stdout=nowhere, stderr=subprocess.PIPE, check=True)
+        return int(measurement.stderr)
+
+    @unittest.skipUnless(os.path.exists('/proc/self/status'),
+                         "needs Linux's /proc to measure memory")
+    def test_memory_is_bounded_by_form_not_program_size(self):
+        smaller, bigger = (self.peak_rss_compiling(megabytes)
+                           for megabytes in sorted(self.SOURCE_MEGABYTES))
+        self.assertLess(bigger - smaller,
+                        self.RSS_GROWTH_ALLOWANCE_KILOBYTES)
+        self.assertLess(bigger, self.RSS_CEILING_KILOBYTES)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -30,6 +30,16 @@ class RegexOptTestCase(unittest.TestCase):
         for this_should_match in alternatives:
             self.assertTrue(our_regex.match(this_should_match))
 
+    def test_regex_opt_factors_common_prefixes(self):
+        our_regex = regex_opt(":=", ":=λ", "_:=")
+        self.assertEqual("(?::=(?:λ)?|_:=)", our_regex.pattern)
+        self.assertEqual(":=λ", our_regex.match(":=λ").group())
+
+    def test_regex_opt_escapes_alternatives(self):
+        our_regex = regex_opt("^[int]", "^[str]")
+        self.assertTrue(our_regex.fullmatch("^[int]"))
+        self.assertIsNone(our_regex.match("^i"))
+
 
 class PrefixesTestCase(unittest.TestCase):
 
@@ -40,5 +50,28 @@ class PrefixesTestCase(unittest.TestCase):
             self.assertEqual(prefixes(word), prees)
 
 
+class DispatchTableTestCase(unittest.TestCase):
+
+    def test_nearest_ancestors_handler(self):
+        class Animal: ...
+        class Pony(Animal): ...
+        class Pegasus(Pony): ...
+        class Unicorn(Pony): ...
+        class Alicorn(Pegasus, Unicorn): ...
+
+        table = DispatchTable("greeting")
+        table.register(Animal)(lambda: "hello")
+        table.register(Unicorn)(lambda: "hello, unicorn")
+        self.assertEqual("hello", table[Pegasus]())
+        self.assertEqual("hello, unicorn", table[Alicorn]())
+        with self.assertRaises(KeyError):
+            table[int]
+
+        # registering more handlers supersedes what's been looked up
+        table.register(Pegasus)(lambda: "hello, pegasus")
+        self.assertEqual("hello, pegasus", table[Alicorn]())
+        self.assertEqual("hello, unicorn", table[Unicorn]())
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -4,6 +4,8 @@ import logging
 import os
 import re
 
+from types import GeneratorType
+
 class LookaheadStream:
     def __init__(self, generator):
         self.lookahead = None
@@ -28,10 +30,111 @@ class LookaheadStream:
     def pop(self):
         return next(self)
 
+def trampoline(begin, request):
+    """Carry out a recursive computation without recursing.
+
+    `begin(request)` returns either the finished result for `request` or
+    a generator that yields further requests, gets sent back each one's
+    result, and (eventually) returns its own; the generators waiting on
+    results are kept on a list of our own rather than on Python's stack,
+    so the computation can go as deep as memory allows, whatever
+    `sys.getrecursionlimit()` says.
+    """
+    waiting = []
+    outcome = begin(request)
+    while True:
+        if type(outcome) is GeneratorType:
+            waiting.append(outcome)
+            result = None
+        elif not waiting:
+            return outcome
+        else:
+            result = outcome
+        try:
+            request = waiting[-1].send(result)
+        except StopIteration as finished:
+            waiting.pop()
+            outcome = finished.value
+            continue
+        # (outside of the `try`, lest a `StopIteration` from `begin` be
+        # mistaken for a generator's having finished)
+        outcome = begin(request)
+
+class DispatchTable:
+    """Handlers keyed by type, where a type without a handler of its own
+    gets the handler of the nearest of its ancestors (in method
+    resolution order) that has one. Each type's handler is only worked
+    out the first time it's asked for, so that after that, dispatching
+    is one dictionary lookup, however many kinds of thing there are to
+    tell apart."""
+
+    def __init__(self, name):
+        self.name = name
+        self.handlers = {}
+        self.resolved = {}
+
+    def register(self, *types):
+        """Decorator registering the decorated function as the handler
+        for `types`."""
+        def registration(handler):
+            for type_ in types:
+                self.handlers[type_] = handler
+            # (any type's handler could be different now)
+            self.resolved.clear()
+            return handler
+        return registration
+
+    def __getitem__(self, type_):
+        try:
+            return self.resolved[type_]
+        except KeyError:
+            pass
+        for ancestor in type_.__mro__:
+            if ancestor in self.handlers:
+                handler = self.resolved[type_] = self.handlers[ancestor]
+                return handler
+        raise KeyError("no {} for {}".format(self.name, type_.__name__))
+
+class Slotted(type):
+    """Metaclass for class hierarchies whose instances should all go
+    without a `__dict__` (for there are going to be a lot of them):
+    any class that doesn't declare its own `__slots__` gets empty ones,
+    so that a subclass that adds no attributes (of which the token and
+    AST hierarchies have dozens) doesn't need to say so."""
+
+    def __new__(metaclass, name, bases, namespace):
+        namespace.setdefault('__slots__', ())
+        return super().__new__(metaclass, name, bases, namespace)
+
+def _regex_opt_pattern(words):
+    # Like the namesake Emacs `regexp-opt`, factor common prefixes out
+    # of the alternatives (so that ":=" and ":=λ" become `:=(?:λ)?`
+    # rather than a flat alternation that the regex engine has to try
+    # one branch at a time). A side benefit is that the resulting
+    # pattern prefers the longest alternative, because an alternative
+    # that is a prefix of another turns into a greedy optional suffix.
+    if '' in words:
+        rest = words - {''}
+        return "(?:{})?".format(_regex_opt_pattern(rest)) if rest else ''
+    if len(words) == 1:
+        return re.escape(next(iter(words)))
+    common = os.path.commonprefix(list(words))
+    if common:
+        return re.escape(common) + _regex_opt_pattern(
+            {word[len(common):] for word in words})
+    if all(len(word) == 1 for word in words):
+        return "[{}]".format(''.join(re.escape(word)
+                                     for word in sorted(words)))
+    by_initial = itertools.groupby(sorted(words), key=lambda word: word[0])
+    return "(?:{})".format('|'.join(
+        re.escape(initial) + _regex_opt_pattern(
+            {word[1:] for word in group})
+        for initial, group in by_initial
+    ))
+
 def regex_opt(*alternatives):
-    # TODO: try to be more efficient than `'|'.join`, the way that the
-    # namesake Emacs `regexp-opt` does
-    return re.compile(r'|'.join(r"(?:{})".format(a) for a in alternatives))
+    """Compile a regex matching any of the given literal strings."""
+    return re.compile(_regex_opt_pattern(set(alternatives)))
 
 def prefixes(word):
     return [word[:i] for i in range(len(word)+1)]
@@ -18,6 +18,9 @@ def clean():
     # clean generated Rust
     print("cleaning generated Rust ...")
     run("rm -f preprototype/__*_compiled.rs eg/__*_compiled.rs")
+    # clean cached ASTs
+    print("cleaning cached ASTs ...")
+    run("rm -f preprototype/__*.gltrlc eg/__*.gltrlc")
     # clean compiled executables
     print("cleaning executables ...")
     run("rm -f preprototype/demo")
@@ -35,6 +38,19 @@ def test():
     print("running output tests ...")
     run("cd eg/tests; python3 -m unittest")
 
+@task
+def server():
+    # compile requests from `compile` (and everyone else) will go here
+    # for as long as it's running
+    run("bin/glitteralc --server")
+
+@task
+def bench(quick=False, compare=None):
+    print("running benchmarks ...")
+    run("python3 benchmarks/run.py {} {}".format(
+        "--quick" if quick else '',
+        "--compare {}".format(compare) if compare else ''))
+
 @task
 def demo(ir=False):
     compile("preprototype/demo.gltrl", ir=ir)
@@ -43,9 +59,9 @@ def demo(ir=False):
 def eg(example, ir=False):
     if example == "all":
         print("compiling all demos ...")
-        for example_name in examplestream():
-            print("compiling {} ...".format(example_name))
-            compile("eg/{}.gltrl".format(example_name), ir=ir)
+        # (all at once, so that their rustcs can run side by side)
+        run("bin/glitteralc eg/ {}".format("--just-rust" if ir else ''),
+            pty=True)
     else:
         print("compiling {} ...".format(example))
         compile("eg/{}.gltrl".format(example), ir=ir)